@@ -7,14 +7,16 @@
     :copyright: © 2018 Pit.AI
     :license: GPLv3, see LICENSE for more details.
 """
+import copy
 import json
 import logging
 import os
 import sys
+import threading
+import types
 from getpass import getpass
 from pathlib import Path
 
-import requests
 import rlp
 import web3
 from eth_account import Account
@@ -22,34 +24,31 @@ from eth_account.internal.transactions import serializable_unsigned_transaction_
 from eth_keyfile import create_keyfile_json
 from ledgerblue.commException import CommException
 from web3 import Web3
-from web3.gas_strategies.time_based import fast_gas_price_strategy
 from web3.middleware import geth_poa_middleware
-from web3.providers import HTTPProvider
 
+from . import config
+from .batch import batch_call, RPC_BATCH_SIZE
+from .gas import get_gas_price_oracle
+from .http import PooledHTTPProvider
+from .key_cache import DecryptedKeyCache
 from .ledger import LedgerWallet
+from .nonce import get_nonce_manager
+from .registry import get_contract_abi, get_contract_registry
+from .transaction import PendingTransaction
+from .remote_config import CDN_ROOT, LazyConfigMapping, RemoteConfig
 
 IU_PRECISION = 1e6
-CDN_ROOT = 'https://config.devisefoundation.org/config.json'
-resp = requests.get(CDN_ROOT)
-resp_json = resp.json()
-CONTRACT_ADDRESSES = resp_json["CONTRACT_ADDRESSES"]
-NETWORK_TO_NODE = resp_json["NETWORK_TO_NODE"]
+REMOTE_CONFIG = RemoteConfig(CDN_ROOT)
+CONTRACT_ADDRESSES = LazyConfigMapping(REMOTE_CONFIG, "CONTRACT_ADDRESSES")
+NETWORK_TO_NODE = LazyConfigMapping(REMOTE_CONFIG, "NETWORK_TO_NODE")
+NODE_TO_NETWORK = LazyConfigMapping(REMOTE_CONFIG, "NETWORK_TO_NODE",
+                                    lambda network_to_node: {url: network for network, url in network_to_node.items()})
 
-NODE_TO_NETWORK = {NETWORK_TO_NODE[network]: network for network in NETWORK_TO_NODE.keys()}
+# Web3 instances shared by all the clients connected to the same node
+_WEB3_INSTANCES = {}
+_WEB3_LOCK = threading.Lock()
 
-network = os.environ.get("ETHEREUM_NETWORK", "mainnet")
-API_ROOT = resp_json["API_ROOT_URL"].get(network.upper(), 'https://api.devisechain.io')
-
-
-def get_contract_abi(contract_name):
-    """
-    Reads the json abi files for the contract specified
-    :param contract_name:
-    :return:
-    """
-    current_dir = os.path.dirname(os.path.realpath(__file__))
-    abi_path = os.path.join(current_dir, 'abi', contract_name + '.json')
-    return json.load(open(abi_path, 'r'))
+logger = logging.getLogger(__name__)
 
 
 def costs_gas(function):
@@ -75,11 +74,37 @@ def get_default_node_url(network=None):
     return node_url
 
 
+def get_network_for_node(node_url, network_to_node=None):
+    """
+    Get the name of the blockchain network a node url is known to connect to
+    :param node_url: the url of an Ethereum node
+    :param network_to_node: the mapping of network names to node urls, defaults to the Devise configuration
+    :return: the upper case network name, or "CUSTOM" if the node is not one of our known nodes
+    """
+    for network, url in (NETWORK_TO_NODE if network_to_node is None else network_to_node).items():
+        if url == node_url:
+            return network
+    return "CUSTOM"
+
+
+def get_api_root(network=None):
+    """
+    Get the root url of the Pit.AI API for the blockchain network specified
+    :param network: one of the supported Ethereum test networks (mainnet, rinkeby, dev1, dev2, ganache)
+    """
+    if network is None:
+        network = os.environ.get("ETHEREUM_NETWORK", "mainnet")
+
+    return REMOTE_CONFIG.get("API_ROOT_URL", {}).get(network.upper(), 'https://api.devisechain.io')
+
+
 def get_rental_contract_addresses(network_id="1"):
     """
     Get a list of all the rental proxy addresses we've ever deployed for audit purposes
     """
-    contract_addresses = CONTRACT_ADDRESSES.get(network_id, {}).get('DEVISE_RENTAL_PREVIOUS_ADDRESSES', [])
+    contract_addresses = list(CONTRACT_ADDRESSES.get(network_id, {}).get('DEVISE_RENTAL_PREVIOUS_ADDRESSES', []))
+    if not contract_addresses and REMOTE_CONFIG.static:
+        logger.warning("Using the static Devise configuration, the events of previous rental contracts may be missing")
     contract_addresses += [CONTRACT_ADDRESSES.get(network_id, {}).get('DEVISE_RENTAL')]
 
     return contract_addresses
@@ -90,7 +115,7 @@ def get_events_node_url(network_id="1"):
     Get any custom node required to query events from the block chain (for example Infura has issues querying too far
      in the past)
     """
-    events_nodes = resp_json.get('EVENT_QUERY_NODES', {})
+    events_nodes = REMOTE_CONFIG.get('EVENT_QUERY_NODES', {})
     return events_nodes.get(network_id)
 
 
@@ -129,7 +154,7 @@ def generate_account():
 
 class BaseEthereumClient(object):
     def __init__(self, key_file=None, private_key=None, account='0x0000000000000000000000000000000000000000',
-                 password=None, auth_type=None, node_url=None):
+                 password=None, auth_type=None, node_url=None, key_cache_ttl=None, async_transactions=False):
         """
         Devise constructor
         :param key_file: An encrypted json keystore file, requires a password to decrypt
@@ -142,6 +167,12 @@ class BaseEthereumClient(object):
                 Note: the software option will attempt the locate the account specified in the local Ethereum Wallet
                 path for the current user.
         :param node_url: An Ethereum node to connect to
+        :param key_cache_ttl: If specified, the number of seconds to keep the private key decrypted from key_file in
+                memory, so that consecutive transactions and signed API requests only decrypt the key file once.
+                The cached key is wiped after key_cache_ttl seconds or when lock() is called, but the copies made
+                while signing remain in memory until they are garbage collected (see DecryptedKeyCache).
+        :param async_transactions: If True, methods sending transactions return a PendingTransaction handle as soon as
+                the transaction is submitted instead of blocking until it is mined.
         """
         assert key_file or private_key or account, "Please specify one of: account, key_file or private_key!"
         assert not (key_file and private_key), "Please specify either key_file or private_key, not both!"
@@ -154,15 +185,18 @@ class BaseEthereumClient(object):
 
         # Initialize credentials for transaction and message signing
         self._init_credentials(key_file, private_key, account, password, auth_type)
+        self._key_cache = DecryptedKeyCache(key_cache_ttl) if key_cache_ttl else None
+        self.async_transactions = async_transactions
 
         # Connect to node url
         if node_url is None:
             node_url = get_default_node_url()
-        provider = self._get_provider(node_url)
-        self.w3 = Web3(provider)
+        self.w3 = self._get_web3(node_url)
         self._network_id = self._get_network_id()
 
-        network = NODE_TO_NETWORK.get(node_url, "CUSTOM")
+        # Only name the network from the static configuration: resolving the Devise configuration just to log this would
+        # defeat its lazy resolution, for example with a custom node url
+        network = "MAINNET" if self._network_id == "1" else get_network_for_node(node_url, config.NETWORK_TO_NODE)
         if network == "MAINNET":
             self.logger.info("!!!!!! WARNING: CONNECTED TO THE MAIN ETHEREUM NETWORK. "
                              "ALL TRANSACTIONS ARE FINAL. !!!!!")
@@ -174,12 +208,14 @@ class BaseEthereumClient(object):
         else:
             self.logger.info("INFO: Connected to the %s Ethereum network." % network)
 
-        # inject the poa compatibility middleware to the innermost layer
-        self.w3.middleware_stack.inject(geth_poa_middleware, layer=0)
+        self._api_root_url = None
 
-        # Automatically determine necessary gas based on 5min to mine avg time
-        self.w3.eth.setGasPriceStrategy(fast_gas_price_strategy)
-        self._api_root = API_ROOT
+    @property
+    def _api_root(self):
+        """The root url of the Pit.AI API, resolved from the Devise configuration on first use"""
+        if self._api_root_url is None:
+            self._api_root_url = get_api_root()
+        return self._api_root_url
 
     def _init_credentials(self, key_file, private_key, account, password, auth_type):
         """
@@ -309,22 +345,10 @@ class BaseEthereumClient(object):
         json_dict = json.load(open(key_file, 'r'))
         return self.w3.toHex(Account.decrypt(json_dict, password))[2:]
 
-    def _get_account_from_key_file(self, key_file):
-        """
-        Gets the clear text address from the keystore file
-        :param key_file: string the path of an encrypted Ethereum key file
-        :return: string the address of the account encrypted into the key_file
+    def _get_signing_key(self):
         """
-        json_dict = json.load(open(key_file, 'r'))
-        return '0x' + json_dict["address"]
-
-    def _wait_for_receipt(self, tx_hash):
-        """Blocks until the transaction receipt is mined"""
-        return self.w3.eth.waitForTransactionReceipt(tx_hash, timeout=60)
-
-    def _transact(self, function_call=None, transaction=None):
-        """Transaction utility: builds a transaction and signs it with private key, or uses native transactions with
-        accounts
+        Returns the private key to sign transactions and messages with, decrypting the key file if needed, or None if
+        signing is done by a hardware wallet
         """
         # If we have no local means to sign transactions, raise error
         if not (self._ledger or self._key_file or self._private_key):
@@ -332,7 +356,9 @@ class BaseEthereumClient(object):
                              "Please specify one of: key_file, private_key, auth_type='ledger' or auth_type='trezor'")
 
         private_key = self._private_key
-        if self._key_file:
+        if self._key_file and not private_key:
+            cached_key = self._key_cache.get() if self._key_cache else None
+            private_key = cached_key
             password = self._password if self._password is not None else ""
             # Try decoding the key file, prompting user for password if needed
             while not private_key:
@@ -343,6 +369,49 @@ class BaseEthereumClient(object):
                         raise ValueError('Invalid password specified for key file %s' % self._key_file)
                     # If no password was specified, we're running interactively, prompt for password
                     password = getpass("Password to decrypt keystore file %s: " % self.account)
+            if self._key_cache and cached_key is None:
+                self._key_cache.set(private_key)
+
+        return private_key
+
+    def lock(self):
+        """Wipes the cached decrypted private key if key_cache_ttl was specified"""
+        if self._key_cache:
+            self._key_cache.lock()
+
+    def _get_account_from_key_file(self, key_file):
+        """
+        Gets the clear text address from the keystore file
+        :param key_file: string the path of an encrypted Ethereum key file
+        :return: string the address of the account encrypted into the key_file
+        """
+        json_dict = json.load(open(key_file, 'r'))
+        return '0x' + json_dict["address"]
+
+    def _wait_for_receipt(self, tx_hash):
+        """Blocks until the transaction receipt is mined"""
+        return self.w3.eth.waitForTransactionReceipt(tx_hash, timeout=60)
+
+    def _transact(self, function_call=None, transaction=None, wait=None):
+        """Transaction utility: builds a transaction and signs it with private key, or uses native transactions with
+        accounts, then waits for the transaction to be mined
+        :param wait: whether to block until the transaction is mined, defaults to not async_transactions
+        :return: True if the transaction succeeded, False otherwise, or a PendingTransaction if not waiting
+        """
+        tx_hash, transaction = self._send_transaction(function_call, transaction)
+        if wait is None:
+            wait = not self.async_transactions
+        if not wait:
+            return PendingTransaction(self, tx_hash, transaction)
+        return self._wait_for_transaction(tx_hash, transaction)
+
+    def _send_transaction(self, function_call=None, transaction=None):
+        """
+        Builds, signs and submits a transaction without waiting for it to be mined. Nonces are handed out locally so
+        that several transactions can be submitted back to back from the same account.
+        :return: a tuple of the transaction hash and the transaction submitted
+        """
+        private_key = self._get_signing_key()
 
         # Build a transaction to sign
         gas_buffer = 100000
@@ -352,15 +421,18 @@ class BaseEthereumClient(object):
 
         auto_gas_price = self.w3.eth.generateGasPrice()
         user_gas_price = transaction.get('gasPrice')
+        user_nonce = transaction.get('nonce')
+        user_gas = transaction.get('gas')
         transaction.update({
-            'nonce': transaction.get("nonce", self.w3.eth.getTransactionCount(self.address)),
             'gas': 4000000,
             'gasPrice': auto_gas_price
         })
         if function_call:
             transaction = function_call.buildTransaction(transaction)
 
-        gas_limit = self.w3.eth.estimateGas(transaction) + gas_buffer
+        # Transactions submitted back to back may depend on pending ones and can't always be estimated, in which case
+        # the caller provides the gas limit
+        gas_limit = user_gas if user_gas is not None else self.w3.eth.estimateGas(transaction) + gas_buffer
         transaction.update({
             'gas': gas_limit,
             'gasPrice': user_gas_price if user_gas_price is not None else auto_gas_price
@@ -368,6 +440,34 @@ class BaseEthereumClient(object):
 
         if 'from' in transaction:
             del transaction['from']
+
+        if user_nonce is not None:
+            return self._sign_and_send(transaction, private_key), transaction
+
+        nonce_manager = get_nonce_manager(self.w3, self.address)
+        transaction['nonce'] = nonce_manager.next_nonce()
+        try:
+            tx_hash = self._sign_and_send(transaction, private_key)
+        except ValueError as e:
+            nonce_manager.resync()
+            if 'nonce' not in str(e).lower():
+                raise
+            # Our local nonce is out of sync with the node (for example after a transaction was sent by another
+            # process), retry once with the node's pending transaction count
+            transaction['nonce'] = nonce_manager.next_nonce()
+            try:
+                tx_hash = self._sign_and_send(transaction, private_key)
+            except Exception:
+                nonce_manager.resync()
+                raise
+        except Exception:
+            nonce_manager.resync()
+            raise
+
+        return tx_hash, transaction
+
+    def _sign_and_send(self, transaction, private_key):
+        """Signs a transaction with the private key or the hardware wallet and sends it as a raw transaction"""
         if private_key:
             # Sign the transaction using the private key and send it as raw transaction
             signed_tx = self.w3.eth.account.signTransaction(transaction, '0x' + private_key)
@@ -381,7 +481,20 @@ class BaseEthereumClient(object):
             encoded_transaction = encode_transaction(unsigned_transaction, vrs=(v, r, s))
             tx_hash = self.w3.eth.sendRawTransaction(encoded_transaction)
 
-        self.logger.info("Submitted transaction %s, waiting for transaction receipt..." % tx_hash.hex())
+        self.logger.info("Submitted transaction %s" % tx_hash.hex())
+        return tx_hash
+
+    def _wait_for_transaction(self, tx_hash, transaction):
+        """
+        Blocks until a submitted transaction is mined
+        :return: True if the transaction succeeded, False otherwise
+        """
+        tx_receipt = self._wait_for_mined_receipt(tx_hash, transaction)
+        return hasattr(tx_receipt, "status") and tx_receipt["status"] == 1
+
+    def _wait_for_mined_receipt(self, tx_hash, transaction):
+        """Blocks until a submitted transaction is mined and returns its receipt"""
+        self.logger.info("Waiting for transaction receipt of %s..." % tx_hash.hex())
         tx_receipt = None
         while not tx_receipt:
             try:
@@ -393,7 +506,15 @@ class BaseEthereumClient(object):
             tx_receipt.get("gasUsed"), self.w3.fromWei(transaction.get("gasPrice"), 'gwei'),
             self.w3.fromWei(tx_receipt.get("gasUsed") * transaction.get("gasPrice"), 'ether')))
 
-        return hasattr(tx_receipt, "status") and tx_receipt["status"] == 1
+        return tx_receipt
+
+    def _wait_for_transactions(self, submitted):
+        """
+        Blocks until all the transactions submitted back to back are mined
+        :param submitted: a list of (tx_hash, transaction) tuples as returned by _send_transaction
+        :return: a list of booleans, True for each transaction that succeeded
+        """
+        return [self._wait_for_transaction(tx_hash, transaction) for tx_hash, transaction in submitted]
 
     def transfer_ether(self, to_address, value):
         """Utility function to transfer ethers to another Ethereum address"""
@@ -404,18 +525,39 @@ class BaseEthereumClient(object):
             "to": Web3.toChecksumAddress(to_address),
             "value": wei_value})
 
+    def _get_web3(self, node_url):
+        """Returns the Web3 instance shared by all the clients connected to node_url"""
+        with _WEB3_LOCK:
+            w3 = _WEB3_INSTANCES.get(node_url)
+            if w3 is None:
+                w3 = Web3(self._get_provider(node_url))
+
+                # inject the poa compatibility middleware to the innermost layer
+                w3.middleware_stack.inject(geth_poa_middleware, layer=0)
+
+                # Automatically determine necessary gas from the gas prices accepted in recent blocks
+                w3.eth.setGasPriceStrategy(get_gas_price_oracle(w3).gas_price_strategy)
+                _WEB3_INSTANCES[node_url] = w3
+
+        return w3
+
     def _get_provider(self, node_url):
         """Given a node url, returns the right Web3 provider"""
         if node_url[:4] in ['wss:', 'ws:/']:
             provider = Web3.WebsocketProvider(node_url)
         else:
-            provider = HTTPProvider(node_url)
+            provider = PooledHTTPProvider(node_url)
 
         return provider
 
 
 class BaseDeviseClient(BaseEthereumClient):
     """Base class for all Devise contract classes"""
+    # The block contract reads are executed against, and the reads memoized by a snapshot (see snapshot())
+    _block_identifier = 'latest'
+    _call_cache = None
+    # Maximum number of calls packed into each JSON-RPC batch by bulk reads
+    rpc_batch_size = RPC_BATCH_SIZE
 
     def __init__(self, *args, **kwargs):
         super(BaseDeviseClient, self).__init__(*args, **kwargs)
@@ -425,20 +567,19 @@ class BaseDeviseClient(BaseEthereumClient):
 
     def _init_contracts(self):
         # contract addresses for the current network (if any)
-        contract_addresses = CONTRACT_ADDRESSES.get(self._get_network_id(), {})
+        contract_addresses = CONTRACT_ADDRESSES.get(self._network_id, {})
+        registry = get_contract_registry(self.w3)
         # The Devise Token
-        self._token_contract = self.w3.eth.contract(address=contract_addresses.get('DEVISE_TOKEN'),
-                                                    abi=get_contract_abi('DeviseToken'))
+        self._token_contract = registry.get_contract(self._network_id, 'DeviseToken',
+                                                     contract_addresses.get('DEVISE_TOKEN'))
         # The Devise Rental Contract
-        rental_abi = get_contract_abi('DeviseRentalImpl')
-        self._rental_contract = self.w3.eth.contract(address=contract_addresses.get('DEVISE_RENTAL'),
-                                                     abi=rental_abi)
-        self._rental_proxy_contract = self.w3.eth.contract(address=contract_addresses.get('DEVISE_RENTAL'),
-                                                           abi=get_contract_abi('DeviseRentalProxy'))
+        self._rental_contract = registry.get_contract(self._network_id, 'DeviseRentalImpl',
+                                                      contract_addresses.get('DEVISE_RENTAL'))
+        self._rental_proxy_contract = registry.get_contract(self._network_id, 'DeviseRentalProxy',
+                                                            contract_addresses.get('DEVISE_RENTAL'))
 
         # The Audit Contract
-        audit_abi = get_contract_abi('AuditImpl')
-        self._audit_contract = self.w3.eth.contract(address=contract_addresses.get('AUDIT'), abi=audit_abi)
+        self._audit_contract = registry.get_contract(self._network_id, 'AuditImpl', contract_addresses.get('AUDIT'))
 
         if self._token_contract.address is None or self._rental_contract.address is None:
             raise RuntimeError(
@@ -449,3 +590,92 @@ class BaseDeviseClient(BaseEthereumClient):
                 "* right after our security audit, at which point our Python package will be fully functional.      *\n"
                 "* Please regularly check this repo for an update.                                                  *\n"
                 "****************************************************************************************************\n")
+
+    def snapshot(self, block_identifier='latest'):
+        """
+        Returns a read only copy of this client with all contract reads pinned to a single block and memoized, for
+        consistent views of many properties without duplicate calls.
+
+        Example Usage:
+            snapshot = client.snapshot()
+            rates = snapshot.eth_usd_rate, snapshot.usd_dvz_rate, snapshot.eth_dvz_rate
+
+        :param block_identifier: the block number or block tag ('latest', 'pending', ...) to pin reads to
+        :return: a client of the same type as this one
+        """
+        snapshot = copy.copy(self)
+        snapshot._block_identifier = self.w3.eth.getBlock(block_identifier)['number']
+        snapshot._call_cache = {}
+        return snapshot
+
+    def _transact(self, function_call=None, transaction=None, wait=None):
+        assert self._call_cache is None, "Snapshots are read only, please send transactions from the client!"
+        return super(BaseDeviseClient, self)._transact(function_call, transaction, wait)
+
+    @property
+    def block_identifier(self):
+        """The block contract reads are executed against"""
+        return self._block_identifier
+
+    def _call_cache_key(self, function_call, transaction):
+        # _encode_transaction_data is private to web3's ContractFunction, this relies on the pinned web3 version (4.2.1)
+        return (function_call.address, function_call._encode_transaction_data(), (transaction or {}).get('from'))
+
+    def _get_balance(self, address):
+        """
+        Returns the ether balance of an address in wei at the client's block, memoized if this client is a snapshot
+        :param address: the account address
+        """
+        if self._call_cache is None:
+            return self.w3.eth.getBalance(address, self._block_identifier)
+
+        key = ('eth_getBalance', address)
+        if key not in self._call_cache:
+            self._call_cache[key] = self.w3.eth.getBalance(address, self._block_identifier)
+        return self._call_cache[key]
+
+    def _call(self, function_call, transaction=None):
+        """
+        Executes a contract read against the client's block, memoizing the result if this client is a snapshot
+        :param function_call: a bound contract function call, e.g. self._rental_contract.functions.getBeneficiary()
+        :param transaction: an optional call transaction dict, e.g. {'from': address}
+        """
+        if self._call_cache is None:
+            return function_call.call(transaction, block_identifier=self._block_identifier)
+
+        key = self._call_cache_key(function_call, transaction)
+        if key not in self._call_cache:
+            self._call_cache[key] = function_call.call(transaction, block_identifier=self._block_identifier)
+        return self._call_cache[key]
+
+    def _batch_call(self, function_calls, transactions=None):
+        """
+        Executes many contract reads against the client's block in JSON-RPC batches, memoizing the results if this
+        client is a snapshot
+        :param function_calls: a list of bound contract function calls
+        :param transactions: an optional list of call transaction dicts, one per function call
+        """
+        transactions = transactions or [None] * len(function_calls)
+        if self._call_cache is None:
+            return batch_call(self.w3, function_calls, transactions, self._block_identifier, self.rpc_batch_size)
+
+        keys = [self._call_cache_key(function_call, transaction)
+                for function_call, transaction in zip(function_calls, transactions)]
+        missing = [idx for idx, key in enumerate(keys) if key not in self._call_cache]
+        if missing:
+            results = batch_call(self.w3, [function_calls[idx] for idx in missing],
+                                 [transactions[idx] for idx in missing], self._block_identifier, self.rpc_batch_size)
+            for idx, result in zip(missing, results):
+                self._call_cache[keys[idx]] = result
+        return [self._call_cache[key] for key in keys]
+
+
+class _BaseModule(types.ModuleType):
+    """Resolves the module attributes which used to be read from the CDN at import time only when accessed"""
+
+    @property
+    def API_ROOT(self):
+        return get_api_root()
+
+
+sys.modules[__name__].__class__ = _BaseModule
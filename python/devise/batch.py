@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+    devise.batch
+    ~~~~~~~~~~~~~~~~~~~~~~~~~
+    Batched JSON-RPC requests. Packs many independent node requests (for example one eth_call per client address)
+    into JSON-RPC batch requests so that they cost a few HTTP round trips instead of one round trip each.
+
+    :copyright: © 2018 Pit.AI
+    :license: GPLv3, see LICENSE for more details.
+"""
+import json
+import os
+
+from eth_abi import decode_abi
+from eth_utils import to_bytes, to_text
+from hexbytes import HexBytes
+from web3.providers import HTTPProvider
+from web3.utils.abi import get_abi_output_types, map_abi_data
+from web3.utils.normalizers import BASE_RETURN_NORMALIZERS
+
+from .http import post_rpc
+
+# Maximum number of requests packed into a single JSON-RPC batch
+RPC_BATCH_SIZE = int(os.environ.get("DEVISE_RPC_BATCH_SIZE", 100))
+
+
+def _get_result(response):
+    """Extracts the result of a single JSON-RPC response, raising ValueError like web3 does on errors"""
+    if response is None:
+        raise ValueError("Missing response in JSON-RPC batch")
+    if "error" in response:
+        raise ValueError(response["error"])
+    return response["result"]
+
+
+def block_identifier_to_param(block_identifier):
+    """Converts a block number or block tag into its JSON-RPC parameter"""
+    if isinstance(block_identifier, int):
+        return hex(block_identifier)
+    return block_identifier
+
+
+def batch_request(w3, rpc_requests, batch_size=None):
+    """
+    Executes a list of JSON-RPC requests in batches and returns their raw results in order
+    :param w3: the Web3 instance whose provider should be used
+    :param rpc_requests: a list of (method, params) tuples
+    :param batch_size: the maximum number of requests per batch, defaults to RPC_BATCH_SIZE
+    :return: a list of raw (unformatted) JSON-RPC results, in the same order as rpc_requests
+    """
+    provider = w3.providers[0]
+    if not isinstance(provider, HTTPProvider):
+        # Other transports don't support batches, fall back to one request at a time
+        return [_get_result(provider.make_request(method, params)) for method, params in rpc_requests]
+
+    batch_size = batch_size or RPC_BATCH_SIZE
+    results = []
+    for start in range(0, len(rpc_requests), batch_size):
+        chunk = rpc_requests[start:start + batch_size]
+        payload = [{"jsonrpc": "2.0", "method": method, "params": params, "id": idx}
+                   for idx, (method, params) in enumerate(chunk)]
+        raw_response = post_rpc(provider, to_bytes(text=json.dumps(payload)))
+        responses = json.loads(to_text(raw_response))
+        if isinstance(responses, dict):
+            # Nodes answer a rejected batch with a single error object
+            raise ValueError(responses.get("error", responses))
+        responses_by_id = {response.get("id"): response for response in responses}
+        results += [_get_result(responses_by_id.get(idx)) for idx in range(len(chunk))]
+
+    return results
+
+
+def batch_call(w3, function_calls, transactions=None, block_identifier='latest', batch_size=None):
+    """
+    Executes contract function calls (eth_call) in batches and decodes their results exactly like
+    ContractFunction.call() does.
+    :param w3: the Web3 instance whose provider should be used
+    :param function_calls: a list of bound contract function calls, e.g. contract.functions.getClientSummary(address)
+    :param transactions: an optional list of call transaction dicts (for example {'from': address}), one per call
+    :param block_identifier: the block number or tag to execute the calls against
+    :param batch_size: the maximum number of calls per batch, defaults to RPC_BATCH_SIZE
+    :return: a list of decoded return values, in the same order as function_calls
+    """
+    block_param = block_identifier_to_param(block_identifier)
+    rpc_requests = []
+    for idx, function_call in enumerate(function_calls):
+        transaction = dict(transactions[idx]) if transactions else {}
+        transaction.update({"to": function_call.address, "data": function_call._encode_transaction_data()})
+        rpc_requests.append(("eth_call", [transaction, block_param]))
+
+    results = []
+    for function_call, return_data in zip(function_calls, batch_request(w3, rpc_requests, batch_size)):
+        output_types = get_abi_output_types(function_call.abi)
+        output_data = decode_abi(output_types, HexBytes(return_data))
+        normalized_data = map_abi_data(BASE_RETURN_NORMALIZERS, output_types, output_data)
+        results.append(normalized_data[0] if len(normalized_data) == 1 else normalized_data)
+
+    return results
@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+"""
+    devise.blocks
+    ~~~~~~~~~~~~~~~~~~~~~~~~~
+    Cache of block timestamps: an in memory LRU on top of a small SQLite store on disk. Block headers missing from
+    the cache are fetched in JSON-RPC batches.
+
+    :copyright: © 2018 Pit.AI
+    :license: GPLv3, see LICENSE for more details.
+"""
+import collections
+import json
+import logging
+import os
+import sqlite3
+import threading
+import weakref
+from datetime import datetime
+
+from .batch import batch_request
+from .remote_config import get_cache_dir
+
+# Number of confirmations after which a block is considered final and its timestamp can be persisted
+FINALITY_DEPTH = 12
+# Number of block timestamps kept in memory
+MEMORY_CACHE_SIZE = 100000
+
+# Block timestamp caches and chain ids by web3 instance, the caches only hold their web3 instance weakly so that they
+# are dropped along with it
+_CACHES = weakref.WeakKeyDictionary()
+_CHAIN_IDS = weakref.WeakKeyDictionary()
+_LOCK = threading.Lock()
+# Contract deployment blocks by "<chain id>:<address>"
+_DEPLOYMENT_BLOCKS = None
+
+logger = logging.getLogger(__name__)
+
+
+def get_chain_id(w3):
+    """Identifies a chain by its network id and genesis block hash, so that caches don't mix up test chains"""
+    chain_id = _CHAIN_IDS.get(w3)
+    if chain_id is None:
+        chain_id = "%s_%s" % (w3.version.network, w3.eth.getBlock(0)['hash'].hex()[2:18])
+        _CHAIN_IDS[w3] = chain_id
+    return chain_id
+
+
+class BlockTimestampCache(object):
+    """
+    Block timestamps by block number. Lookups may provide the block hash (for example from an event log), in which
+    case a cached entry is only used if the hash matches, so results are always correct across chain reorganizations.
+    Lookups without a hash only use entries for blocks that were final when cached.
+    """
+
+    def __init__(self, w3, path=None, memory_size=MEMORY_CACHE_SIZE):
+        """
+        :param w3: the Web3 instance to fetch blocks from
+        :param path: the path of the SQLite store, defaults to a file per chain in the Devise cache directory
+        :param memory_size: the number of block timestamps kept in memory
+        """
+        self._w3 = weakref.ref(w3)
+        self.memory_size = memory_size
+        self._path = path
+        self._memory = collections.OrderedDict()
+        self._db = None
+        self._lock = threading.RLock()
+
+    @property
+    def w3(self):
+        w3 = self._w3()
+        if w3 is None:
+            raise ReferenceError("The web3 instance of this block timestamp cache was garbage collected")
+        return w3
+
+    @property
+    def path(self):
+        if self._path is None:
+            self._path = os.path.join(get_cache_dir(), 'blocks_%s.sqlite' % get_chain_id(self.w3))
+        return self._path
+
+    def _get_db(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS blocks "
+                             "(number INTEGER PRIMARY KEY, hash TEXT NOT NULL, timestamp INTEGER NOT NULL)")
+            self._db.commit()
+        return self._db
+
+    def get_timestamp(self, block_number, block_hash=None):
+        """
+        Returns the timestamp of a block
+        :param block_number: the block number
+        :param block_hash: the block hash as a hex string, if known
+        """
+        return self.get_timestamps([(block_number, block_hash)])[block_number]
+
+    def get_timestamps(self, blocks):
+        """
+        Returns the timestamps of many blocks, fetching all the missing ones in JSON-RPC batches
+        :param blocks: a list of block numbers or (block number, block hash) tuples
+        :return: a dict of block number to timestamp
+        """
+        wanted = {}
+        for block in blocks:
+            block_number, block_hash = block if isinstance(block, tuple) else (block, None)
+            wanted[block_number] = block_hash.lower() if block_hash else wanted.get(block_number)
+
+        with self._lock:
+            timestamps = {}
+            missing = {}
+            for block_number, block_hash in wanted.items():
+                cached = self._memory.get(block_number)
+                if cached is not None and (cached[0] == block_hash if block_hash else cached[2]):
+                    self._memory.move_to_end(block_number)
+                    timestamps[block_number] = cached[1]
+                else:
+                    missing[block_number] = block_hash
+
+            if missing:
+                self._load_from_disk(missing, timestamps)
+            if missing:
+                self._fetch(missing, timestamps)
+
+        return timestamps
+
+    def get_block_at(self, timestamp, low=0, high=None):
+        """
+        Binary searches the first block mined at or after a time. Each probe goes through the cache, so repeated
+        searches are answered from memory.
+        :param timestamp: a unix timestamp
+        :param low: the first block to search from
+        :param high: the last block to search to, defaults to the latest block
+        :return: the first block number between low and high mined at or after timestamp, or high + 1 if none
+        """
+        high = (self.w3.eth.blockNumber if high is None else high) + 1
+        while low < high:
+            middle = (low + high) // 2
+            if self.get_timestamp(middle) >= timestamp:
+                high = middle
+            else:
+                low = middle + 1
+        return low
+
+    def _remember(self, block_number, block_hash, timestamp, final=True):
+        self._memory[block_number] = (block_hash, timestamp, final)
+        self._memory.move_to_end(block_number)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def _load_from_disk(self, missing, timestamps):
+        """Moves the blocks found in the on disk store from missing to timestamps"""
+        db = self._get_db()
+        block_numbers = list(missing.keys())
+        # Stay well under SQLite's limit on the number of query parameters
+        for start in range(0, len(block_numbers), 500):
+            chunk = block_numbers[start:start + 500]
+            rows = db.execute("SELECT number, hash, timestamp FROM blocks WHERE number IN (%s)" %
+                              ",".join("?" * len(chunk)), chunk).fetchall()
+            for block_number, block_hash, timestamp in rows:
+                if missing[block_number] is None or missing[block_number] == block_hash:
+                    self._remember(block_number, block_hash, timestamp)
+                    timestamps[block_number] = timestamp
+                    del missing[block_number]
+
+    def _fetch(self, missing, timestamps):
+        """Fetches the headers of the missing blocks in batches, persisting the timestamps of final blocks"""
+        block_numbers = sorted(missing.keys())
+        headers = batch_request(self.w3, [('eth_getBlockByNumber', [hex(block_number), False])
+                                          for block_number in block_numbers])
+        final_block = self.w3.eth.blockNumber - FINALITY_DEPTH
+        final_rows = []
+        for block_number, header in zip(block_numbers, headers):
+            if header is None:
+                raise ValueError("Block %s not found" % block_number)
+            block_hash = header['hash'].lower()
+            timestamp = int(header['timestamp'], 16)
+            timestamps[block_number] = timestamp
+            if block_number <= final_block:
+                self._remember(block_number, block_hash, timestamp)
+                final_rows.append((block_number, block_hash, timestamp))
+            else:
+                # Not final yet, only use it for lookups by hash
+                self._remember(block_number, block_hash, timestamp, final=False)
+        if final_rows:
+            db = self._get_db()
+            db.executemany("INSERT OR REPLACE INTO blocks (number, hash, timestamp) VALUES (?, ?, ?)", final_rows)
+            db.commit()
+
+
+def to_timestamp(value):
+    """Converts a naive UTC datetime to a unix timestamp, passing numbers and None through"""
+    if isinstance(value, datetime):
+        return int((value - datetime(1970, 1, 1)).total_seconds())
+    return value
+
+
+def get_block_timestamp_cache(w3):
+    """Returns the block timestamp cache shared by every client using the web3 instance w3"""
+    with _LOCK:
+        cache = _CACHES.get(w3)
+        if cache is None:
+            cache = BlockTimestampCache(w3)
+            _CACHES[w3] = cache
+    return cache
+
+
+def _deployment_blocks_path():
+    return os.path.join(get_cache_dir(), 'deployment_blocks.json')
+
+
+def get_deployment_block(w3, address):
+    """
+    Finds the block in which a contract was deployed by binary searching the first block where it has code. Results
+    are cached on disk per chain and address.
+    :param w3: the Web3 instance to query
+    :param address: the contract address, or None for a contract which isn't deployed on this network
+    :return: the deployment block number, or None if it can't be determined (for example from a node which doesn't
+            keep the state of old blocks)
+    """
+    global _DEPLOYMENT_BLOCKS
+    if address is None:
+        return None
+    key = "%s:%s" % (get_chain_id(w3), address.lower())
+    with _LOCK:
+        if _DEPLOYMENT_BLOCKS is None:
+            try:
+                with open(_deployment_blocks_path(), 'r') as cache_file:
+                    _DEPLOYMENT_BLOCKS = json.load(cache_file)
+            except (OSError, ValueError):
+                _DEPLOYMENT_BLOCKS = {}
+        if key in _DEPLOYMENT_BLOCKS:
+            return _DEPLOYMENT_BLOCKS[key]
+
+    try:
+        low, high = 0, w3.eth.blockNumber
+        if len(w3.eth.getCode(address, high)) == 0:
+            logger.warning("%s has no code at block %s, scanning its events from the default block", address, high)
+            return None
+        # Invariant: the contract has code at high and no code before low
+        while low < high:
+            middle = (low + high) // 2
+            if len(w3.eth.getCode(address, middle)) > 0:
+                high = middle
+            else:
+                low = middle + 1
+    except ValueError as e:
+        logger.warning("Could not find the deployment block of %s: %s", address, e)
+        return None
+
+    with _LOCK:
+        _DEPLOYMENT_BLOCKS[key] = high
+        tmp_path = "%s.%s.tmp" % (_deployment_blocks_path(), os.getpid())
+        try:
+            with open(tmp_path, 'w') as cache_file:
+                json.dump(_DEPLOYMENT_BLOCKS, cache_file)
+            os.replace(tmp_path, _deployment_blocks_path())
+        except OSError as e:
+            logger.warning("Could not cache the deployment block of %s: %s", address, e)
+    return high
@@ -9,20 +9,22 @@
     :license: GPLv3, see LICENSE for more details.
 """
 import csv
-import hashlib
 import io
 import os
+import struct
 import uuid
+import zlib
 from collections import OrderedDict
-from getpass import getpass
 from urllib.parse import urlencode
 from zipfile import ZipFile
 
-import requests
 from eth_account.messages import defunct_hash_message
 
 import devise
 from devise.base import BaseDeviseClient
+from devise.download import download
+from devise.file_cache import get_file_cache
+from devise.hashing import hash_file, hash_files
 
 
 def read_in_chunks(file_object, chunk_size=1024):
@@ -33,10 +35,36 @@ def read_in_chunks(file_object, chunk_size=1024):
         yield data
 
 
+def _read_zip_head(head):
+    """
+    Reads the beginning of the first entry of a zip archive from the archive's first bytes
+    :param head: the first bytes of the archive
+    :return: the first decompressed bytes of the entry, or None if they can't be read from head
+    """
+    if len(head) < 30 or head[:4] != b'PK\x03\x04':
+        return None
+    flags, method = struct.unpack('<HH', head[6:10])
+    name_length, extra_length = struct.unpack('<HH', head[26:30])
+    data = head[30 + name_length + extra_length:]
+    if flags & 1:
+        # Encrypted
+        return None
+    if method == 0:
+        return data
+    if method == 8:
+        try:
+            return zlib.decompressobj(-zlib.MAX_WBITS).decompress(data)
+        except zlib.error:
+            return None
+    return None
+
+
 class RentalAPI(BaseDeviseClient):
     """
     Base class for all API related functions
     """
+    # Number of byte ranges of a file downloaded concurrently, when the server supports range requests
+    download_segments = 1
 
     def get_signed_api_url(self, api_uri, params=None):
         """
@@ -59,15 +87,7 @@ class RentalAPI(BaseDeviseClient):
         query_string = urlencode(OrderedDict(sorted(params.items(), key=lambda t: t[0])))
         payload = (api_uri + '?' + query_string).lower()
 
-        # If we have no local means to sign transactions, raise error
-        if not (self._ledger or self._key_file or self._private_key):
-            raise ValueError("No valid signing method found!\n"
-                             "Please specify one of: key_file, private_key, auth_type='ledger' or auth_type='trezor'")
-
-        private_key = self._private_key
-        if self._key_file:
-            password = self._password or getpass("Password to decrypt keystore file %s: " % self.account)
-            private_key = self._get_private_key(self._key_file, password)
+        private_key = self._get_signing_key()
 
         # Calculate signature
         if private_key:
@@ -79,17 +99,17 @@ class RentalAPI(BaseDeviseClient):
 
         return api_uri + "?" + urlencode(OrderedDict(sorted(params.items(), key=lambda t: t[0])))
 
-    def _download(self, url, local_file_name):
-        """Downloads the URL specified as the local file name specified"""
-        req = requests.get(url,
-                           headers={'User-Agent': 'DevisePythonWrapper/{version}'.format(version=devise.__version__)})
-        if req.status_code != 200:
-            raise Exception("Unable to download (%s): %s" % (req.status_code, req.text))
-
-        with open(local_file_name, 'wb') as out_file:
-            for chunk in req.iter_content(chunk_size=1024):
-                if chunk:  # filter out keep-alive new chunks
-                    out_file.write(chunk)
+    def _download(self, url, local_file_name, resumable=True):
+        """
+        Downloads the URL specified as the local file name specified. The file is downloaded to local_file_name.part
+        first, interrupted transfers are resumed, and it is renamed to local_file_name once complete. Files are
+        downloaded in download_segments concurrent byte ranges if it is greater than 1. Pass resumable=False for a
+        local_file_name no later call will reuse, so that a failed download doesn't leave its partial file behind.
+        :return: a DownloadResult with the SHA1 and first bytes of the file
+        """
+        return download(url, local_file_name,
+                        headers={'User-Agent': 'DevisePythonWrapper/{version}'.format(version=devise.__version__)},
+                        segments=self.download_segments, resumable=resumable)
 
     def _get_latest_weights_date_from_contents(self, latest_weights_file):
         """Gets the last available date from the latest weights file"""
@@ -98,13 +118,28 @@ class RentalAPI(BaseDeviseClient):
                 csv_reader = csv.DictReader(io.TextIOWrapper(csvfile))
                 return next(csv_reader).get('date', '')
 
+    def _get_latest_weights_date(self, latest_weights_file, head=None):
+        """
+        Gets the last available date from the latest weights file, read from its first bytes when possible
+        :param latest_weights_file: the path of the latest weights file
+        :param head: the first bytes of the file, as returned by _download
+        """
+        data = _read_zip_head(head) if head is not None else None
+        if data is not None:
+            # Only use the first row if it was received whole
+            lines = data.split(b'\n')
+            if len(lines) > 2:
+                csv_reader = csv.DictReader(io.StringIO(b'\n'.join(lines[:2]).decode('utf-8')))
+                return next(csv_reader).get('date', '')
+        return self._get_latest_weights_date_from_contents(latest_weights_file)
+
     def download_latest_weights(self):
         """Downloads the last weights available for for each lepton in the blockchain"""
         api_url = self._api_root + self.get_signed_api_url('/v1/devisechain/latest_weights')
         self.logger.info("Downloading %s", api_url)
         unique_filename = uuid.uuid4().hex
-        self._download(api_url, unique_filename)
-        content_date = self._get_latest_weights_date_from_contents(unique_filename)
+        result = self._download(api_url, unique_filename, resumable=False)
+        content_date = self._get_latest_weights_date(unique_filename, result.head)
         file_name = 'devise_latest_weights_{content_date}.zip'.format(content_date=content_date)
         os.rename(unique_filename, file_name)
         return file_name
@@ -115,23 +150,50 @@ class RentalAPI(BaseDeviseClient):
         :param hash: the hash used to retrieve a weights file
         :return: the file name with the content date as suffix
         """
+        file_cache = get_file_cache()
+        # The first bytes of the file are only known when it isn't cached yet
+        result = self._fetch_file_by_hash(file_cache, hash)
         unique_filename = self.download_file_by_hash(hash)
-        content_date = self._get_latest_weights_date_from_contents(unique_filename)
+        content_date = self._get_latest_weights_date(unique_filename, result.head if result is not None else None)
         file_name = 'weights_by_hash_{content_date}.zip'.format(content_date=content_date)
-        os.rename(unique_filename, file_name)
+        os.replace(unique_filename, file_name)
         return file_name
 
-    def download_file_by_hash(self, hash):
+    def download_file_by_hash(self, hash, file_name=None):
         """
-        Download a file the content hash of which matches the hash
+        Download a file the content hash of which matches the hash. Files are kept in a local cache so that they are
+        only downloaded once, and copied from it.
         :param hash: the hash used to retrieve a file
-        :return: the temp file name
+        :param file_name: the destination path, defaults to a new unique file name in the current directory
+        :return: the file name
+        """
+        file_name = file_name or uuid.uuid4().hex
+        file_cache = get_file_cache()
+        while not file_cache.copy_to(hash, file_name):
+            self._fetch_file_by_hash(file_cache, hash)
+        return file_name
+
+    def _fetch_file_by_hash(self, file_cache, hash):
         """
+        Downloads the file the content hash of which matches the hash into the file cache, unless it's cached
+        :return: the DownloadResult of the download, or None if the file was cached
+        """
+        if file_cache.contains(hash):
+            return None
         api_url = self._api_root + self.get_signed_api_url('/v1/devisechain/hashes/' + hash)
         self.logger.info("Downloading %s", api_url)
-        unique_filename = uuid.uuid4().hex
-        self._download(api_url, unique_filename)
-        return unique_filename
+        tmp_path = file_cache.temp_path()
+        try:
+            result = self._download(api_url, tmp_path, resumable=False)
+            if result.sha1 != hash.lower():
+                raise ValueError("Downloaded file hash %s doesn't match the requested hash %s" % (result.sha1, hash))
+            file_cache.insert(hash, tmp_path)
+            return result
+        finally:
+            # The download's partial files are removed too, a temporary name is never resumed
+            for path in (tmp_path, tmp_path + '.part', tmp_path + '.part.json'):
+                if os.path.exists(path):
+                    os.unlink(path)
 
     def _get_sha1_for_file(self, file_name):
         """
@@ -139,13 +201,7 @@ class RentalAPI(BaseDeviseClient):
         :param file_name: The path of file to be hashed
         :return: the SHA1 hash of the content of file
         """
-        sha1 = hashlib.sha1()
-        f = open(file_name, 'rb')
-        for piece in read_in_chunks(f):
-            sha1.update(piece)
-        sha1_hash = sha1.hexdigest()
-        f.close()
-        return sha1_hash
+        return hash_file(file_name, 'sha1')
 
     def get_hash_for_file(self, file_name):
         """
@@ -155,6 +211,14 @@ class RentalAPI(BaseDeviseClient):
         """
         return self._get_sha1_for_file(file_name)
 
+    def get_hashes_for_files(self, file_names):
+        """
+        Calculate the hashes of many files concurrently
+        :param file_names: The paths of the files to be hashed
+        :return: the SHA1 hashes of the content of the files, in the same order
+        """
+        return hash_files(file_names, 'sha1')
+
     def download_historical_weights(self):
         """Downloads a historical archive with all the weights calculated for each lepton in the blockchain
          excluding recent weights"""
@@ -8,23 +8,84 @@
     :copyright: © 2018 Pit.AI
     :license: GPLv3, see LICENSE for more details.
 """
-from datetime import datetime
-
 from web3 import Web3
 
-from devise.base import costs_gas, generate_account, BaseDeviseClient, get_contract_abi, get_rental_contract_addresses, \
+from devise.base import costs_gas, generate_account, BaseDeviseClient, get_rental_contract_addresses, \
     get_events_node_url
+from devise.blocks import FINALITY_DEPTH, get_block_timestamp_cache, get_chain_id, get_deployment_block, \
+    to_timestamp
+from devise.events import EventDecoder, EventRecord
+from devise.registry import get_event_abis
+from devise.scanner import BlockRangeScanner
+from devise.subscription import EventSubscription
 from .token import TOKEN_PRECISION
 
 IU_PRECISION = 1e6
 ETHER_PRECISION = int(1e18)
 USD_PRECISION = int(1e8)
 
+# Names to output event arguments as, by event name and argument name
+EVENT_ARG_KEY_FORMATTERS = {
+    'LeptonAdded': {
+        's': 'lepton_hash',
+        'iu': 'incremental_usefulness'
+    },
+    'BeneficiaryChanged': {
+        'addr': 'client_address',
+        'ben': 'beneficiary_address'
+    },
+    'AuctionPriceSet': {
+        'prc': 'price_per_bit'
+    }
+}
+
+# Formatters of event argument values, by event name and argument name
+EVENT_ARG_VALUE_FORMATTERS = {
+    'RateUpdated': {
+        'rate': lambda rate: "$ %f" % (rate / USD_PRECISION),
+    },
+    'LeptonAdded': {
+        'iu': lambda iu: iu / IU_PRECISION
+    },
+    'AuctionPriceSet': {
+        'prc': lambda price: price / TOKEN_PRECISION
+    }
+}
+
+_EVENT_DECODERS = {}
+_MISSING = object()
+
+
+def _get_event_decoder(contract_name, event_abi):
+    """Returns the decoder of an event, compiled on first use"""
+    key = (contract_name, event_abi['name'])
+    decoder = _EVENT_DECODERS.get(key)
+    if decoder is None:
+        decoder = EventDecoder(event_abi, EVENT_ARG_KEY_FORMATTERS.get(event_abi['name']),
+                               EVENT_ARG_VALUE_FORMATTERS.get(event_abi['name']))
+        _EVENT_DECODERS[key] = decoder
+    return decoder
+
+
+def _match_event_args(event_args, argument_filters):
+    """Returns True if formatted event arguments have one of the accepted values of every argument filtered"""
+    return all(event_args.get(name, _MISSING) in values for name, values in argument_filters.items())
+
 
 class RentalContract(BaseDeviseClient):
     """
 
     """
+    # Number of block ranges scanned in parallel when querying events
+    event_scan_workers = 1
+
+    def __init__(self, *args, event_store=None, **kwargs):
+        """
+        :param event_store: an optional devise.event_store.EventStore in which the events from final blocks are kept,
+                so that get_events only fetches the blocks mined since the previous query
+        """
+        super(RentalContract, self).__init__(*args, **kwargs)
+        self.event_store = event_store
 
     def _has_sufficient_funds(self, client_address, num_seats, limit_price):
         """
@@ -34,8 +95,8 @@ class RentalContract(BaseDeviseClient):
         :param limit_price: the client's max price
         :return: True if token balance is sufficient, False otherwise
         """
-        current_balance = self._rental_contract.functions.getAllowance().call(
-            {'from': client_address}) / TOKEN_PRECISION
+        current_balance = self._call(self._rental_contract.functions.getAllowance(),
+                                     {'from': client_address}) / TOKEN_PRECISION
         return limit_price * self.total_incremental_usefulness * num_seats <= current_balance
 
     def get_client_address(self, address):
@@ -44,31 +105,32 @@ class RentalContract(BaseDeviseClient):
         :param address: The client address corresponding to this address
         :return: address of the money account corresponding to the beneficiary address specified
         """
-        client_address = self._rental_contract.functions.getClientForBeneficiary().call({"from": address})
+        client_address = self._call(self._rental_contract.functions.getClientForBeneficiary(), {"from": address})
         if client_address != "0x0000000000000000000000000000000000000000":
             return client_address
 
     @property
     def dvz_balance(self):
         """Queries the DeviseToken contract for the token balance of the current account"""
-        return self._token_contract.functions.balanceOf(self.address).call({'from': self.address}) / TOKEN_PRECISION
+        balance = self._call(self._token_contract.functions.balanceOf(self.address), {'from': self.address})
+        return balance / TOKEN_PRECISION
 
     @property
     def eth_balance(self):
-        return self.w3.eth.getBalance(self.address) / ETHER_PRECISION
+        return self._get_balance(self.address) / ETHER_PRECISION
 
     @property
     def dvz_balance_escrow(self):
         """Queries the Devise rental contract for the number of tokens provisioned into the rental contract for this account"""
-        return self._rental_contract.functions.getAllowance().call({'from': self.address}) / TOKEN_PRECISION
+        return self._call(self._rental_contract.functions.getAllowance(), {'from': self.address}) / TOKEN_PRECISION
 
     @property
     def eth_usd_rate(self):
-        return self._rental_contract.functions.rateETHUSD().call() / USD_PRECISION
+        return self._call(self._rental_contract.functions.rateETHUSD()) / USD_PRECISION
 
     @property
     def usd_dvz_rate(self):
-        return self._rental_contract.functions.RATE_USD_DVZ().call()
+        return self._call(self._rental_contract.functions.RATE_USD_DVZ())
 
     @property
     def eth_dvz_rate(self):
@@ -76,15 +138,15 @@ class RentalContract(BaseDeviseClient):
 
     @property
     def rent_per_seat_current_term(self):
-        return self._rental_contract.functions.getRentPerSeatCurrentTerm().call() / TOKEN_PRECISION
+        return self._call(self._rental_contract.functions.getRentPerSeatCurrentTerm()) / TOKEN_PRECISION
 
     @property
     def indicative_rent_per_seat_next_term(self):
-        return self._rental_contract.functions.getIndicativeRentPerSeatNextTerm().call() / TOKEN_PRECISION
+        return self._call(self._rental_contract.functions.getIndicativeRentPerSeatNextTerm()) / TOKEN_PRECISION
 
     @property
     def current_lease_term(self):
-        lease_term_idx = self._rental_contract.functions.getCurrentLeaseTerm().call()
+        lease_term_idx = self._call(self._rental_contract.functions.getCurrentLeaseTerm())
         return self._lease_term_to_date_str(lease_term_idx)
 
     def _lease_term_to_date_str(self, lease_term_idx):
@@ -101,27 +163,27 @@ class RentalContract(BaseDeviseClient):
 
     @property
     def price_per_bit_current_term(self):
-        return self._rental_contract.functions.getPricePerBitCurrentTerm().call() / TOKEN_PRECISION
+        return self._call(self._rental_contract.functions.getPricePerBitCurrentTerm()) / TOKEN_PRECISION
 
     @property
     def indicative_price_per_bit_next_term(self):
-        return self._rental_contract.functions.getIndicativePricePerBitNextTerm().call() / TOKEN_PRECISION
+        return self._call(self._rental_contract.functions.getIndicativePricePerBitNextTerm()) / TOKEN_PRECISION
 
     @property
     def is_power_user(self):
-        return self._rental_contract.functions.isPowerUser().call({'from': self.address})
+        return self._call(self._rental_contract.functions.isPowerUser(), {'from': self.address})
 
     @property
     def beneficiary(self):
-        return self._rental_contract.functions.getBeneficiary().call({'from': self.address})
+        return self._call(self._rental_contract.functions.getBeneficiary(), {'from': self.address})
 
     @property
     def total_incremental_usefulness(self):
-        return self._rental_contract.functions.getTotalIncrementalUsefulness().call() / IU_PRECISION
+        return self._call(self._rental_contract.functions.getTotalIncrementalUsefulness()) / IU_PRECISION
 
     @property
     def seats_available(self):
-        return self._rental_contract.functions.getSeatsAvailable().call()
+        return self._call(self._rental_contract.functions.getSeatsAvailable())
 
     @property
     def current_term_seats(self):
@@ -131,7 +193,7 @@ class RentalContract(BaseDeviseClient):
         client_address = self.get_client_address(self.address)
         if client_address is None:
             return 0
-        return self._rental_contract.functions.getCurrentTermSeats().call({'from': client_address})
+        return self._call(self._rental_contract.functions.getCurrentTermSeats(), {'from': client_address})
 
     @property
     def next_term_seats(self):
@@ -141,7 +203,7 @@ class RentalContract(BaseDeviseClient):
         client_address = self.get_client_address(self.address)
         if client_address is None:
             return 0
-        return self._rental_contract.functions.getNextTermSeats().call({'from': client_address})
+        return self._call(self._rental_contract.functions.getNextTermSeats(), {'from': client_address})
 
     @property
     def client_summary(self):
@@ -158,7 +220,7 @@ class RentalContract(BaseDeviseClient):
         Returns the list of leptons currently on the Devise blockchain
         :return: a list of leptons in the order they were found and incremental usefulnesses added.
         """
-        all_leptons = self._rental_contract.functions.getAllLeptons().call()
+        all_leptons = self._call(self._rental_contract.functions.getAllLeptons())
         leptons = []
         prev_hash = None
         for idx, lepton_hash in enumerate(all_leptons[0]):
@@ -178,24 +240,16 @@ class RentalContract(BaseDeviseClient):
         Get account summaries of all the addresses that have ever provisioned tokens.
         :return: a list dicts containing the account summary of each address
         """
-        all_clients = self._rental_contract.functions.getAllClients().call()
-        clients = []
-        for client in all_clients:
-            clients.append(self.get_client_summary(client))
-
-        return clients
+        all_clients = self._call(self._rental_contract.functions.getAllClients())
+        return self.get_client_summaries(all_clients)
 
     def get_all_renters(self):
         """
         Get renter account summaries of all current lease term renters from the smart contract
         :return: a list of dicts containing the renters' account summaries
         """
-        all_renters = self._rental_contract.functions.getAllRenters().call()
-        clients = []
-        for client in all_renters:
-            clients.append(self.get_client_summary(client))
-
-        return clients
+        all_renters = self._call(self._rental_contract.functions.getAllRenters())
+        return self.get_client_summaries(all_renters)
 
     def get_client_summary(self, client_address):
         """
@@ -204,10 +258,27 @@ class RentalContract(BaseDeviseClient):
              must have provisioned dvz tokens into the rental contract at least once)
         :return: a dictionary of account information for the client address given
         """
+        raw_summary = self._call(self._rental_contract.functions.getClientSummary(client_address))
+        return self._format_client_summary(client_address, raw_summary)
+
+    def get_client_summaries(self, client_addresses):
+        """
+        Returns the account summaries of many clients, fetched in JSON-RPC batches of rpc_batch_size calls
+        :param client_addresses: a list of money account addresses
+        :return: a list of dictionaries of account information, in the same order as client_addresses
+        """
+        function_calls = [self._rental_contract.functions.getClientSummary(client_address)
+                          for client_address in client_addresses]
+        raw_summaries = self._batch_call(function_calls)
+        return [self._format_client_summary(client_address, raw_summary)
+                for client_address, raw_summary in zip(client_addresses, raw_summaries)]
+
+    def _format_client_summary(self, client_address, raw_summary):
+        """Converts the raw result of getClientSummary into an account summary dict"""
         keys = ['beneficiary', 'dvz_balance_escrow', 'dvz_balance', 'last_term_paid', 'power_user',
                 'historical_data_access', 'current_term_seats', 'indicative_next_term_seats']
 
-        summary = dict(zip(keys, self._rental_contract.functions.getClientSummary(client_address).call()))
+        summary = dict(zip(keys, raw_summary))
         summary["client"] = client_address
         summary["dvz_balance_escrow"] = summary["dvz_balance_escrow"] / TOKEN_PRECISION
         summary["dvz_balance"] = summary["dvz_balance"] / TOKEN_PRECISION
@@ -222,20 +293,34 @@ class RentalContract(BaseDeviseClient):
         :return: a list of the current bids
         """
         bids = []
-        keys = ['address', 'requested_seats', 'limit_price']
-        all_bidders = self._rental_contract.functions.getAllBidders().call()
+        all_bidders = self._call(self._rental_contract.functions.getAllBidders())
         for idx, client in enumerate(all_bidders[0]):
             bidder = {"address": client, "requested_seats": all_bidders[1][idx], "limit_price": all_bidders[2][idx]}
             bidder["limit_price"] = bidder["limit_price"] / TOKEN_PRECISION
             if bidder["address"] == "0x0000000000000000000000000000000000000000":
                 continue
-            # If active==True, only active bidders with enough funds to cover their bid
-            if not active or \
-                    self._has_sufficient_funds(bidder["address"], bidder["requested_seats"], bidder["limit_price"]):
-                bids.append(bidder)
+            bids.append(bidder)
+
+        # If active==True, only active bidders with enough funds to cover their bid
+        if active and bids:
+            bids = self._filter_sufficient_funds(bids)
 
         return bids
 
+    def _filter_sufficient_funds(self, bids):
+        """
+        Filters out the bids not covered by the bidder's escrow balance. The total incremental usefulness is read once
+        and all the escrow balances are fetched in JSON-RPC batches.
+        :param bids: a list of bids as returned by get_all_bidders
+        :return: the bids for which limit price * total incremental usefulness * requested seats <= escrow balance
+        """
+        total_incremental_usefulness = self.total_incremental_usefulness
+        allowance_call = self._rental_contract.functions.getAllowance()
+        balances = self._batch_call([allowance_call] * len(bids), [{'from': bid["address"]} for bid in bids])
+        return [bid for bid, balance in zip(bids, balances)
+                if bid["limit_price"] * total_incremental_usefulness * bid["requested_seats"] <=
+                balance / TOKEN_PRECISION]
+
     @costs_gas
     def provision(self, tokens):
         """Sends tokens from the current account to the clients contract"""
@@ -243,9 +328,9 @@ class RentalContract(BaseDeviseClient):
         self.logger.info("Approving token transfer to rental contract...")
         micro_tokens = int(tokens * TOKEN_PRECISION)
         # Approve tokens transfer into the clients contract
-        accounting_contract = self._rental_contract.functions.accounting().call()
+        accounting_contract = self._call(self._rental_contract.functions.accounting())
         self._transact(self._token_contract.functions.approve(accounting_contract, micro_tokens),
-                       {"from": self.address})
+                       {"from": self.address}, wait=True)
 
         self.logger.info("Provisioning rental contract with %s DVZ tokens..." % tokens)
         # Actually transfer the tokens
@@ -260,9 +345,9 @@ class RentalContract(BaseDeviseClient):
         self.logger.info("Approving token transfer to rental contract...")
         micro_tokens = int(tokens * TOKEN_PRECISION)
         # Approve tokens transfer into the clients contract
-        accounting_contract = self._rental_contract.functions.accounting().call()
+        accounting_contract = self._call(self._rental_contract.functions.accounting())
         self._transact(self._token_contract.functions.approve(accounting_contract, micro_tokens),
-                       {"from": self.address})
+                       {"from": self.address}, wait=True)
 
         self.logger.info("Provisioning escrow account %s with %s DVZ tokens..." % (recipient, tokens))
         recipient = Web3.toChecksumAddress(recipient)
@@ -373,7 +458,7 @@ class RentalContract(BaseDeviseClient):
                 "Insuffient DVZ balance in escrow, please provision at least %s DVZ tokens and try again" % (
                 self.indicative_rent_per_seat_next_term - self.dvz_balance_escrow))
 
-        self._transact(self._rental_contract.functions.applyForPowerUser(), {"from": self.address})
+        self._transact(self._rental_contract.functions.applyForPowerUser(), {"from": self.address}, wait=True)
         return self.client_summary["power_user"]
 
     @costs_gas
@@ -389,7 +474,7 @@ class RentalContract(BaseDeviseClient):
                 "Insuffient DVZ balance in escrow, please provision at least %s DVZ tokens and try again" % (
                 self.indicative_rent_per_seat_next_term - self.dvz_balance_escrow))
 
-        self._transact(self._rental_contract.functions.requestHistoricalData(), {"from": self.address})
+        self._transact(self._rental_contract.functions.requestHistoricalData(), {"from": self.address}, wait=True)
         return self.client_summary["historical_data_access"]
 
     @costs_gas
@@ -408,110 +493,209 @@ class RentalContract(BaseDeviseClient):
     def event_names(self):
         return sorted(event['name'] for event in self._rental_contract.events._events)
 
-    def get_events(self, event_name):
+    def get_events(self, event_name=None, start=None, end=None, argument_filters=None):
         """
         Returns all events of a type from the rental smart contract
-        :param event_name: The event for which we want all entries from the blockchain
+        :param event_name: The event for which we want all entries from the blockchain, a list of event names, or None
+                for all the events
+        :param start: only return events mined at or after this naive UTC datetime or unix timestamp
+        :param end: only return events mined at or before this naive UTC datetime or unix timestamp
+        :param argument_filters: a dict of event argument name to the value, or list of values, to return events for,
+                for example {'eventType': '5012435b1002cec631930c670a6f948cfdff98ef'}. Filters on indexed arguments
+                are applied by the node.
         :return: a list of dict containing transaction, block_number, block_timestamp, event, and event_args
         """
+        return list(self.iter_events(event_name, start=start, end=end, argument_filters=argument_filters))
 
-        network_id = self._get_network_id()
+    def iter_events(self, event_name=None, from_block=None, to_block=None, as_records=False, start=None, end=None,
+                    argument_filters=None):
+        """
+        Same as get_events, but returns a generator yielding the events as the block ranges are scanned, so that the
+        whole history is never held in memory. All the event types requested are fetched by the same queries.
+        :param event_name: The event for which we want all entries from the blockchain, a list of event names, or None
+                for all the events
+        :param from_block: the first block to scan, defaults to a block preceding the contracts deployment
+        :param to_block: the last block to scan, defaults to the latest block
+        :param as_records: if True, yields devise.events.EventRecord objects instead of dicts
+        :param start: only return events mined at or after this naive UTC datetime or unix timestamp
+        :param end: only return events mined at or before this naive UTC datetime or unix timestamp
+        :param argument_filters: a dict of event argument name to the value, or list of values, to return events for
+        :return: a generator of dict containing transaction, block_number, block_timestamp, event, and event_args
+        """
+        network_id = self._network_id
         w3 = self.w3
         # Load different provider for querying events if any
         node_url = get_events_node_url(network_id=network_id)
         current_provider = self.w3.providers[0]
         if node_url and current_provider.endpoint_uri != node_url:
-            w3 = Web3(self._get_provider(node_url))
-
-        # Filter from a recent block preceding any deployment to avoid timing out
-        from_block = 5934817 if int(network_id) == 1 else 0
-        events = []
-
-        # Get the contract abi so we can build our topic filter
-        rental_abi = get_contract_abi('DeviseRentalImpl')
-
-        # get all previous rental contract addresses in case of forks
-        rental_contracts = get_rental_contract_addresses(network_id=network_id)
-        for contract_address in rental_contracts:
-            contract = w3.eth.contract(address=contract_address, abi=rental_abi)
-            try:
-                event_filter = contract.eventFilter(event_name, {'fromBlock': from_block, 'toBlock': 'latest'})
-                events += event_filter.get_all_entries()
-            except ValueError:
-                # event is not declared in this contract, skip
-                pass
-
-        # Also add matching event from standalone audit contract
-        audit_abi = get_contract_abi('AuditImpl')
-        contract = w3.eth.contract(address=self._audit_contract.address, abi=audit_abi)
-        try:
-            event_filter = contract.eventFilter(event_name, {'fromBlock': from_block, 'toBlock': 'latest'})
-            events += event_filter.get_all_entries()
-        except ValueError:
-            # event is not declared in this contract, skip
-            pass
-
-        # Format events for humans
-        results = []
-        for event in events:
-            block_timestamp = self.get_block_timestamp(event["blockNumber"])
-            block_datetime = datetime.utcfromtimestamp(block_timestamp)
-            results += [{
-                "transaction": event["transactionHash"].hex(),
-                "block_number": event["blockNumber"],
-                "block_timestamp": self.get_block_timestamp(event["blockNumber"]),
-                "block_datetime": block_datetime,
-                "event": event["event"],
-                "event_args": self._format_event_args(event_name, event['args'])
-            }]
-        return results
-
-    def _format_event_args(self, event_name, args):
-        """Given a dictionary of arguments from events, formats them to humanly readable keys and values"""
-        formatted_args = {}
-        for key, value in args.items():
-            formatted_key = self._format_event_arg_key(event_name, key)
-            formatted_args[formatted_key] = self._format_event_arg_value(event_name, key, value)
-
-        return formatted_args
-
-    def _format_event_arg_key(self, event_name, key):
-        """Applies custom formatters if any for particular event keys"""
-        key_formatters = {
-            'LeptonAdded': {
-                's': 'lepton_hash',
-                'iu': 'incremental_usefulness'
-            },
-            'BeneficiaryChanged': {
-                'addr': 'client_address',
-                'ben': 'beneficiary_address'
-            },
-            'AuctionPriceSet': {
-                'prc': 'price_per_bit'
-            }
-        }
-        converted_key = key_formatters.get(event_name, {}).get(key, None)
-        return converted_key if converted_key else key
-
-    def _format_event_arg_value(self, event_name, key, value):
-        """Applies custom formatters if any for particular event values"""
-        value_formatters = {
-            'RateUpdated': {
-                'rate': lambda rate: "$ %f" % (rate / USD_PRECISION),
-            },
-            'LeptonAdded': {
-                'iu': lambda iu: iu / IU_PRECISION
-            },
-            'AuctionPriceSet': {
-                'prc': lambda price: price / TOKEN_PRECISION
-            }
-        }
-        formatter = value_formatters.get(event_name, {}).get(key, None)
-        if formatter:
-            return formatter(value)
-        if type(value) == bytes:
-            return value.hex()
-        return value
+            w3 = self._get_web3(node_url)
+
+        to_block = w3.eth.blockNumber if to_block is None else to_block
+
+        event_names = [event_name] if isinstance(event_name, str) else event_name
+        # get all previous rental contract addresses in case of forks, and the standalone audit contract, skipping the
+        # contracts which aren't deployed on this network
+        sources = [('DeviseRentalImpl', get_rental_contract_addresses(network_id=network_id)),
+                   ('AuditImpl', [self._audit_contract.address])]
+        sources = [(contract_name, [address for address in addresses if address is not None])
+                   for contract_name, addresses in sources]
+        # The decoders of the events requested by contract address and log topic
+        event_decoders = {}
+        for contract_name, addresses in sources:
+            decoders_by_topic = {topic: _get_event_decoder(contract_name, event_abi)
+                                 for topic, event_abi in get_event_abis(contract_name)[1].items()
+                                 if event_names is None or event_abi['name'] in event_names}
+            if decoders_by_topic:
+                # otherwise the events are not declared in this contract, skip
+                for address in addresses:
+                    event_decoders[address] = decoders_by_topic
+        # Only events having all the filtered arguments can match, they are filtered by the node on the indexed
+        # arguments when the topics are the same for all the events, and locally on the decoded arguments
+        topic_filters = []
+        local_filters = {}
+        if argument_filters:
+            compiled_filters = {}
+            for address, decoders_by_topic in list(event_decoders.items()):
+                for decoder in decoders_by_topic.values():
+                    if decoder not in compiled_filters:
+                        compiled_filters[decoder] = decoder.compile_filters(argument_filters)
+                decoders_by_topic = {topic: decoder for topic, decoder in decoders_by_topic.items()
+                                     if compiled_filters[decoder] is not None}
+                if decoders_by_topic:
+                    event_decoders[address] = decoders_by_topic
+                else:
+                    del event_decoders[address]
+            compiled_filters = {decoder: filters for decoder, filters in compiled_filters.items()
+                                if filters is not None}
+            all_topics = [topics for topics, _ in compiled_filters.values()]
+            if all_topics and all(topics == all_topics[0] for topics in all_topics):
+                topic_filters = all_topics[0]
+            local_filters = {decoder.event_name: filters for decoder, (_, filters) in compiled_filters.items()}
+        if not event_decoders:
+            return
+
+        # Scan from the first contract deployment, falling back to a block preceding any deployment
+        default_block = 5934817 if int(network_id) == 1 else 0
+        deployment_blocks = [get_deployment_block(w3, address) for address in event_decoders]
+        first_block = min(default_block if block is None else block for block in deployment_blocks)
+        from_block = first_block if from_block is None else from_block
+
+        # Only scan the blocks mined within the time range requested
+        if start is not None or end is not None:
+            block_timestamps = get_block_timestamp_cache(w3)
+            if start is not None:
+                from_block = block_timestamps.get_block_at(to_timestamp(start), low=from_block, high=to_block)
+            if end is not None:
+                to_block = block_timestamps.get_block_at(int(to_timestamp(end)) + 1, low=from_block, high=to_block) - 1
+            if from_block > to_block:
+                return
+
+        if self.event_store is None:
+            windows = self._iter_event_windows(w3, event_decoders, from_block, to_block, topic_filters)
+            for _, window_events in windows:
+                for _, _, record in window_events:
+                    if not local_filters or _match_event_args(record.event_args, local_filters[record.event]):
+                        yield record if as_records else record.to_dict()
+        else:
+            # The store is synchronized with all the events of the blocks requested, and filtered through its argument
+            # index
+            store_filters = list(local_filters.values())[0] if len(local_filters) == 1 else None
+            for event in self._iter_stored_events(w3, event_decoders, from_block, to_block, store_filters):
+                if not local_filters or _match_event_args(event["event_args"], local_filters[event["event"]]):
+                    yield EventRecord.from_dict(event) if as_records else event
+
+    def subscribe(self, event_names, callback, confirmations=FINALITY_DEPTH, **kwargs):
+        """
+        Follows new blocks in a background thread, calling callback with each new event once it has enough
+        confirmations. Events from blocks removed by a chain reorganization are delivered again with "removed": True.
+        Blocks are polled over the client's connection, which is a websocket when the node url is ws:// or wss://.
+        :param event_names: an event name, a list of event names, or None for all the events
+        :param callback: the function called with each event, as returned by get_events
+        :param confirmations: the number of blocks mined on top of a block before its events are delivered
+        :param kwargs: poll_interval and cursor_path, see devise.subscription.EventSubscription
+        :return: the started EventSubscription, call its stop() method to unsubscribe
+        """
+        return EventSubscription(self, event_names, callback, confirmations=confirmations, **kwargs).start()
+
+    def _iter_stored_events(self, w3, event_decoders, from_block, to_block, argument_filters=None):
+        """
+        Yields the events of a block range in chain order: the stored ones from the event store, and the others as
+        their blocks are scanned, storing the events of the final blocks scanned
+        """
+        chain_id = get_chain_id(w3)
+        # Only events from final blocks are stored, so that the store never has to handle chain reorganizations
+        final_block = min(to_block, w3.eth.blockNumber - FINALITY_DEPTH)
+        sync_keys = [(address, decoder.event_name) for address, decoders_by_topic in event_decoders.items()
+                     for decoder in decoders_by_topic.values()]
+        event_names = sorted(set(name for _, name in sync_keys))
+
+        # Only the requested blocks are scanned: the final ones never synchronized for all the addresses and events,
+        # and the ones which are not final yet
+        scan_ranges = []
+        if from_block <= final_block:
+            scan_ranges = self.event_store.get_unsynced_ranges(chain_id, sync_keys, from_block, final_block)
+        if final_block < to_block:
+            if scan_ranges and scan_ranges[-1][1] == final_block:
+                scan_ranges[-1] = (scan_ranges[-1][0], to_block)
+            else:
+                scan_ranges.append((max(from_block, final_block + 1), to_block))
+
+        next_block = from_block
+        for scan_from, scan_to in scan_ranges + [(to_block + 1, None)]:
+            if scan_from > next_block:
+                yield from self.event_store.iter_query(chain_id, event_names, list(event_decoders.keys()),
+                                                       from_block=next_block, to_block=scan_from - 1,
+                                                       args=argument_filters)
+            if scan_to is None:
+                break
+            for window_end, window_events in self._iter_event_windows(w3, event_decoders, scan_from, scan_to):
+                # Record the blocks synchronized window by window, so that an interrupted synchronization resumes
+                synced_to = min(window_end, final_block)
+                if synced_to >= scan_from:
+                    final_events = [(address, log_index, record.to_dict())
+                                    for address, log_index, record in window_events
+                                    if record.block_number <= final_block]
+                    self.event_store.add_events(chain_id, final_events,
+                                                {key: (scan_from, synced_to) for key in sync_keys})
+                for _, _, record in window_events:
+                    yield record.to_dict()
+            next_block = scan_to + 1
+
+    def _iter_event_windows(self, w3, event_decoders, from_block, to_block, topic_filters=None):
+        """
+        Fetches and decodes the events emitted by contracts over a block range, with a single query per block range
+        for all the contracts and event types
+        :param w3: the Web3 instance to query logs from
+        :param event_decoders: a dict of contract address to a dict of log topic to the decoder of the event to fetch
+        :param from_block: the first block to scan
+        :param to_block: the last block to scan
+        :param topic_filters: the topics following the event topic the logs must match, see EventDecoder.compile_filters
+        :return: a generator of (last block, list of (contract address, log index, EventRecord)) in chain order, one
+                per block range scanned
+        """
+        decoders_by_address = {address.lower(): decoders for address, decoders in event_decoders.items()}
+        topics = sorted(set(topic for decoders_by_topic in event_decoders.values() for topic in decoders_by_topic))
+        filter_params = {'address': list(event_decoders.keys()),
+                         'topics': [[Web3.toHex(topic) for topic in topics]] + list(topic_filters or [])}
+        scanner = BlockRangeScanner(w3, max_workers=self.event_scan_workers)
+        for _, window_end, logs in scanner.scan(filter_params, from_block, to_block):
+            # Dispatch each log to the decoder of its contract and event, an address only matches some of the topics
+            logs = [(log, decoders_by_address.get(log["address"].lower(), {}).get(bytes(log["topics"][0])))
+                    for log in logs]
+            logs = [(log, decoder) for log, decoder in logs if decoder is not None]
+
+            # Fetch the timestamps of all the blocks with events in this window at once
+            block_timestamps = get_block_timestamp_cache(w3).get_timestamps(
+                [(log["blockNumber"], log["blockHash"].hex()) for log, _ in logs])
+
+            yield window_end, [(log["address"], log["logIndex"],
+                                EventRecord(log["transactionHash"].hex(), log["blockNumber"],
+                                            block_timestamps[log["blockNumber"]], decoder.event_name,
+                                            decoder.decode_args(log)))
+                               for log, decoder in logs]
 
     def get_block_timestamp(self, block_number):
-        return self.w3.eth.getBlock(block_number)['timestamp']
+        if not isinstance(block_number, int) or isinstance(block_number, bool):
+            # Block identifiers such as 'latest' or a block hash can't be cached by number
+            return self.w3.eth.getBlock(block_number)['timestamp']
+        return get_block_timestamp_cache(self.w3).get_timestamp(block_number)
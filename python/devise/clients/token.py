@@ -22,14 +22,14 @@ class DeviseToken(BaseDeviseClient):
         """
         Returns the total supply of tokens
         """
-        return self._token_contract.functions.totalSupply().call() / TOKEN_PRECISION
+        return self._call(self._token_contract.functions.totalSupply()) / TOKEN_PRECISION
 
     @property
     def cap(self):
         """
         Returns the maximum possible supply for this token
         """
-        return self._token_contract.functions.cap().call() / TOKEN_PRECISION
+        return self._call(self._token_contract.functions.cap()) / TOKEN_PRECISION
 
     def allowance(self, owner, spender):
         """
@@ -38,14 +38,14 @@ class DeviseToken(BaseDeviseClient):
         :param spender: the authorized spender
         :return: The amount spender is allowed to spend
         """
-        return self._token_contract.functions.allowance(owner, spender).call() / TOKEN_PRECISION
+        return self._call(self._token_contract.functions.allowance(owner, spender)) / TOKEN_PRECISION
 
     def balance_of(self, address):
         """
         Returns the balance in tokens of the address provided
         :param address: the address for which we're querying the token blance
         """
-        return self._token_contract.functions.balanceOf(address).call() / TOKEN_PRECISION
+        return self._call(self._token_contract.functions.balanceOf(address)) / TOKEN_PRECISION
 
     @costs_gas
     def transfer(self, to_address, amount):
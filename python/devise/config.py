@@ -8,12 +8,15 @@
     :license: GPLv3, see LICENSE for more details.
 """
 
-# A static mapping of blockchain ID to deployed contract addresses
+# A static mapping of blockchain ID to deployed contract addresses, the fallback when the CDN can't be reached. Keep in
+# sync with config/contract_address.json.
 
 CONTRACT_ADDRESSES = {
     # Main Ethereum network
     '1': {
-        "DEVISE_RENTAL": "0xF08C62A99318277DE9Cc5699D6904032Cb598199",
+        "DEVISE_RENTAL": "0x26E47337f0d2CfC39d671158Bd6B04521D6aAD05",
+        # The rental proxies replaced by DEVISE_RENTAL, whose events are still part of the rental history
+        "DEVISE_RENTAL_PREVIOUS_ADDRESSES": [],
         "DEVISE_TOKEN": "0xc2E71fdbFdd9e967D49B99CD288164e40e15992E",
         "DEVISE_TOKEN_SALE": "0xdB1548455e29c08377F0999Db2aF55F65758c514"
     },
@@ -37,3 +40,20 @@ CONTRACT_ADDRESSES = {
         "DEVISE_TOKEN": "0xC1844bbe0537cE51F95F9EC08c55D697fCcf3f17"
     }
 }
+
+# A static mapping of network names to public Ethereum nodes
+NETWORK_TO_NODE = {
+    "MAINNET": "https://mainnet.infura.io/ZQl920lU4Wyl6vyrND55",
+    "RINKEBY": "https://rinkeby.infura.io/ZQl920lU4Wyl6vyrND55",
+    "DEV1": "https://dev1.devisechain.io",
+    "DEV2": "https://dev2.devisechain.io",
+    "GANACHE": "http://localhost:8545"
+}
+
+# A static mapping of network names to Pit.AI API roots
+API_ROOT_URL = {
+    "MAINNET": "https://api.devisechain.io"
+}
+
+# A static mapping of blockchain ID to the custom nodes used to query events, if any
+EVENT_QUERY_NODES = {}
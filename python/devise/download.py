@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+"""
+    devise.download
+    ~~~~~~~~~~~~~~~~~~~~~~~~~
+    Resumable file downloads. Files are downloaded to a ".part" file next to their destination, interrupted transfers
+    are resumed with HTTP range requests validated with If-Range, and the file is only renamed to its destination once
+    complete. Large files can be downloaded in several byte ranges concurrently. The SHA1 of a file is computed as it
+    is downloaded, so that it can be verified without reading the file again.
+
+    :copyright: © 2018 Pit.AI
+    :license: GPLv3, see LICENSE for more details.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from .http import get_session
+
+# Number of attempts at completing a download before giving up, leaving the partial file to resume later
+DOWNLOAD_ATTEMPTS = int(os.environ.get("DEVISE_DOWNLOAD_ATTEMPTS", 5))
+# Number of seconds to wait before the first retry, doubled for each following retry
+DOWNLOAD_BACKOFF = 1
+# Number of bytes read from the network and written to disk at once
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+# Number of bytes from the beginning of a file returned with its digest, e.g. to read a zip archive's first entry
+DOWNLOAD_HEAD_SIZE = 64 * 1024
+# Timeout in seconds for connecting and between received bytes
+DOWNLOAD_TIMEOUT = 60
+
+_WRITE_LOCK = threading.Lock()
+
+logger = logging.getLogger(__name__)
+
+
+class DownloadError(Exception):
+    """Raised when the server refuses a download"""
+
+    def __init__(self, status_code, text):
+        super(DownloadError, self).__init__("Unable to download (%s): %s" % (status_code, text))
+        self.status_code = status_code
+
+
+DownloadResult = namedtuple('DownloadResult', ['sha1', 'head'])
+DownloadResult.__doc__ = """The hex SHA1 digest of a downloaded file and its first DOWNLOAD_HEAD_SIZE bytes"""
+
+
+class _Digest(object):
+    """The SHA1 and first bytes of a download, following its partial file across resumed attempts"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.sha1 = hashlib.sha1()
+        self.size = 0
+        self.head = b''
+
+    def update(self, data):
+        if self.size < DOWNLOAD_HEAD_SIZE:
+            self.head += data[:DOWNLOAD_HEAD_SIZE - self.size]
+        self.sha1.update(data)
+        self.size += len(data)
+
+    def seek(self, path, offset):
+        """Makes the digest cover the first offset bytes of the file at path, reading them if needed"""
+        if offset == self.size:
+            return
+        self.reset()
+        if offset == 0:
+            return
+        with open(path, 'rb') as f:
+            while self.size < offset:
+                data = f.read(min(DOWNLOAD_CHUNK_SIZE, offset - self.size))
+                if not data:
+                    raise _IncompleteDownload("%s is shorter than %s bytes" % (path, offset))
+                self.update(data)
+
+    def result(self):
+        return DownloadResult(self.sha1.hexdigest(), self.head)
+
+
+class _IncompleteDownload(Exception):
+    pass
+
+
+class _RemoteFileChanged(Exception):
+    pass
+
+
+def _read_validator(meta_path):
+    """Reads the ETag or Last-Modified header saved along with a partial download"""
+    try:
+        with open(meta_path, 'r') as meta_file:
+            return json.load(meta_file).get("validator")
+    except (OSError, ValueError):
+        return None
+
+
+def _write_validator(meta_path, validator):
+    with open(meta_path, 'w') as meta_file:
+        json.dump({"validator": validator}, meta_file)
+
+
+def _remove(path):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+def download(url, local_file_name, headers=None, attempts=DOWNLOAD_ATTEMPTS, segments=1, resumable=True):
+    """
+    Downloads a url to a local file, resuming interrupted transfers
+    :param url: the url to download
+    :param local_file_name: the destination path, only created once the download is complete
+    :param headers: additional request headers
+    :param attempts: the number of attempts at completing the download, or each segment of a segmented download
+    :param segments: the number of byte ranges downloaded concurrently, servers which don't support range requests
+            are downloaded in a single stream
+    :param resumable: whether a later call with the same local_file_name may resume a failed download, otherwise
+            its partial file is removed
+    :return: a DownloadResult with the SHA1 and first bytes of the file, computed from the downloaded chunks
+    """
+    part_path = local_file_name + '.part'
+    meta_path = part_path + '.json'
+    if segments > 1:
+        # Segmented downloads can't be resumed by a later call, a failed one doesn't leave a partial file behind
+        _remove(meta_path)
+        try:
+            size = _download_segmented(url, part_path, headers or {}, segments, attempts)
+            if size is not None:
+                # The segments arrived out of order, hash the complete file
+                digest = _Digest()
+                digest.seek(part_path, size)
+                os.replace(part_path, local_file_name)
+                return digest.result()
+        except _RemoteFileChanged:
+            logger.warning("%s changed during its download, downloading it again in a single stream", url)
+            _remove(part_path)
+        except Exception:
+            _remove(part_path)
+            raise
+
+    digest = _Digest()
+    completed = False
+    try:
+        for attempt in range(attempts):
+            try:
+                _download_part(url, part_path, meta_path, headers or {}, digest)
+                break
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError,
+                    _IncompleteDownload) as e:
+                time.sleep(_get_retry_delay(attempt, attempts, e, "Download of %s" % local_file_name))
+        completed = True
+    finally:
+        if not completed and not resumable:
+            _remove(part_path)
+            _remove(meta_path)
+
+    os.replace(part_path, local_file_name)
+    _remove(meta_path)
+    return digest.result()
+
+
+def _download_part(url, part_path, meta_path, headers, digest):
+    """Downloads the remainder of a partial download, updating its digest"""
+    # Ranges are offsets in the encoded content, so ask for the file as is
+    headers = dict(headers, **{'Accept-Encoding': 'identity'})
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    validator = _read_validator(meta_path)
+    if offset > 0 and validator is not None:
+        # Only get the remaining bytes if the file didn't change since the partial download, otherwise get it whole
+        headers['Range'] = 'bytes=%d-' % offset
+        headers['If-Range'] = validator
+    else:
+        offset = 0
+
+    resp = get_session().get(url, headers=headers, stream=True, timeout=DOWNLOAD_TIMEOUT)
+    if resp.status_code == 416:
+        # Our partial file doesn't match the remote file anymore, start over
+        _remove(part_path)
+        raise _IncompleteDownload("Range not satisfiable")
+    if resp.status_code == 206:
+        match = re.match(r'bytes (\d+)-', resp.headers.get('Content-Range', ''))
+        if match is None or int(match.group(1)) != offset:
+            _remove(part_path)
+            raise _IncompleteDownload("Unexpected Content-Range %s" % resp.headers.get('Content-Range'))
+    elif resp.status_code == 200:
+        offset = 0
+    else:
+        raise DownloadError(resp.status_code, resp.text)
+
+    validator = resp.headers.get('ETag') or resp.headers.get('Last-Modified')
+    if validator is not None:
+        _write_validator(meta_path, validator)
+    else:
+        _remove(meta_path)
+
+    # Only a partial file left by a previous call is read again, the bytes of this call's attempts are already hashed
+    digest.seek(part_path, offset)
+    content_length = resp.headers.get('Content-Length')
+    expected_size = offset + int(content_length) if content_length is not None else None
+    with open(part_path, 'ab' if offset > 0 else 'wb') as out_file:
+        for chunk in resp.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+            if chunk:  # filter out keep-alive new chunks
+                out_file.write(chunk)
+                digest.update(chunk)
+        size = out_file.tell()
+
+    if expected_size is not None and size != expected_size:
+        raise _IncompleteDownload("Received %s bytes out of %s" % (size, expected_size))
+
+
+def _get_retry_delay(attempt, attempts, error, description):
+    """Returns the number of seconds to wait before retrying, or raises error after the last attempt"""
+    if attempt == attempts - 1:
+        raise error
+    delay = DOWNLOAD_BACKOFF * 2 ** attempt
+    logger.warning("%s interrupted (%s), resuming in %s seconds", description, error, delay)
+    return delay
+
+
+def _download_segmented(url, part_path, headers, segments, attempts):
+    """
+    Downloads a file in several byte ranges concurrently, written into a preallocated file
+    :return: the size of the file, or None if the server doesn't support range requests
+    """
+    headers = dict(headers, **{'Accept-Encoding': 'identity'})
+    # Ask for the first byte: servers supporting range requests answer with the file size in Content-Range
+    probe = get_session().get(url, headers=dict(headers, Range='bytes=0-0'), stream=True, timeout=DOWNLOAD_TIMEOUT)
+    if probe.status_code not in (200, 206):
+        raise DownloadError(probe.status_code, probe.text)
+    probe.close()
+    match = re.match(r'bytes 0-0/(\d+)$', probe.headers.get('Content-Range', ''))
+    if probe.status_code != 206 or match is None:
+        return None
+
+    size = int(match.group(1))
+    validator = probe.headers.get('ETag') or probe.headers.get('Last-Modified')
+    with open(part_path, 'wb') as part_file:
+        part_file.truncate(size)
+    if size == 0:
+        return size
+
+    segment_size = -(-size // segments)
+    ranges = [(start, min(size, start + segment_size) - 1) for start in range(0, size, segment_size)]
+    fd = os.open(part_path, os.O_WRONLY | getattr(os, 'O_BINARY', 0))
+    try:
+        with ThreadPoolExecutor(max_workers=segments) as executor:
+            futures = [executor.submit(_download_segment, url, fd, start, end, headers, validator, attempts)
+                       for start, end in ranges]
+            for future in futures:
+                future.result()
+    finally:
+        os.close(fd)
+    return size
+
+
+def _download_segment(url, fd, start, end, headers, validator, attempts):
+    """Downloads the byte range [start, end] of a file into fd, resuming it when interrupted"""
+    position = start
+    for attempt in range(attempts):
+        segment_headers = dict(headers, Range='bytes=%d-%d' % (position, end))
+        if validator is not None:
+            segment_headers['If-Range'] = validator
+        try:
+            resp = get_session().get(url, headers=segment_headers, stream=True, timeout=DOWNLOAD_TIMEOUT)
+            if resp.status_code == 200:
+                # If-Range didn't match: the file changed since the first segments were downloaded
+                resp.close()
+                raise _RemoteFileChanged()
+            if resp.status_code != 206:
+                raise DownloadError(resp.status_code, resp.text)
+            for chunk in resp.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                if chunk:
+                    _pwrite(fd, chunk, position)
+                    position += len(chunk)
+            if position != end + 1:
+                raise _IncompleteDownload("Received %s bytes out of %s" % (position - start, end + 1 - start))
+            return
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError,
+                _IncompleteDownload) as e:
+            time.sleep(_get_retry_delay(attempt, attempts, e, "Download of bytes %s-%s" % (start, end)))
+
+
+def _pwrite(fd, data, offset):
+    """Writes data at an offset of a file shared between threads"""
+    if hasattr(os, 'pwrite'):
+        view = memoryview(data)
+        while view:
+            written = os.pwrite(fd, view, offset)
+            view = view[written:]
+            offset += written
+    else:
+        # No positional writes (Windows), seek and write under a lock
+        with _WRITE_LOCK:
+            os.lseek(fd, offset, os.SEEK_SET)
+            view = memoryview(data)
+            while view:
+                view = view[os.write(fd, view):]
@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+"""
+    devise.event_store
+    ~~~~~~~~~~~~~~~~~~~~~~~~~
+    A local SQLite index of the formatted contract events. For each contract address and event name it remembers the
+    block ranges synchronized, so that queries only fetch the blocks they need which were never fetched, and it
+    answers queries by event name, block range, time range and argument value from its indexes.
+
+    :copyright: © 2018 Pit.AI
+    :license: GPLv3, see LICENSE for more details.
+"""
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+from .blocks import to_timestamp
+from .remote_config import get_cache_dir
+
+# Number of events read from the database at once by iter_query
+QUERY_PAGE_SIZE = 1000
+
+
+class EventStore(object):
+    """
+    Stores formatted events, keyed by chain, contract address, transaction hash and log index.
+
+    Only events from final blocks should be added, along with the block ranges of a (chain, address, event) in which
+    all the events are stored.
+
+    Example Usage:
+        client = DeviseClient(private_key=..., event_store=EventStore())
+        client.get_events('LeptonAdded')  # fetches the whole history once
+        client.get_events('LeptonAdded')  # only fetches the blocks mined since
+        client.event_store.query(get_chain_id(client.w3), 'BeneficiaryChanged', args={'client_address': '0x...'})
+    """
+
+    def __init__(self, path=None):
+        """
+        :param path: the path of the SQLite database, defaults to events.sqlite in the Devise cache directory
+        """
+        self.path = path or os.path.join(get_cache_dir(), 'events.sqlite')
+        self._db = None
+        self._lock = threading.RLock()
+
+    def _get_db(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.executescript("""
+                CREATE TABLE IF NOT EXISTS synced_ranges (
+                    chain TEXT NOT NULL, address TEXT NOT NULL, event TEXT NOT NULL, from_block INTEGER NOT NULL,
+                    to_block INTEGER NOT NULL,
+                    PRIMARY KEY (chain, address, event, from_block));
+                -- The high water marks of previous versions, every block up to them was synchronized
+                CREATE TABLE IF NOT EXISTS sync_state (
+                    chain TEXT NOT NULL, address TEXT NOT NULL, event TEXT NOT NULL, block_number INTEGER NOT NULL,
+                    PRIMARY KEY (chain, address, event));
+                INSERT OR IGNORE INTO synced_ranges (chain, address, event, from_block, to_block)
+                    SELECT chain, address, event, 0, block_number FROM sync_state;
+                DELETE FROM sync_state;
+                CREATE TABLE IF NOT EXISTS events (
+                    chain TEXT NOT NULL, address TEXT NOT NULL, event TEXT NOT NULL, transaction_hash TEXT NOT NULL,
+                    log_index INTEGER NOT NULL, block_number INTEGER NOT NULL, block_timestamp INTEGER NOT NULL,
+                    args TEXT NOT NULL,
+                    PRIMARY KEY (chain, transaction_hash, log_index));
+                CREATE INDEX IF NOT EXISTS events_by_block ON events (chain, event, block_number);
+                CREATE INDEX IF NOT EXISTS events_by_time ON events (chain, event, block_timestamp);
+                CREATE TABLE IF NOT EXISTS event_args (
+                    chain TEXT NOT NULL, transaction_hash TEXT NOT NULL, log_index INTEGER NOT NULL,
+                    event TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,
+                    PRIMARY KEY (chain, transaction_hash, log_index, key));
+                CREATE INDEX IF NOT EXISTS event_args_by_value ON event_args (chain, event, key, value);
+            """)
+            self._db.commit()
+        return self._db
+
+    def get_sync_block(self, chain_id, address, event_name):
+        """
+        Returns the last block synchronized for the events of a contract
+        :param chain_id: the chain identifier (see devise.blocks.get_chain_id)
+        :param address: the contract address
+        :param event_name: the event name
+        :return: a block number, or None if this event was never synchronized
+        """
+        ranges = self.get_synced_ranges(chain_id, address, event_name)
+        return ranges[-1][1] if ranges else None
+
+    def get_synced_ranges(self, chain_id, address, event_name):
+        """
+        Returns the block ranges in which all the events of a contract are stored
+        :param chain_id: the chain identifier (see devise.blocks.get_chain_id)
+        :param address: the contract address
+        :param event_name: the event name
+        :return: a sorted list of disjoint (first block, last block) tuples
+        """
+        with self._lock:
+            rows = self._get_db().execute(
+                "SELECT from_block, to_block FROM synced_ranges WHERE chain = ? AND address = ? AND event = ? "
+                "ORDER BY from_block", (chain_id, address.lower(), event_name)).fetchall()
+        return [tuple(row) for row in rows]
+
+    def get_unsynced_ranges(self, chain_id, keys, from_block, to_block):
+        """
+        Returns the block ranges which must be synchronized for the events of several contracts to be stored
+        :param chain_id: the chain identifier (see devise.blocks.get_chain_id)
+        :param keys: a list of (contract address, event name) tuples
+        :param from_block: the first block needed
+        :param to_block: the last block needed
+        :return: a sorted list of disjoint (first block, last block) tuples between from_block and to_block
+        """
+        gaps = []
+        for address, event_name in keys:
+            next_block = from_block
+            for range_from, range_to in self.get_synced_ranges(chain_id, address, event_name):
+                if range_from > to_block:
+                    break
+                if range_from > next_block:
+                    gaps.append((next_block, range_from - 1))
+                next_block = max(next_block, range_to + 1)
+            if next_block <= to_block:
+                gaps.append((next_block, to_block))
+        return _merge_ranges(gaps)
+
+    def add_events(self, chain_id, events, synced_ranges):
+        """
+        Stores events and records the block ranges synchronized in a single transaction
+        :param chain_id: the chain identifier (see devise.blocks.get_chain_id)
+        :param events: a list of (contract address, log index, formatted event dict) tuples
+        :param synced_ranges: a dict of (contract address, event name) to the (first block, last block) tuple of the
+                range synchronized
+        """
+        event_rows = []
+        arg_rows = []
+        for address, log_index, event in events:
+            event_rows.append((chain_id, address.lower(), event["event"], event["transaction"], log_index,
+                               event["block_number"], event["block_timestamp"], json.dumps(event["event_args"])))
+            arg_rows += [(chain_id, event["transaction"], log_index, event["event"], key, json.dumps(value))
+                         for key, value in event["event_args"].items()]
+
+        with self._lock:
+            db = self._get_db()
+            with db:
+                db.executemany("INSERT OR REPLACE INTO events (chain, address, event, transaction_hash, log_index, "
+                               "block_number, block_timestamp, args) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", event_rows)
+                db.executemany("INSERT OR REPLACE INTO event_args (chain, transaction_hash, log_index, event, key, "
+                               "value) VALUES (?, ?, ?, ?, ?, ?)", arg_rows)
+                for (address, event_name), (from_block, to_block) in synced_ranges.items():
+                    # Merge the range with the ones it overlaps or touches
+                    key = (chain_id, address.lower(), event_name)
+                    rows = db.execute("SELECT from_block, to_block FROM synced_ranges WHERE chain = ? AND "
+                                      "address = ? AND event = ? AND to_block >= ? AND from_block <= ?",
+                                      key + (from_block - 1, to_block + 1)).fetchall()
+                    merged_from = min([from_block] + [row[0] for row in rows])
+                    merged_to = max([to_block] + [row[1] for row in rows])
+                    db.executemany("DELETE FROM synced_ranges WHERE chain = ? AND address = ? AND event = ? AND "
+                                   "from_block = ?", [key + (row[0],) for row in rows])
+                    db.execute("INSERT INTO synced_ranges (chain, address, event, from_block, to_block) "
+                               "VALUES (?, ?, ?, ?, ?)", key + (merged_from, merged_to))
+
+    def query(self, chain_id, event_name, addresses=None, from_block=None, to_block=None, start=None, end=None,
+              args=None):
+        """
+        Returns stored events in chain order
+        :param chain_id: the chain identifier (see devise.blocks.get_chain_id)
+        :param event_name: the event name, or a list of event names
+        :param addresses: only return events emitted by these contract addresses
+        :param from_block: only return events mined in or after this block
+        :param to_block: only return events mined in or before this block
+        :param start: only return events mined at or after this datetime or unix timestamp
+        :param end: only return events mined at or before this datetime or unix timestamp
+        :param args: a dict of formatted argument names to the value, or list of values, the events must match
+        :return: a list of dict containing transaction, block_number, block_timestamp, event, and event_args
+        """
+        return list(self.iter_query(chain_id, event_name, addresses=addresses, from_block=from_block,
+                                    to_block=to_block, start=start, end=end, args=args))
+
+    def iter_query(self, chain_id, event_name, addresses=None, from_block=None, to_block=None, start=None, end=None,
+                   args=None, page_size=QUERY_PAGE_SIZE):
+        """
+        Same as query, but returns a generator reading the stored events page by page
+        :param page_size: the number of events read from the database at once
+        """
+        event_names = [event_name] if isinstance(event_name, str) else list(event_name)
+        conditions = ["e.chain = ?", "e.event IN (%s)" % ",".join("?" * len(event_names))]
+        params = [chain_id] + event_names
+        if addresses is not None:
+            conditions.append("e.address IN (%s)" % ",".join("?" * len(addresses)))
+            params += [address.lower() for address in addresses]
+        for condition, value in (("e.block_number >= ?", from_block), ("e.block_number <= ?", to_block),
+                                 ("e.block_timestamp >= ?", to_timestamp(start)),
+                                 ("e.block_timestamp <= ?", to_timestamp(end))):
+            if value is not None:
+                conditions.append(condition)
+                params.append(value)
+        for idx, (key, values) in enumerate(sorted((args or {}).items())):
+            values = list(values) if isinstance(values, (list, tuple, set)) else [values]
+            conditions.append("EXISTS (SELECT 1 FROM event_args a%d WHERE a%d.chain = e.chain AND "
+                              "a%d.transaction_hash = e.transaction_hash AND a%d.log_index = e.log_index AND "
+                              "a%d.event = e.event AND a%d.key = ? AND a%d.value IN (%s))" % ((idx,) * 7 + (
+                                  ",".join("?" * len(values)),)))
+            params += [key] + [json.dumps(value) for value in values]
+
+        sql = ("SELECT e.transaction_hash, e.block_number, e.block_timestamp, e.event, e.args, e.log_index "
+               "FROM events e WHERE %s ORDER BY e.block_number, e.log_index LIMIT ?" % " AND ".join(conditions))
+        # Resume each page after the last event read, log indexes being unique within a block
+        next_page_sql = sql.replace(" ORDER BY", " AND (e.block_number > ? OR (e.block_number = ? AND "
+                                                 "e.log_index > ?)) ORDER BY")
+        last = None
+        while True:
+            with self._lock:
+                if last is None:
+                    rows = self._get_db().execute(sql, params + [page_size]).fetchall()
+                else:
+                    rows = self._get_db().execute(next_page_sql, params + [last[0], last[0], last[1], page_size])\
+                        .fetchall()
+
+            for transaction_hash, block_number, block_timestamp, event, event_args, _ in rows:
+                yield {
+                    "transaction": transaction_hash,
+                    "block_number": block_number,
+                    "block_timestamp": block_timestamp,
+                    "block_datetime": datetime.utcfromtimestamp(block_timestamp),
+                    "event": event,
+                    "event_args": json.loads(event_args)
+                }
+
+            if len(rows) < page_size:
+                return
+            last = (rows[-1][1], rows[-1][5])
+
+
+def _merge_ranges(ranges):
+    """Merges overlapping and adjacent (first block, last block) ranges into a sorted list of disjoint ranges"""
+    merged = []
+    for range_from, range_to in sorted(ranges):
+        if merged and range_from <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], range_to))
+        else:
+            merged.append((range_from, range_to))
+    return merged
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+    devise.events
+    ~~~~~~~~~~~~~~~~~~~~~~~~~
+    Event log decoders compiled once per event abi, mapping raw log topics and data straight to renamed and formatted
+    event arguments, and a compact record type for decoded events.
+
+    :copyright: © 2018 Pit.AI
+    :license: GPLv3, see LICENSE for more details.
+"""
+from datetime import datetime
+
+from eth_abi import decode_abi, decode_single, encode_single
+from eth_utils import keccak, to_bytes, to_checksum_address, to_hex
+
+
+def _is_dynamic(abi_type):
+    return abi_type in ('string', 'bytes') or abi_type.endswith(']')
+
+
+def _topic_type(abi_type):
+    """Indexed arguments of dynamic types are stored as the keccak hash of their value"""
+    return 'bytes32' if _is_dynamic(abi_type) else abi_type
+
+
+def _compile_value_formatter(abi_type, formatter):
+    """Returns the function turning a decoded value of an abi type into its formatted value"""
+    if formatter is not None:
+        return formatter
+    if abi_type.endswith(']'):
+        return None
+    if abi_type == 'address':
+        return to_checksum_address
+    if abi_type == 'string':
+        return lambda value: value.decode('utf-8') if isinstance(value, bytes) else value
+    if abi_type.startswith('bytes'):
+        return lambda value: value.hex()
+    return None
+
+
+def _normalize_filter_value(abi_type, indexed, value):
+    """Converts a filter value to the formatted value decode_args outputs for an argument"""
+    if indexed and _is_dynamic(abi_type):
+        # Only the hash of indexed dynamic values is logged
+        if isinstance(value, str) and abi_type == 'string':
+            return keccak(text=value).hex()
+        return keccak(value if isinstance(value, bytes) else to_bytes(hexstr=value)).hex()
+    if abi_type == 'address':
+        return to_checksum_address(value)
+    if abi_type.startswith('bytes') and not abi_type.endswith(']'):
+        return value.hex() if isinstance(value, bytes) else value.lower().replace('0x', '', 1)
+    return value
+
+
+def _encode_topic(abi_type, value):
+    """Encodes the normalized filter value of an indexed argument as a log topic"""
+    if _is_dynamic(abi_type):
+        return '0x' + value
+    if abi_type.startswith('bytes'):
+        value = bytes.fromhex(value)
+    return to_hex(encode_single(abi_type, value))
+
+
+class EventDecoder(object):
+    """
+    Decodes the logs of one event. The argument types, names and formatters are resolved once, when the decoder is
+    created, instead of for every log.
+    """
+
+    def __init__(self, event_abi, key_formatters=None, value_formatters=None):
+        """
+        :param event_abi: the abi of the event
+        :param key_formatters: a dict of argument name to the name to output it as
+        :param value_formatters: a dict of argument name to a function formatting its value
+        """
+        key_formatters = key_formatters or {}
+        value_formatters = value_formatters or {}
+        self.event_name = event_abi['name']
+        self.anonymous = event_abi.get('anonymous', False)
+
+        indexed = [arg for arg in event_abi['inputs'] if arg['indexed']]
+        not_indexed = [arg for arg in event_abi['inputs'] if not arg['indexed']]
+        # (abi type, output name, topic position or None, has a custom formatter) by abi name and by output name
+        self._args = {}
+        for position, arg in enumerate(indexed + not_indexed):
+            spec = (arg['type'], key_formatters.get(arg['name'], arg['name']),
+                    position if arg['indexed'] else None, arg['name'] in value_formatters)
+            self._args[arg['name']] = self._args[spec[1]] = spec
+        self._topic_types = [_topic_type(arg['type']) for arg in indexed]
+        self._data_types = [arg['type'] for arg in not_indexed]
+        # (output name, formatter or None) of each argument, indexed arguments first
+        self._fields = [(key_formatters.get(arg['name'], arg['name']),
+                         _compile_value_formatter(topic_type, value_formatters.get(arg['name'])))
+                        for arg, topic_type in zip(indexed, self._topic_types)]
+        self._fields += [(key_formatters.get(arg['name'], arg['name']),
+                          _compile_value_formatter(arg['type'], value_formatters.get(arg['name'])))
+                         for arg in not_indexed]
+
+    def compile_filters(self, argument_filters):
+        """
+        Splits argument filters into log topics for the indexed arguments and filters applied to decoded events
+        :param argument_filters: a dict of argument name (as in the abi or as output) to a formatted value or a list of
+                accepted formatted values, for example {'eventType': '5012435b1002cec631930c670a6f948cfdff98ef'}
+        :return: a tuple of the list of topic filters following the event topic (None matching any value), and a dict
+                of output argument name to the list of accepted formatted values, or None if an argument doesn't exist
+        """
+        topics = [None] * len(self._topic_types)
+        local_filters = {}
+        for name, values in argument_filters.items():
+            if name not in self._args:
+                return None
+            abi_type, output_name, position, custom_formatter = self._args[name]
+            values = list(values) if isinstance(values, (list, tuple, set)) else [values]
+            if not custom_formatter:
+                values = [_normalize_filter_value(abi_type, position is not None, value) for value in values]
+                if position is not None:
+                    topics[position] = [_encode_topic(abi_type, value) for value in values]
+            local_filters[output_name] = values
+
+        # Trailing wildcards can be left out
+        while topics and topics[-1] is None:
+            topics.pop()
+        return topics, local_filters
+
+    def decode_args(self, log):
+        """
+        Decodes and formats the arguments of a log
+        :param log: a log entry as returned by eth_getLogs
+        :return: a dict of formatted argument name to formatted value
+        """
+        topics = log['topics'] if self.anonymous else log['topics'][1:]
+        values = [decode_single(topic_type, bytes(topic)) for topic_type, topic in zip(self._topic_types, topics)]
+        if self._data_types:
+            data = log['data']
+            values += decode_abi(self._data_types, to_bytes(hexstr=data) if isinstance(data, str) else bytes(data))
+
+        return {name: formatter(value) if formatter is not None else value
+                for (name, formatter), value in zip(self._fields, values)}
+
+
+class EventRecord(object):
+    """A decoded event, using less memory than the equivalent dict"""
+    __slots__ = ('transaction', 'block_number', 'block_timestamp', 'event', 'event_args')
+
+    def __init__(self, transaction, block_number, block_timestamp, event, event_args):
+        self.transaction = transaction
+        self.block_number = block_number
+        self.block_timestamp = block_timestamp
+        self.event = event
+        self.event_args = event_args
+
+    @classmethod
+    def from_dict(cls, event):
+        return cls(event['transaction'], event['block_number'], event['block_timestamp'], event['event'],
+                   event['event_args'])
+
+    @property
+    def block_datetime(self):
+        return datetime.utcfromtimestamp(self.block_timestamp)
+
+    def to_dict(self):
+        """The event as returned by get_events"""
+        return {
+            "transaction": self.transaction,
+            "block_number": self.block_number,
+            "block_timestamp": self.block_timestamp,
+            "block_datetime": self.block_datetime,
+            "event": self.event,
+            "event_args": self.event_args
+        }
+
+    def __eq__(self, other):
+        return isinstance(other, EventRecord) and all(getattr(self, name) == getattr(other, name)
+                                                      for name in self.__slots__)
+
+    def __repr__(self):
+        return "<EventRecord %s block %s tx %s>" % (self.event, self.block_number, self.transaction)
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+    devise.file_cache
+    ~~~~~~~~~~~~~~~~~~~~~~~~~
+    A content-addressed cache of downloaded files. Files are stored under their SHA1 hash, which identifies their
+    content, so a cached file never needs to be downloaded again. The cache is bounded in size by evicting the least
+    recently used files.
+
+    :copyright: © 2018 Pit.AI
+    :license: GPLv3, see LICENSE for more details.
+"""
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+
+from .remote_config import get_cache_dir
+
+# Maximum number of bytes kept in the file cache before evicting the least recently used files
+FILE_CACHE_SIZE = int(os.environ.get("DEVISE_FILE_CACHE_SIZE", 2 * 1024 ** 3))
+
+_SHA1_PATTERN = re.compile(r'^[0-9a-fA-F]{40}$')
+
+_FILE_CACHE = None
+_LOCK = threading.Lock()
+
+logger = logging.getLogger(__name__)
+
+
+def _remove(path):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+class FileCache(object):
+    """
+    A directory of files named after the SHA1 hash of their content.
+
+    Entries are inserted atomically, so readers in other threads or processes never see a partial file. Their
+    modification time records when they were last used, and the least recently used entries are evicted once the
+    cache exceeds max_size bytes.
+    """
+
+    def __init__(self, path=None, max_size=FILE_CACHE_SIZE):
+        """
+        :param path: The cache directory, defaults to "files" in the Devise cache directory
+        :param max_size: The maximum number of bytes kept in the cache
+        """
+        self.path = os.path.abspath(path or os.path.join(get_cache_dir(), 'files'))
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        os.makedirs(self.path, exist_ok=True)
+
+    def _entry_path(self, content_hash):
+        # The hash names a file in the cache directory, never let it name one elsewhere
+        if not isinstance(content_hash, str) or not _SHA1_PATTERN.match(content_hash):
+            raise ValueError("Hash provided must be a valid sha1 hash: %r" % (content_hash,))
+        return os.path.join(self.path, content_hash.lower())
+
+    def temp_path(self):
+        """Returns a new path in the cache directory to download a file to before inserting it"""
+        return os.path.join(self.path, uuid.uuid4().hex + '.tmp')
+
+    def contains(self, content_hash):
+        return os.path.exists(self._entry_path(content_hash))
+
+    def insert(self, content_hash, file_path):
+        """
+        Moves a file into the cache, evicting the least recently used files if the cache is full
+        :param content_hash: The SHA1 hash of the file's content, verified by the caller
+        :param file_path: The file to insert, moved into the cache, ideally on the cache's file system
+        """
+        entry_path = self._entry_path(content_hash)
+        if os.path.dirname(os.path.abspath(file_path)) != self.path:
+            # Copy to the cache's file system first so that the insert itself is atomic
+            tmp_path = self.temp_path()
+            shutil.copyfile(file_path, tmp_path)
+            os.unlink(file_path)
+            file_path = tmp_path
+        os.replace(file_path, entry_path)
+        self.evict(keep=entry_path)
+
+    def copy_to(self, content_hash, file_name, link=False):
+        """
+        Gets a copy of a cached file as file_name
+        :param content_hash: The SHA1 hash of the file's content
+        :param file_name: The destination path, replaced if it exists
+        :param link: If True, hard link file_name to the cache entry when possible instead of copying it. The file then
+                shares the entry's content and modification time: it must be replaced, never modified in place, or the
+                cache entry is corrupted.
+        :return: True if the file was in the cache, False otherwise
+        """
+        entry_path = self._entry_path(content_hash)
+        tmp_path = file_name + '.' + uuid.uuid4().hex + '.tmp'
+        try:
+            linked = False
+            if link:
+                try:
+                    os.link(entry_path, tmp_path)
+                    linked = True
+                except FileNotFoundError:
+                    raise
+                except OSError:
+                    # Different file systems or no hard link support
+                    pass
+            if not linked:
+                shutil.copyfile(entry_path, tmp_path)
+            os.replace(tmp_path, file_name)
+        except FileNotFoundError:
+            if os.path.exists(entry_path):
+                # The destination directory doesn't exist
+                raise
+            # Not cached, or evicted by another process while we were copying it
+            return False
+        finally:
+            _remove(tmp_path)
+
+        # Mark the entry as recently used
+        try:
+            os.utime(entry_path)
+        except OSError:
+            pass
+        return True
+
+    def evict(self, keep=None):
+        """
+        Removes the least recently used files until the cache fits in max_size bytes
+        :param keep: the path of an entry never evicted, such as the one just inserted
+        """
+        with self._lock:
+            entries = []
+            total_size = 0
+            now = time.time()
+            for entry in os.scandir(self.path):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                if len(entry.name) != 40:
+                    # Temporary files, the leftovers of interrupted downloads are removed once they're a day old
+                    if now - stat.st_mtime > 24 * 3600:
+                        _remove(entry.path)
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total_size += stat.st_size
+
+            for mtime, size, path in sorted(entries):
+                if total_size <= self.max_size:
+                    break
+                if path == keep:
+                    continue
+                logger.debug("Evicting %s from the file cache", path)
+                _remove(path)
+                total_size -= size
+
+
+def get_file_cache():
+    """Returns the file cache shared by all Devise clients"""
+    global _FILE_CACHE
+    if _FILE_CACHE is None:
+        with _LOCK:
+            if _FILE_CACHE is None:
+                _FILE_CACHE = FileCache()
+    return _FILE_CACHE
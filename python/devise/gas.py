@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+    devise.gas
+    ~~~~~~~~~~~~~~~~~~~~~~~~~
+    A shared gas price oracle which keeps a sliding window of the gas prices accepted in recent blocks, only fetching
+    the blocks mined since its last refresh, and serves gas price estimates from memory.
+
+    :copyright: © 2018 Pit.AI
+    :license: GPLv3, see LICENSE for more details.
+"""
+import collections
+import logging
+import threading
+import time
+import weakref
+
+from web3.providers import HTTPProvider
+
+from .batch import batch_request
+
+# Number of recent blocks sampled
+GAS_PRICE_SAMPLE_SIZE = 120
+# Percentile of the minimum gas price accepted in each sampled block, high enough to be mined within a few blocks
+GAS_PRICE_PERCENTILE = 75
+# Number of seconds between refreshes
+GAS_PRICE_REFRESH_INTERVAL = 15
+
+# Gas price oracles by web3 instance. They only hold their web3 instance weakly, so that they are dropped along with
+# it, and their refresh thread then ends
+_ORACLES = weakref.WeakKeyDictionary()
+_LOCK = threading.Lock()
+
+logger = logging.getLogger(__name__)
+
+
+class GasPriceOracle(object):
+    """
+    Estimates the gas price needed for a transaction to be mined quickly from the lowest gas price accepted in each
+    of the most recent blocks. For HTTP nodes the samples are refreshed by a background thread, which ends when
+    stop() is called or the web3 instance is garbage collected.
+    """
+
+    def __init__(self, w3, sample_size=GAS_PRICE_SAMPLE_SIZE, percentile=GAS_PRICE_PERCENTILE,
+                 refresh_interval=GAS_PRICE_REFRESH_INTERVAL):
+        """
+        :param w3: the Web3 instance to sample blocks from
+        :param sample_size: the number of recent blocks sampled
+        :param percentile: the percentile of the per block minimum gas prices used as the estimate
+        :param refresh_interval: the number of seconds between refreshes
+        """
+        self._w3 = weakref.ref(w3)
+        self.sample_size = sample_size
+        self.percentile = percentile
+        self.refresh_interval = refresh_interval
+        self._block_prices = collections.deque(maxlen=sample_size)
+        self._last_block = None
+        self._last_refresh = 0
+        self._thread = None
+        self._stop_event = threading.Event()
+        # _lock guards the samples and the thread, _refresh_lock serializes refreshes so that readers never wait on
+        # the node
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    @property
+    def w3(self):
+        w3 = self._w3()
+        if w3 is None:
+            raise ReferenceError("The web3 instance of this gas price oracle was garbage collected")
+        return w3
+
+    @property
+    def gas_price(self):
+        """The current gas price estimate in wei"""
+        refreshing = self._thread is not None and self._thread.is_alive()
+        if not refreshing and time.time() - self._last_refresh >= self.refresh_interval:
+            self.refresh()
+            self._start()
+
+        with self._lock:
+            prices = sorted(price for _, price in self._block_prices)
+        if not prices:
+            # No transactions in the sampled blocks, use the node's suggestion
+            return self.w3.eth.gasPrice
+        return prices[min(len(prices) - 1, len(prices) * self.percentile // 100)]
+
+    def gas_price_strategy(self, w3, transaction_params=None):
+        """A web3 gas price strategy serving the oracle's current estimate"""
+        return self.gas_price
+
+    def refresh(self):
+        """Samples the blocks mined since the last refresh"""
+        with self._refresh_lock:
+            latest_block = self.w3.eth.blockNumber
+            first_block = max(0, latest_block - self.sample_size + 1)
+            if self._last_block is not None:
+                first_block = max(first_block, self._last_block + 1)
+
+            block_numbers = list(range(first_block, latest_block + 1))
+            block_prices = []
+            if block_numbers:
+                blocks = batch_request(self.w3, [('eth_getBlockByNumber', [hex(block_number), True])
+                                                 for block_number in block_numbers])
+                for block_number, block in zip(block_numbers, blocks):
+                    gas_prices = [int(tx['gasPrice'], 16) for tx in (block or {}).get('transactions', [])]
+                    if gas_prices:
+                        block_prices.append((block_number, min(gas_prices)))
+
+            with self._lock:
+                self._block_prices.extend(block_prices)
+                # Only blocks with transactions are sampled, drop the ones which aren't recent anymore on quiet chains
+                while self._block_prices and self._block_prices[0][0] <= latest_block - self.sample_size:
+                    self._block_prices.popleft()
+            if block_numbers:
+                self._last_block = latest_block
+            self._last_refresh = time.time()
+
+    def stop(self, timeout=None):
+        """Stops refreshing in the background, the estimate is then refreshed on demand"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _start(self):
+        """Starts refreshing in the background, only for HTTP nodes which can safely be queried from other threads"""
+        if self._thread is not None or self._stop_event.is_set() or not isinstance(self.w3.providers[0], HTTPProvider):
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='devise-gas-price-oracle', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._stop_event.wait(self.refresh_interval):
+            if self._w3() is None:
+                # The web3 instance is gone, nothing will ask for estimates anymore
+                return
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.warning("Could not refresh gas prices: %s", e)
+
+
+def get_gas_price_oracle(w3):
+    """Returns the gas price oracle shared by every client using the web3 instance w3"""
+    with _LOCK:
+        oracle = _ORACLES.get(w3)
+        if oracle is None:
+            oracle = GasPriceOracle(w3)
+            _ORACLES[w3] = oracle
+    return oracle
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""
+    devise.hashing
+    ~~~~~~~~~~~~~~~~~~~~~~~~~
+    File hashing at disk speed: files are read in large blocks into a reused buffer, and many files are hashed
+    concurrently by a thread pool, which scales since hashlib releases the GIL while hashing large blocks.
+
+    :copyright: © 2018 Pit.AI
+    :license: GPLv3, see LICENSE for more details.
+"""
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# Number of bytes read from a file and hashed at once
+HASH_BUFFER_SIZE = 1024 * 1024
+# Number of files hashed concurrently by hash_files
+HASH_WORKERS = int(os.environ.get("DEVISE_HASH_WORKERS", min(8, os.cpu_count() or 1)))
+
+
+def hash_file(file_name, algorithm='sha1', buffer_size=HASH_BUFFER_SIZE):
+    """
+    Calculates the hash of a file's content
+    :param file_name: the path of the file to hash
+    :param algorithm: the name of a hashlib algorithm
+    :param buffer_size: the number of bytes read at once
+    :return: the hex digest of the file's content
+    """
+    digest = hashlib.new(algorithm)
+    buffer = bytearray(buffer_size)
+    view = memoryview(buffer)
+    # Unbuffered reads straight into our buffer, without a copy or an allocation per block
+    with open(file_name, 'rb', buffering=0) as f:
+        while True:
+            size = f.readinto(buffer)
+            if not size:
+                break
+            digest.update(view[:size])
+    return digest.hexdigest()
+
+
+def hash_files(file_names, algorithm='sha1', max_workers=HASH_WORKERS):
+    """
+    Calculates the hashes of many files concurrently
+    :param file_names: the paths of the files to hash
+    :param algorithm: the name of a hashlib algorithm
+    :param max_workers: the number of files hashed concurrently
+    :return: the hex digests of the files' content, in the order of file_names
+    """
+    file_names = list(file_names)
+    if len(file_names) <= 1 or max_workers <= 1:
+        return [hash_file(file_name, algorithm) for file_name in file_names]
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(file_names))) as executor:
+        return list(executor.map(lambda file_name: hash_file(file_name, algorithm), file_names))
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+    devise.http
+    ~~~~~~~~~~~~~~~~~~~~~~~~~
+    The HTTP transport shared by all Devise traffic: a requests session with a keep-alive connection pool per host
+    and retries with exponential backoff for idempotent requests, and a web3 HTTP provider sending JSON-RPC requests
+    through it.
+
+    :copyright: © 2018 Pit.AI
+    :license: GPLv3, see LICENSE for more details.
+"""
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+from web3.providers import HTTPProvider
+
+# Maximum number of connections kept alive per host
+HTTP_POOL_SIZE = int(os.environ.get("DEVISE_HTTP_POOL_SIZE", 10))
+# Number of retries of failed connections and idempotent requests
+HTTP_RETRIES = int(os.environ.get("DEVISE_HTTP_RETRIES", 3))
+# Retries wait backoff_factor * 2 ^ (retry number - 1) seconds
+HTTP_BACKOFF_FACTOR = float(os.environ.get("DEVISE_HTTP_BACKOFF_FACTOR", 0.5))
+# Default timeout in seconds of JSON-RPC requests, same as web3's
+RPC_TIMEOUT = 10
+
+_SESSION = None
+_LOCK = threading.Lock()
+
+
+def create_session(pool_size=HTTP_POOL_SIZE, retries=HTTP_RETRIES, backoff_factor=HTTP_BACKOFF_FACTOR):
+    """
+    Creates a requests session with a connection pool and retries
+    :param pool_size: the maximum number of connections kept alive per host
+    :param retries: the number of retries of failed connections, and of idempotent requests (GET, HEAD, etc.)
+            answered with a server error
+    :param backoff_factor: the base delay between retries in seconds
+    """
+    # Only idempotent methods are retried on read errors and server errors (urllib3's default method whitelist)
+    retry = Retry(total=retries, backoff_factor=backoff_factor, status_forcelist=(500, 502, 503, 504),
+                  raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def get_session():
+    """Returns the requests session shared by all Devise HTTP traffic"""
+    global _SESSION
+    if _SESSION is None:
+        with _LOCK:
+            if _SESSION is None:
+                _SESSION = create_session()
+    return _SESSION
+
+
+def configure_session(**kwargs):
+    """
+    Replaces the shared session, for example to change its pool size
+    :param kwargs: see create_session
+    """
+    global _SESSION
+    session = create_session(**kwargs)
+    with _LOCK:
+        _SESSION = session
+    return session
+
+
+def post_rpc(provider, request_data):
+    """
+    Posts an encoded JSON-RPC request to an HTTP provider's node through the shared session
+    :param provider: an HTTPProvider
+    :param request_data: the encoded request body
+    :return: the raw response body
+    """
+    kwargs = dict(provider.get_request_kwargs())
+    kwargs.setdefault('timeout', RPC_TIMEOUT)
+    response = get_session().post(provider.endpoint_uri, data=request_data, **kwargs)
+    response.raise_for_status()
+    return response.content
+
+
+class PooledHTTPProvider(HTTPProvider):
+    """An HTTPProvider sending its requests through the shared Devise session"""
+
+    def make_request(self, method, params):
+        request_data = self.encode_rpc_request(method, params)
+        return self.decode_rpc_response(post_rpc(self, request_data))
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+    devise.key_cache
+    ~~~~~~~~~~~~~~~~~~~~~~~~~
+    Opt-in in memory cache of a private key decrypted from an encrypted json keystore file, so that bursts of
+    transactions and signed API requests only pay for the key derivation function once.
+
+    :copyright: © 2018 Pit.AI
+    :license: GPLv3, see LICENSE for more details.
+"""
+import threading
+import time
+
+
+class DecryptedKeyCache(object):
+    """
+    Holds a decrypted private key for at most ttl seconds. The key is kept in a mutable buffer which is overwritten
+    with zeros when it expires or when the cache is locked.
+
+    This only wipes the cache's own buffer: get() returns an immutable hex string copy of the key, as do the signing
+    functions it is passed to, and those copies stay in memory until the garbage collector reclaims them. Expiry stops
+    the cache from handing out the key, it doesn't guarantee that no copy of the key remains in the process.
+    """
+
+    def __init__(self, ttl):
+        """
+        :param ttl: the number of seconds a decrypted key is kept in memory
+        """
+        assert ttl > 0, "The key cache ttl must be a positive number of seconds"
+        self.ttl = ttl
+        self._key = None
+        self._expires_at = 0
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """
+        Returns a copy of the cached private key as a hex string without the 0x prefix, or None if not cached or
+        expired. The copy is immutable and not wiped by the cache.
+        """
+        with self._lock:
+            if self._key is None:
+                return None
+            if time.time() >= self._expires_at:
+                self._zeroize()
+                return None
+            return bytes(self._key).hex()
+
+    def set(self, private_key):
+        """
+        Caches a private key for ttl seconds
+        :param private_key: the private key as a hex string, with or without the 0x prefix
+        """
+        private_key = private_key[2:] if private_key.startswith('0x') else private_key
+        with self._lock:
+            self._zeroize()
+            self._key = bytearray(bytes.fromhex(private_key))
+            self._expires_at = time.time() + self.ttl
+            # Make sure the key is wiped at expiry even if it is never read again
+            self._timer = threading.Timer(self.ttl, self.lock)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def lock(self):
+        """Wipes the cached key from memory"""
+        with self._lock:
+            self._zeroize()
+
+    def _zeroize(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._key is not None:
+            for idx in range(len(self._key)):
+                self._key[idx] = 0
+            self._key = None
+        self._expires_at = 0
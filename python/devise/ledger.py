@@ -1,20 +1,39 @@
 # References:
 # https://github.com/LedgerHQ/blue-app-eth
 # https://github.com/bargst/pyethoff
+import json
+import logging
+import os
 import struct
 
 from ledgerblue.comm import getDongle
 
+from .remote_config import get_cache_dir
+
 ETHEREUM_PATH_PREFIX = "44'/60'/0'/"
 CHUNK_SIZE = 150
+# Number of addresses queried from the device between two saves of the index file when scanning for an address
+SCAN_BATCH_SIZE = 10
+
+logger = logging.getLogger(__name__)
 
 
 class LedgerWallet:
     """
+    Signs transactions with a Ledger hardware wallet. The HD index of each address seen on a device is remembered on
+    disk so that signing with a known address doesn't require scanning the device's addresses.
     """
 
-    def __init__(self):
+    def __init__(self, index_path=None):
+        """
+        :param index_path: the path of the json file mapping addresses to HD indices, defaults to ledger_index.json in
+                the Devise cache directory
+        """
         self.dongle = getDongle(debug=False)
+        self._index_path = index_path
+        self._device_id = None
+        self._indices = None
+        self._verified = set()
 
     def _parse_bip32_path(self, account_index):
         """
@@ -81,17 +100,91 @@ class LedgerWallet:
 
         return '0x' + address.decode()
 
+    def get_addresses(self, account_indices):
+        """
+        Query the ledger device for the addresses at several indices of the HD wallet tree, remembering them
+        :param account_indices: an iterable of account indices, for example range(0, 20)
+        :return: a list of addresses in the same order as account_indices
+        """
+        indices = self._load_indices()
+        addresses = []
+        for account_index in account_indices:
+            address = self.get_address(account_index)
+            indices[address.lower()] = account_index
+            self._verified.add(address.lower())
+            addresses.append(address)
+        self._save_indices()
+        return addresses
+
     def get_account_index(self, address):
         """
         Convert an address to an account index
         """
+        address = address.lower()
+        indices = self._load_indices()
+        account_index = indices.get(address)
+        if account_index is not None:
+            # Make sure the remembered index still matches, for example if the device was reset
+            if address in self._verified or self.get_address(account_index).lower() == address:
+                self._verified.add(address)
+                return account_index
+            indices.clear()
+            indices[self._get_device_id()] = 0
+
+        # Scan the indices we haven't seen yet from the first one until we find the address, remembering the addresses
+        # found on the way and saving them once per batch
+        known_indices = set(indices.values())
         account_index = 0
-        status = address != self.get_address(account_index)
-        while status:
+        probes = 0
+        while True:
+            if account_index not in known_indices:
+                found = self.get_address(account_index).lower()
+                indices[found] = account_index
+                self._verified.add(found)
+                probes += 1
+                if found == address or probes % SCAN_BATCH_SIZE == 0:
+                    self._save_indices()
+                if found == address:
+                    return account_index
             account_index += 1
-            status = address != self.get_address(account_index)
 
-        return account_index
+    def _get_device_id(self):
+        """Identifies the device by its first address"""
+        if self._device_id is None:
+            self._device_id = self.get_address(0).lower()
+            self._verified.add(self._device_id)
+        return self._device_id
+
+    @property
+    def index_path(self):
+        if self._index_path is None:
+            self._index_path = os.path.join(get_cache_dir(), 'ledger_index.json')
+        return self._index_path
+
+    def _read_index_file(self):
+        try:
+            with open(self.index_path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _load_indices(self):
+        """Returns the address to index mapping of the connected device"""
+        if self._indices is None:
+            self._indices = self._read_index_file().get(self._get_device_id(), {})
+            self._indices[self._get_device_id()] = 0
+        return self._indices
+
+    def _save_indices(self):
+        all_indices = self._read_index_file()
+        all_indices[self._get_device_id()] = self._indices
+        tmp_path = "%s.%s.tmp" % (self.index_path, os.getpid())
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(all_indices, f)
+            os.replace(tmp_path, self.index_path)
+        except OSError as e:
+            logger.warning("Could not save the Ledger address indices: %s", e)
 
     def sign(self, rlp_encoded_tx, account_index=None, address=''):
         """
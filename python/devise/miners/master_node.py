@@ -28,6 +28,43 @@ class MasterNode(BaseDeviseClient):
         """
         # Make sure we are running this as the owner of the clients contract
         assert self.account in self.get_master_nodes(), "address %s is not a master node!" % self.account
+        # Build a transaction dictionary with the optional gas_price and nonce
+        transaction = {"from": self.account}
+        if gas_price is not None:
+            transaction["gasPrice"] = gas_price
+        # execute transaction
+        return self._transact(
+            self._get_add_lepton_call(lepton_hash, previous_lepton_hash, incremental_usefulness), transaction)
+
+    def add_leptons(self, leptons, gas_price=None):
+        """
+        Add several leptons to the block chain, submitting all the transactions back to back before waiting for them
+        to be mined
+        :param leptons a list of (lepton_hash, previous_lepton_hash, incremental_usefulness) tuples, in chain order
+        :param gas_price the gas price to use for these transactions
+        :return: a list of booleans, True for each lepton successfully added
+        """
+        # Make sure we are running this as the owner of the clients contract
+        assert self.account in self.get_master_nodes(), "address %s is not a master node!" % self.account
+        submitted = []
+        gas_limit = None
+        for lepton_hash, previous_lepton_hash, incremental_usefulness in leptons:
+            function_call = self._get_add_lepton_call(lepton_hash, previous_lepton_hash, incremental_usefulness)
+            transaction = {"from": self.account}
+            if gas_price is not None:
+                transaction["gasPrice"] = gas_price
+            # Leptons after the first one can't be estimated until the previous one is mined, they use the same
+            # gas limit as the first one
+            if gas_limit is not None:
+                transaction["gas"] = gas_limit
+            tx_hash, transaction = self._send_transaction(function_call, transaction)
+            gas_limit = transaction["gas"]
+            submitted.append((tx_hash, transaction))
+
+        return self._wait_for_transactions(submitted)
+
+    def _get_add_lepton_call(self, lepton_hash, previous_lepton_hash, incremental_usefulness):
+        """Validates the lepton and builds the addLepton contract function call"""
         # Convert the iu to int based on our precision setting
         contract_iu = int(incremental_usefulness * IU_PRECISION)
         # validate the hashes
@@ -36,14 +73,9 @@ class MasterNode(BaseDeviseClient):
             previous_lepton_hash) == 40, "previous_lepton_hash must be a sha1 hash encoded as a 40 character hex string"
         if previous_lepton_hash is None:
             previous_lepton_hash = '00'
-        # Build a transaction dictionary with the optional gas_price and nonce
-        transaction = {"from": self.account}
-        if gas_price is not None:
-            transaction["gasPrice"] = gas_price
-        # execute transaction
-        return self._transact(self._rental_contract.functions.addLepton(
-            bytes.fromhex(lepton_hash), bytes.fromhex(previous_lepton_hash), contract_iu), transaction)
+        return self._rental_contract.functions.addLepton(
+            bytes.fromhex(lepton_hash), bytes.fromhex(previous_lepton_hash), contract_iu)
 
     def get_master_nodes(self):
         """returns a list of all authorized master nodes"""
-        return self._rental_contract.functions.getMasterNodes().call()
+        return self._call(self._rental_contract.functions.getMasterNodes())
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""
+    devise.nonce
+    ~~~~~~~~~~~~~~~~~~~~~~~~~
+    Local transaction nonce management, so that one account can have several transactions in flight.
+
+    :copyright: © 2018 Pit.AI
+    :license: GPLv3, see LICENSE for more details.
+"""
+import threading
+import weakref
+
+# Nonce managers by web3 instance and address. They only hold their web3 instance weakly, so that they are dropped
+# along with it
+_MANAGERS = weakref.WeakKeyDictionary()
+_LOCK = threading.Lock()
+
+
+class NonceManager(object):
+    """
+    Hands out consecutive nonces for an account locally. The next nonce is synchronized with the node's pending
+    transaction count on first use and after every resync(), which should be called whenever a transaction could not
+    be submitted with the nonce it was given.
+    """
+
+    def __init__(self, w3, address):
+        self._w3 = weakref.ref(w3)
+        self.address = address
+        self._next_nonce = None
+        self._lock = threading.Lock()
+
+    @property
+    def w3(self):
+        w3 = self._w3()
+        if w3 is None:
+            raise ReferenceError("The web3 instance of this nonce manager was garbage collected")
+        return w3
+
+    def next_nonce(self):
+        """Reserves and returns the next nonce for this account"""
+        with self._lock:
+            if self._next_nonce is None:
+                self._next_nonce = self.w3.eth.getTransactionCount(self.address, 'pending')
+            nonce = self._next_nonce
+            self._next_nonce += 1
+            return nonce
+
+    def resync(self):
+        """Discards the local nonce so that the next one is read from the node's pending transaction count"""
+        with self._lock:
+            self._next_nonce = None
+
+
+def get_nonce_manager(w3, address):
+    """Returns the nonce manager shared by every client sending transactions from address through w3"""
+    with _LOCK:
+        managers = _MANAGERS.setdefault(w3, {})
+        manager = managers.get(address)
+        if manager is None:
+            manager = NonceManager(w3, address)
+            managers[address] = manager
+    return manager
@@ -11,11 +11,10 @@ import hashlib
 import json
 from json import JSONDecodeError
 
-import requests
-
 from devise.base import costs_gas, BaseDeviseClient
 from devise.clients.contract import USD_PRECISION
 from devise.clients.token import TOKEN_PRECISION
+from devise.http import get_session
 
 EVENT_TYPES = {
     "LATEST_WEIGHTS_UPDATED": "LatestWeightsUpdated"
@@ -29,32 +28,32 @@ class DeviseOwner(BaseDeviseClient):
 
     @property
     def implementation(self):
-        return self._rental_proxy_contract.functions.implementation().call()
+        return self._call(self._rental_proxy_contract.functions.implementation())
 
     @property
     def impl_version(self):
-        return self._rental_proxy_contract.functions.version().call()
+        return self._call(self._rental_proxy_contract.functions.version())
 
     def get_all_implementations(self):
-        [impl_history, ver_history] = self._rental_proxy_contract.functions.getAllImplementations().call()
+        [impl_history, ver_history] = self._call(self._rental_proxy_contract.functions.getAllImplementations())
         history = [{"ver": _ver, "impl": _impl} for _ver, _impl in zip(ver_history, impl_history)]
         return history
 
     def get_master_nodes(self):
         """returns a list of all authorized master nodes"""
-        return self._rental_contract.functions.getMasterNodes().call()
+        return self._call(self._rental_contract.functions.getMasterNodes())
 
     def get_rate_setter(self):
-        return self._rental_contract.functions.rateSetter().call()
+        return self._call(self._rental_contract.functions.rateSetter())
 
     def get_audit_updater(self):
-        return self._audit_contract.functions.auditUpdater().call()
+        return self._call(self._audit_contract.functions.auditUpdater())
 
     def get_escrow_history(self):
-        return self._rental_contract.functions.getEscrowHistory().call()
+        return self._call(self._rental_contract.functions.getEscrowHistory())
 
     def get_revenue_history(self):
-        return self._rental_contract.functions.getRevenueHistory().call()
+        return self._call(self._rental_contract.functions.getRevenueHistory())
 
     @costs_gas
     def set_historical_data_fee(self, tokens):
@@ -154,4 +153,4 @@ class DeviseOwner(BaseDeviseClient):
             transaction)
 
     def _get_eth_usd_price(self):
-        return json.loads(requests.get('https://api.gdax.com/products/ETH-USD/ticker').text).get("price", None)
+        return json.loads(get_session().get('https://api.gdax.com/products/ETH-USD/ticker').text).get("price", None)
@@ -49,9 +49,9 @@ class DeviseTokenOwner(DeviseToken):
         :return: An array of minter addresses
         """
         minters = []
-        n = self._token_contract.functions.getNumberOfMinters().call({"from": self.address})
+        n = self._call(self._token_contract.functions.getNumberOfMinters(), {"from": self.address})
         for i in range(n):
-            minter = self._token_contract.functions.getMinter(i).call({"from": self.address})
+            minter = self._call(self._token_contract.functions.getMinter(i), {"from": self.address})
             minters.append(minter)
 
         return minters
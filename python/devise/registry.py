@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+    devise.registry
+    ~~~~~~~~~~~~~~~~~~~~~~~~~
+    Process wide registry of the contract ABIs and web3 contract objects, so that the json ABI files are parsed once
+    and contract objects are built once no matter how many clients are created.
+
+    :copyright: © 2018 Pit.AI
+    :license: GPLv3, see LICENSE for more details.
+"""
+import json
+import os
+import threading
+
+from eth_utils import event_abi_to_log_topic
+
+_ABI_CACHE = {}
+_EVENT_ABI_CACHE = {}
+# Contract registries by web3 instance. The contract objects hold their web3 instance, so a registry lives as long as
+# the process, like the web3 instances shared per node url by the clients
+_REGISTRIES = {}
+_LOCK = threading.RLock()
+
+
+def get_contract_abi(contract_name):
+    """
+    Reads the json abi files for the contract specified, parsing each file only once per process
+    :param contract_name: the name of the contract (for example DeviseRentalImpl)
+    :return: the parsed abi as a list of dicts
+    """
+    abi = _ABI_CACHE.get(contract_name)
+    if abi is None:
+        with _LOCK:
+            abi = _ABI_CACHE.get(contract_name)
+            if abi is None:
+                current_dir = os.path.dirname(os.path.realpath(__file__))
+                abi_path = os.path.join(current_dir, 'abi', contract_name + '.json')
+                with open(abi_path, 'r') as abi_file:
+                    abi = json.load(abi_file)
+                _ABI_CACHE[contract_name] = abi
+    return abi
+
+
+def get_event_abis(contract_name):
+    """
+    Returns the event lookup tables for a contract
+    :param contract_name: the name of the contract (for example DeviseRentalImpl)
+    :return: a tuple of two dicts: event name to event abi, and log topic to event abi
+    """
+    tables = _EVENT_ABI_CACHE.get(contract_name)
+    if tables is None:
+        with _LOCK:
+            tables = _EVENT_ABI_CACHE.get(contract_name)
+            if tables is None:
+                events = [item for item in get_contract_abi(contract_name) if item.get('type') == 'event']
+                by_name = {event['name']: event for event in events}
+                by_topic = {event_abi_to_log_topic(event): event for event in events}
+                tables = (by_name, by_topic)
+                _EVENT_ABI_CACHE[contract_name] = tables
+    return tables
+
+
+class ContractRegistry(object):
+    """
+    The contract objects built for one web3 instance, keyed by (network_id, contract name, address)
+    """
+
+    def __init__(self, w3):
+        self.w3 = w3
+        self._contracts = {}
+
+    def get_contract(self, network_id, contract_name, address):
+        """
+        Returns the web3 contract object for the contract deployed at address, building it on first use
+        :param network_id: the id of the network the contract is deployed to
+        :param contract_name: the name of the contract abi to use (for example DeviseRentalImpl)
+        :param address: the address of the deployed contract
+        """
+        key = (network_id, contract_name, address)
+        contract = self._contracts.get(key)
+        if contract is None:
+            with _LOCK:
+                contract = self._contracts.get(key)
+                if contract is None:
+                    contract = self.w3.eth.contract(address=address, abi=get_contract_abi(contract_name))
+                    self._contracts[key] = contract
+        return contract
+
+
+def get_contract_registry(w3):
+    """Returns the contract registry shared by every client using the web3 instance w3"""
+    with _LOCK:
+        registry = _REGISTRIES.get(w3)
+        if registry is None:
+            registry = ContractRegistry(w3)
+            _REGISTRIES[w3] = registry
+    return registry
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+    devise.remote_config
+    ~~~~~~~~~~~~~~~~~~~~~~~~~
+    Lazily resolves the Devise configuration (contract addresses, nodes and API roots) published on our CDN.
+    The configuration is only fetched the first time a value is needed, is cached on disk with a TTL and revalidated
+    with ETags, and falls back to the static values in devise.config when the CDN cannot be reached.
+
+    :copyright: © 2018 Pit.AI
+    :license: GPLv3, see LICENSE for more details.
+"""
+import json
+import logging
+import os
+import threading
+import time
+
+import requests
+
+from . import config
+from .http import get_session
+
+CDN_ROOT = 'https://config.devisefoundation.org/config.json'
+CONFIG_TTL = int(os.environ.get("DEVISE_CONFIG_TTL", 3600))
+CONFIG_TIMEOUT = 10
+
+logger = logging.getLogger(__name__)
+
+
+def get_cache_dir():
+    """Returns the directory where Devise caches data on disk, creating it if needed"""
+    cache_dir = os.environ.get("DEVISE_CACHE_DIR", os.path.join(os.path.expanduser('~'), '.devise', 'cache'))
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+
+def get_static_config():
+    """Returns the static configuration shipped with this package in the same format as the CDN's config.json"""
+    return {
+        "CONTRACT_ADDRESSES": config.CONTRACT_ADDRESSES,
+        "NETWORK_TO_NODE": config.NETWORK_TO_NODE,
+        "API_ROOT_URL": config.API_ROOT_URL,
+        "EVENT_QUERY_NODES": config.EVENT_QUERY_NODES
+    }
+
+
+class RemoteConfig(object):
+    """
+    A lazily resolved, disk cached copy of the CDN configuration.
+    """
+
+    def __init__(self, url=CDN_ROOT, cache_path=None, ttl=CONFIG_TTL):
+        """
+        :param url: The url of the json configuration file
+        :param cache_path: The path of the on disk cache, defaults to config.json in the Devise cache directory
+        :param ttl: The number of seconds after which the cached configuration is revalidated with the CDN
+        """
+        self.url = url
+        self.ttl = ttl
+        self._cache_path = cache_path
+        self._config = None
+        # True when the CDN and the cache couldn't be read and the static values are used
+        self.static = False
+        self._lock = threading.Lock()
+
+    @property
+    def cache_path(self):
+        if self._cache_path is None:
+            self._cache_path = os.path.join(get_cache_dir(), 'config.json')
+        return self._cache_path
+
+    def get(self, key, default=None):
+        """Returns the top level configuration value for key, resolving the configuration if needed"""
+        return self.resolve().get(key, default)
+
+    def resolve(self):
+        """Returns the configuration dict, fetching it from the cache or the CDN on first use"""
+        if self._config is None:
+            with self._lock:
+                if self._config is None:
+                    self._config = self._load()
+        return self._config
+
+    def refresh(self):
+        """Forces the configuration to be revalidated on next use"""
+        with self._lock:
+            self._config = None
+            cached = self._read_cache()
+            if cached is not None:
+                cached["fetched_at"] = 0
+                self._write_cache(cached)
+
+    def _load(self):
+        cached = self._read_cache()
+        if cached is not None and time.time() - cached.get("fetched_at", 0) < self.ttl:
+            return cached["config"]
+
+        try:
+            return self._fetch(cached)
+        except (requests.RequestException, ValueError) as e:
+            if cached is not None:
+                logger.warning("Could not refresh the Devise configuration (%s), using cached values", e)
+                return cached["config"]
+            logger.warning("Could not fetch the Devise configuration (%s), using static values", e)
+            self.static = True
+            return get_static_config()
+
+    def _fetch(self, cached):
+        """Fetches the configuration from the CDN, revalidating the cached copy with its ETag if we have one"""
+        headers = {}
+        if cached is not None and cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+
+        resp = get_session().get(self.url, headers=headers, timeout=CONFIG_TIMEOUT)
+        if resp.status_code == 304 and cached is not None:
+            cached["fetched_at"] = time.time()
+            self._write_cache(cached)
+            return cached["config"]
+
+        resp.raise_for_status()
+        resp_json = resp.json()
+        self._write_cache({"etag": resp.headers.get("ETag"), "fetched_at": time.time(), "config": resp_json})
+        return resp_json
+
+    def _read_cache(self):
+        try:
+            with open(self.cache_path, 'r') as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(cached, dict) or "config" not in cached:
+            return None
+        return cached
+
+    def _write_cache(self, cached):
+        """Atomically replaces the on disk cache"""
+        tmp_path = "%s.%s.tmp" % (self.cache_path, os.getpid())
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(cached, f)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            logger.warning("Could not cache the Devise configuration: %s", e)
+
+
+class LazyConfigMapping(object):
+    """
+    A read only dict-like view over one top level key of a RemoteConfig, only resolved when accessed
+    """
+
+    def __init__(self, remote_config, key, transform=None):
+        """
+        :param remote_config: the RemoteConfig to read from
+        :param key: the top level configuration key
+        :param transform: an optional function deriving the mapping from the configuration value
+        """
+        self._remote_config = remote_config
+        self._key = key
+        self._transform = transform
+
+    def _resolve(self):
+        value = self._remote_config.get(self._key, {})
+        return self._transform(value) if self._transform is not None else value
+
+    def __getitem__(self, item):
+        return self._resolve()[item]
+
+    def __contains__(self, item):
+        return item in self._resolve()
+
+    def __iter__(self):
+        return iter(self._resolve())
+
+    def __len__(self):
+        return len(self._resolve())
+
+    def get(self, item, default=None):
+        return self._resolve().get(item, default)
+
+    def keys(self):
+        return self._resolve().keys()
+
+    def values(self):
+        return self._resolve().values()
+
+    def items(self):
+        return self._resolve().items()
+
+    def __repr__(self):
+        return repr(self._resolve())
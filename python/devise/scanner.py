@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+    devise.scanner
+    ~~~~~~~~~~~~~~~~~~~~~~~~~
+    Adaptive block range log scanner. Splits eth_getLogs queries over long block ranges into windows, shrinking a
+    window when the node rejects it (too many results, timeouts) and growing it while results are sparse, but never
+    back to a size the node rejected, optionally scanning several windows in parallel.
+
+    :copyright: © 2018 Pit.AI
+    :license: GPLv3, see LICENSE for more details.
+"""
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+# Default window sizes in number of blocks
+INITIAL_WINDOW = 20000
+MIN_WINDOW = 1
+MAX_WINDOW = 500000
+# Windows returning fewer logs than this are considered sparse and the next window is doubled
+SPARSE_THRESHOLD = 100
+
+# Fragments of the error messages nodes return when a log query covers too many blocks or results
+RANGE_ERROR_MARKERS = ('more than', 'too many', 'limit exceeded', 'size exceeded', 'timeout', 'timed out',
+                       'range too large', 'block range', '-32005')
+
+
+def is_range_error(error):
+    """Returns True if an eth_getLogs error means the block range should be narrowed"""
+    if isinstance(error, requests.exceptions.Timeout):
+        return True
+    if isinstance(error, ValueError):
+        message = str(error).lower()
+        return any(marker in message for marker in RANGE_ERROR_MARKERS)
+    return False
+
+
+class BlockRangeScanner(object):
+    """
+    Scans the logs matching a filter over a block range window by window.
+
+    Example Usage:
+        scanner = BlockRangeScanner(w3)
+        for from_block, to_block, logs in scanner.scan({'address': address, 'topics': [topic]}, 0, 6000000):
+            ...
+    """
+
+    def __init__(self, w3, initial_window=INITIAL_WINDOW, min_window=MIN_WINDOW, max_window=MAX_WINDOW,
+                 sparse_threshold=SPARSE_THRESHOLD, max_workers=1):
+        """
+        :param w3: the Web3 instance to query logs from
+        :param initial_window: the number of blocks of the first window
+        :param min_window: the smallest window, a range error on a window of this size is raised
+        :param max_window: the largest window
+        :param sparse_threshold: windows with fewer logs than this grow the next window
+        :param max_workers: the number of windows scanned in parallel, windows have a fixed size when > 1
+        """
+        self.w3 = w3
+        self.initial_window = initial_window
+        self.min_window = min_window
+        self.max_window = max_window
+        self.sparse_threshold = sparse_threshold
+        self.max_workers = max_workers
+
+    def scan(self, filter_params, from_block, to_block):
+        """
+        Scans a block range, yielding the logs of each window in block order
+        :param filter_params: the eth_getLogs filter, without fromBlock and toBlock
+        :param from_block: the first block to scan
+        :param to_block: the last block to scan (included), or 'latest'
+        :return: a generator of (window first block, window last block, list of raw logs)
+        """
+        if to_block == 'latest':
+            to_block = self.w3.eth.blockNumber
+        if from_block > to_block:
+            return
+
+        if self.max_workers > 1:
+            yield from self._scan_parallel(filter_params, from_block, to_block)
+        else:
+            yield from self._scan_adaptive(filter_params, from_block, to_block)
+
+    def _get_logs(self, filter_params, from_block, to_block):
+        params = dict(filter_params)
+        params.update({'fromBlock': from_block, 'toBlock': to_block})
+        return self.w3.eth.getLogs(params)
+
+    def _scan_adaptive(self, filter_params, from_block, to_block):
+        window = self.initial_window
+        # The smallest window the node rejected, the window never grows back to it
+        failed_window = None
+        start = from_block
+        while start <= to_block:
+            end = min(to_block, start + window - 1)
+            try:
+                logs = self._get_logs(filter_params, start, end)
+            except Exception as e:
+                if not is_range_error(e) or end == start or window <= self.min_window:
+                    raise
+                failed_window = min(failed_window or end - start + 1, end - start + 1)
+                window = max(self.min_window, (end - start + 1) // 2)
+                continue
+
+            yield start, end, logs
+            if len(logs) < self.sparse_threshold and (failed_window is None or window * 2 < failed_window):
+                window = min(self.max_window, window * 2)
+            start = end + 1
+
+    def _scan_window(self, filter_params, from_block, to_block):
+        """Scans a fixed window, splitting it in halves as long as the node rejects it"""
+        try:
+            return self._get_logs(filter_params, from_block, to_block)
+        except Exception as e:
+            if not is_range_error(e) or to_block - from_block + 1 <= self.min_window:
+                raise
+            middle = (from_block + to_block) // 2
+            return (self._scan_window(filter_params, from_block, middle) +
+                    self._scan_window(filter_params, middle + 1, to_block))
+
+    def _scan_parallel(self, filter_params, from_block, to_block):
+        windows = [(start, min(to_block, start + self.initial_window - 1))
+                   for start in range(from_block, to_block + 1, self.initial_window)]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            # Keep a bounded number of windows in flight and yield them in block order
+            pending = collections.deque()
+            windows = iter(windows)
+            for start, end in windows:
+                pending.append((start, end, executor.submit(self._scan_window, filter_params, start, end)))
+                if len(pending) >= 2 * self.max_workers:
+                    break
+            while pending:
+                start, end, future = pending.popleft()
+                logs = future.result()
+                next_window = next(windows, None)
+                if next_window is not None:
+                    pending.append(next_window + (executor.submit(self._scan_window, filter_params, *next_window),))
+                yield start, end, logs
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+"""
+    devise.subscription
+    ~~~~~~~~~~~~~~~~~~~~~~~~~
+    Live event subscriptions: follows new blocks and delivers each event once it has enough confirmations, retracting
+    events from blocks removed by a chain reorganization deeper than the confirmation depth. The cursor and the events
+    which may still need to be retracted are persisted after each event, so that a restarted subscription resumes
+    where it stopped.
+
+    :copyright: © 2018 Pit.AI
+    :license: GPLv3, see LICENSE for more details.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+
+from .blocks import FINALITY_DEPTH, get_chain_id
+from .events import EventRecord
+from .remote_config import get_cache_dir
+
+# Number of seconds between polls for new blocks
+POLL_INTERVAL = 2
+# Number of processed block hashes remembered to find where a reorganization forked
+REORG_HISTORY = 64
+
+logger = logging.getLogger(__name__)
+
+
+class EventSubscription(object):
+    """
+    Delivers the events of a client's contracts to a callback as blocks get confirmed.
+
+    The callback receives the same dicts as get_events returns. When a chain reorganization removes a block whose
+    events were already delivered, these events are delivered again with "removed": True, then the events of the new
+    blocks are delivered.
+
+    Each event is delivered once: the cursor advances after each callback, so when a callback raises, the next poll
+    resumes with the event it raised on.
+
+    Example Usage:
+        subscription = client.subscribe(['LeptonAdded', 'AuctionPriceSet'], print, confirmations=3)
+        ...
+        subscription.stop()
+    """
+
+    def __init__(self, client, event_names, callback, confirmations=FINALITY_DEPTH, poll_interval=POLL_INTERVAL,
+                 cursor_path=None):
+        """
+        :param client: the RentalContract client whose events to follow
+        :param event_names: the event names to deliver, or None for all the events
+        :param callback: the function called with each event
+        :param confirmations: the number of blocks mined on top of a block before its events are delivered
+        :param poll_interval: the number of seconds between polls for new blocks
+        :param cursor_path: the json file in which the cursor is persisted, defaults to a file per chain and event
+                names in the Devise cache directory
+        """
+        self.client = client
+        self.event_names = [event_names] if isinstance(event_names, str) else event_names
+        self.callback = callback
+        self.confirmations = confirmations
+        self.poll_interval = poll_interval
+        self._cursor_path = cursor_path
+        # (block number, block hash) of the last block processed by each poll, oldest first
+        self._processed = []
+        # The events delivered from the blocks in self._processed and self._pending, so that they can be retracted
+        self._delivered = []
+        # (block number, block hash, number of events delivered) of an interrupted batch of events
+        self._pending = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def cursor_path(self):
+        if self._cursor_path is None:
+            names = ",".join(sorted(self.event_names)) if self.event_names is not None else "*"
+            self._cursor_path = os.path.join(get_cache_dir(), 'subscription_%s_%s.json' % (
+                get_chain_id(self.client.w3), hashlib.sha1(names.encode('utf-8')).hexdigest()[:16]))
+        return self._cursor_path
+
+    def _load_cursor(self):
+        try:
+            with open(self.cursor_path, 'r') as cursor_file:
+                cursor = json.load(cursor_file)
+            self._processed = [tuple(block) for block in cursor["processed"]]
+            self._delivered = [EventRecord.from_dict(event).to_dict() for event in cursor.get("delivered", [])]
+            self._pending = tuple(cursor["pending"]) if cursor.get("pending") else None
+        except (OSError, ValueError, KeyError, TypeError):
+            self._processed = []
+            self._delivered = []
+            self._pending = None
+
+    def _save_cursor(self):
+        # block_datetime is derived from block_timestamp
+        delivered = [{key: value for key, value in event.items() if key != "block_datetime"}
+                     for event in self._delivered]
+        tmp_path = "%s.%s.tmp" % (self.cursor_path, os.getpid())
+        try:
+            with open(tmp_path, 'w') as cursor_file:
+                json.dump({"processed": self._processed, "delivered": delivered, "pending": self._pending},
+                          cursor_file)
+            os.replace(tmp_path, self.cursor_path)
+        except OSError as e:
+            logger.warning("Could not save the subscription cursor: %s", e)
+
+    def start(self):
+        """Starts following new blocks in a background thread"""
+        assert self._thread is None, "This subscription is already started"
+        self._load_cursor()
+        self._thread = threading.Thread(target=self._run, name='devise-event-subscription', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        """Stops following new blocks, waiting for the current poll to complete"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.poll()
+            except Exception as e:
+                logger.warning("Could not poll for new events: %s", e)
+            self._stop_event.wait(self.poll_interval)
+
+    def poll(self):
+        """Delivers the events of the blocks confirmed since the previous poll"""
+        w3 = self.client.w3
+        confirmed_block = w3.eth.blockNumber - self.confirmations
+        if confirmed_block < 0:
+            return
+
+        if not self._processed:
+            # First run, only deliver new events
+            self._processed = [(confirmed_block, w3.eth.getBlock(confirmed_block)['hash'].hex())]
+            self._save_cursor()
+
+        if self._pending is not None:
+            # A callback raised during the previous poll, complete its batch unless its blocks were reorganized
+            block_number, block_hash, delivered_count = self._pending
+            block = w3.eth.getBlock(block_number)
+            if block is not None and block['hash'].hex() == block_hash:
+                self._deliver(self._processed[-1][0] + 1, block_number, block_hash, delivered_count)
+            else:
+                self._pending = None
+
+        from_block = self._rewind_reorganization() + 1
+        if from_block <= confirmed_block:
+            self._deliver(from_block, confirmed_block, w3.eth.getBlock(confirmed_block)['hash'].hex())
+
+        # Forget the blocks too old to be reorganized
+        del self._processed[:-REORG_HISTORY]
+        oldest_block = self._processed[0][0]
+        self._delivered = [event for event in self._delivered if event["block_number"] > oldest_block]
+        self._save_cursor()
+
+    def _deliver(self, from_block, to_block, block_hash, skip=0):
+        """
+        Delivers the events of a range of blocks, saving the cursor after each event
+        :param block_hash: the hash of to_block
+        :param skip: the number of events of the range already delivered
+        """
+        events = list(self.client.iter_events(self.event_names, from_block=from_block, to_block=to_block))
+        self._pending = (to_block, block_hash, skip)
+        for index in range(skip, len(events)):
+            self.callback(events[index])
+            self._delivered.append(events[index])
+            self._pending = (to_block, block_hash, index + 1)
+            self._save_cursor()
+        self._processed.append((to_block, block_hash))
+        self._pending = None
+        self._save_cursor()
+
+    def _rewind_reorganization(self):
+        """
+        Finds the last processed block still in the chain, retracting the events delivered from the blocks after it
+        :return: the number of the last processed block still in the chain
+        """
+        w3 = self.client.w3
+        while self._processed:
+            block_number, block_hash = self._processed[-1]
+            block = w3.eth.getBlock(block_number)
+            if block is not None and block['hash'].hex() == block_hash:
+                break
+            self._processed.pop()
+        else:
+            # The reorganization is deeper than the blocks remembered, rescan from the oldest one
+            block_number = max(0, block_number - 1)
+            self._processed = [(block_number, w3.eth.getBlock(block_number)['hash'].hex())]
+            logger.warning("Chain reorganization deeper than %s polls, rescanning after block %s",
+                           REORG_HISTORY, block_number)
+
+        last_block = self._processed[-1][0]
+        removed = [event for event in self._delivered if event["block_number"] > last_block]
+        if removed:
+            logger.warning("Chain reorganization after block %s, retracting %s events", last_block, len(removed))
+            # Retract the events one at a time, so that a callback raising doesn't lose the remaining retractions
+            while self._delivered and self._delivered[-1]["block_number"] > last_block:
+                self.callback(dict(self._delivered[-1], removed=True))
+                self._delivered.pop()
+                self._save_cursor()
+        return last_block
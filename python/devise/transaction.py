@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+    devise.transaction
+    ~~~~~~~~~~~~~~~~~~~~~~~~~
+    Handles on submitted transactions, returned instead of blocking until they are mined when a client is created with
+    async_transactions=True.
+
+    :copyright: © 2018 Pit.AI
+    :license: GPLv3, see LICENSE for more details.
+"""
+from web3.utils.events import get_event_data
+
+from .registry import get_event_abis
+
+# The contracts whose events we know how to decode from transaction receipts
+EVENT_CONTRACT_NAMES = ['DeviseRentalImpl', 'AuditImpl', 'DeviseToken']
+
+
+def decode_receipt_events(receipt, contract_names=None):
+    """
+    Decodes the events emitted by a transaction from its receipt logs
+    :param receipt: a transaction receipt
+    :param contract_names: the names of the contract abis to decode logs with, defaults to all the Devise contracts
+    :return: a list of decoded events (with event, args, address, logIndex, etc.), skipping unknown logs
+    """
+    events = []
+    for log in receipt["logs"]:
+        if not log["topics"]:
+            continue
+        for contract_name in contract_names or EVENT_CONTRACT_NAMES:
+            event_abi = get_event_abis(contract_name)[1].get(bytes(log["topics"][0]))
+            if event_abi is None:
+                continue
+            try:
+                events.append(get_event_data(event_abi, log))
+                break
+            except Exception:
+                # Same signature with different indexed arguments, try the next contract
+                continue
+    return events
+
+
+class PendingTransaction(object):
+    """
+    A transaction submitted to the network which may not be mined yet.
+
+    Example Usage:
+        client = DeviseClient(private_key=..., async_transactions=True)
+        pending = client.provision(1000)
+        ...
+        if pending.wait():
+            print(pending.gas_used, pending.events)
+    """
+
+    def __init__(self, client, tx_hash, transaction):
+        """
+        :param client: the client which submitted the transaction
+        :param tx_hash: the hash of the submitted transaction
+        :param transaction: the transaction dict submitted
+        """
+        self._client = client
+        self._tx_hash = tx_hash
+        self.transaction = transaction
+        self._receipt = None
+
+    def __repr__(self):
+        return "<PendingTransaction %s%s>" % (self.tx_hash, "" if self._receipt is None else " (mined)")
+
+    @property
+    def tx_hash(self):
+        """The transaction hash as a hex string"""
+        return self._tx_hash.hex()
+
+    def done(self):
+        """Returns True if the transaction has been mined, without blocking"""
+        if self._receipt is None:
+            self._receipt = self._client.w3.eth.getTransactionReceipt(self._tx_hash)
+        return self._receipt is not None
+
+    def wait(self, timeout=None):
+        """
+        Blocks until the transaction is mined
+        :param timeout: the maximum number of seconds to wait, raises web3.utils.threads.Timeout when exceeded. Waits
+                indefinitely if None.
+        :return: True if the transaction succeeded, False otherwise
+        """
+        if self._receipt is None:
+            if timeout is None:
+                self._receipt = self._client._wait_for_mined_receipt(self._tx_hash, self.transaction)
+            else:
+                self._receipt = self._client.w3.eth.waitForTransactionReceipt(self._tx_hash, timeout=timeout)
+        return self.succeeded
+
+    @property
+    def receipt(self):
+        """The transaction receipt, blocking until the transaction is mined"""
+        if self._receipt is None:
+            self.wait()
+        return self._receipt
+
+    @property
+    def succeeded(self):
+        """True if the transaction was mined and succeeded, blocking until the transaction is mined"""
+        receipt = self.receipt
+        return hasattr(receipt, "status") and receipt["status"] == 1
+
+    @property
+    def gas_used(self):
+        """The gas used by the transaction, blocking until the transaction is mined"""
+        return self.receipt["gasUsed"]
+
+    @property
+    def events(self):
+        """The events emitted by the transaction, blocking until the transaction is mined"""
+        return decode_receipt_events(self.receipt)
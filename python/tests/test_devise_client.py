@@ -13,23 +13,49 @@
     :license: BSD, see LICENSE for more details.
 """
 import hashlib
+import io
 import os
+import shutil
 import tempfile
+import threading
+import time
 import uuid
 from datetime import datetime
 from unittest import mock
+from zipfile import ZipFile, ZIP_DEFLATED
 
 import pytest
 import sha3
 from eth_account import Account
+from eth_utils import event_abi_to_log_topic
 from pytest import raises
 from web3 import Web3
+from web3.utils.events import get_event_data
 
 from devise import DeviseClient
-from devise.base import generate_account
+from devise.base import generate_account, get_contract_abi
+from devise.blocks import FINALITY_DEPTH, get_block_timestamp_cache, get_chain_id, get_deployment_block
+from devise.clients.contract import EVENT_ARG_KEY_FORMATTERS, EVENT_ARG_VALUE_FORMATTERS
+from devise.download import DOWNLOAD_HEAD_SIZE, DownloadResult
+from devise.event_store import EventStore
+from devise.events import EventDecoder, EventRecord
+from devise.file_cache import FileCache
+from devise.gas import GasPriceOracle
+from devise.http import get_session, PooledHTTPProvider
+from devise.registry import get_event_abis
+from devise.scanner import BlockRangeScanner
+from devise.subscription import EventSubscription
 from .utils import evm_snapshot, evm_revert, time_travel, TEST_KEYS
 
 
+def _write_hash_test_file(url, local_file_name, resumable=True):
+    """Stands in for RentalAPI._download with a file the hash of which is edd22313d5aec9041b405953bfb10168b1d58b2e"""
+    shutil.copyfile(os.path.join(os.path.dirname(__file__), "hash_test.json"), local_file_name)
+    with open(local_file_name, 'rb') as f:
+        content = f.read()
+    return DownloadResult(hashlib.sha1(content).hexdigest(), content[:DOWNLOAD_HEAD_SIZE])
+
+
 class TestDeviseClient(object):
     @pytest.fixture(scope="function", autouse=True)
     def setup_method(self, owner_client, client, token_wallet_client):
@@ -139,6 +165,19 @@ class TestDeviseClient(object):
         client_local_keyfile.provision(1000000)
         assert client_local_keyfile.dvz_balance_escrow == 1000000
 
+    def test_key_cache(self, token_wallet_client):
+        """Tests that the key file is only decrypted once while the decrypted key is cached"""
+        key_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'key_file.json')
+        client = DeviseClient(key_file=key_path, password='password', key_cache_ttl=60)
+        token_wallet_client.transfer(client.address, 1000)
+        with mock.patch('devise.base.Account.decrypt', wraps=Account.decrypt) as decrypt_mock:
+            client.provision(100)
+            client.get_signed_api_url('/v1/devisechain/latest_weights')
+            assert decrypt_mock.call_count == 1
+            client.lock()
+            client.get_signed_api_url('/v1/devisechain/latest_weights')
+            assert decrypt_mock.call_count == 2
+
     def test_withdraw_can_withdraw(self, client):
         client.provision(1000000)
         assert round(client.client_summary["dvz_balance_escrow"], 6) == round(1000000, 6)
@@ -298,18 +337,53 @@ class TestDeviseClient(object):
 
     @mock.patch("devise.clients.api.RentalAPI.get_signed_api_url", return_value='')
     @mock.patch("devise.clients.api.RentalAPI._get_latest_weights_date_from_contents", return_value='20180608')
-    def test_download_weights_by_hash(self, _get_date_mock, signed_url_mock, client):
-        hash = "6e77f09a1f837d54726a9175fea227695c9c1a18"
-        file_name = client.download_weights_by_hash(hash)
+    @mock.patch("devise.clients.api.RentalAPI._download", side_effect=_write_hash_test_file)
+    def test_download_weights_by_hash(self, download_mock, _get_date_mock, signed_url_mock, client):
+        hash = "edd22313d5aec9041b405953bfb10168b1d58b2e"
+        with mock.patch("devise.clients.api.get_file_cache", return_value=FileCache(tempfile.mkdtemp())):
+            file_name = client.download_weights_by_hash(hash)
         assert os.path.exists(file_name)
         try:
             assert signed_url_mock.call_count == 1
             url = signed_url_mock.call_args[0][0]
-            assert url == '/v1/devisechain/hashes/6e77f09a1f837d54726a9175fea227695c9c1a18'
+            assert url == '/v1/devisechain/hashes/edd22313d5aec9041b405953bfb10168b1d58b2e'
             assert file_name == 'weights_by_hash_20180608.zip'
+            assert not os.path.exists(hash)
         finally:
             os.unlink(file_name)
 
+    @mock.patch("devise.clients.api.RentalAPI.get_signed_api_url", return_value='')
+    @mock.patch("devise.clients.api.RentalAPI._download", side_effect=_write_hash_test_file)
+    def test_download_file_by_hash_cached(self, download_mock, signed_url_mock, client):
+        hash = "edd22313d5aec9041b405953bfb10168b1d58b2e"
+        out_dir = tempfile.mkdtemp()
+        with mock.patch("devise.clients.api.get_file_cache", return_value=FileCache(tempfile.mkdtemp())):
+            for i in range(3):
+                file_name = client.download_file_by_hash(hash, os.path.join(out_dir, 'file_%s' % i))
+                assert client.get_hash_for_file(file_name) == hash
+        # Downloaded once, then served from the cache
+        assert download_mock.call_count == 1
+
+    @mock.patch("devise.clients.api.RentalAPI.get_signed_api_url", return_value='')
+    @mock.patch("devise.clients.api.RentalAPI._download", side_effect=_write_hash_test_file)
+    def test_download_file_by_hash_mismatch(self, download_mock, signed_url_mock, client):
+        file_cache = FileCache(tempfile.mkdtemp())
+        with mock.patch("devise.clients.api.get_file_cache", return_value=file_cache):
+            with raises(ValueError):
+                client.download_file_by_hash("6e77f09a1f837d54726a9175fea227695c9c1a18")
+        assert os.listdir(file_cache.path) == []
+
+    def test_get_latest_weights_date_from_head(self, client):
+        archive = io.BytesIO()
+        with ZipFile(archive, 'w', ZIP_DEFLATED) as zip:
+            zip.writestr('weights.csv', 'date,lepton,weight\n' + '20180608,abc,0.5\n' * 10000)
+        head = archive.getvalue()[:DOWNLOAD_HEAD_SIZE]
+        with mock.patch("devise.clients.api.RentalAPI._get_latest_weights_date_from_contents") as contents_mock:
+            assert client._get_latest_weights_date('weights.zip', head) == '20180608'
+            assert contents_mock.call_count == 0
+            client._get_latest_weights_date('weights.zip', b'<html>')
+            assert contents_mock.call_count == 1
+
     @mock.patch("devise.clients.api.RentalAPI._download")
     def test_download_historical_weights(self, download_mock, client):
         client.download_historical_weights()
@@ -374,6 +448,19 @@ class TestDeviseClient(object):
         assert client.get_all_bidders(active=True) == [
             {'address': '0xA1C2684B68A98c9636FC22F3B4E4332eF35A2408', 'limit_price': lease_prc, 'requested_seats': 1}]
 
+    def test_filter_sufficient_funds(self, client, master_node):
+        """Tests that the bids not covered by the bidder's escrow balance are excluded"""
+        lepton_hash = hashlib.sha1('hello world 1'.encode('utf8')).hexdigest()
+        master_node.add_lepton(lepton_hash, None, 1.5123456789123456789)
+        client.provision(16000)
+        client2 = DeviseClient(private_key=TEST_KEYS[2])
+        client2.provision(100)
+
+        bids = [{'address': client.address, 'limit_price': 1000, 'requested_seats': 1},
+                {'address': client2.address, 'limit_price': 1000, 'requested_seats': 1},
+                {'address': client.address, 'limit_price': 1000, 'requested_seats': 20}]
+        assert client._filter_sufficient_funds(bids) == [bids[0]]
+
     def test_lease_all_seats(self, client, master_node):
         lepton_hash = hashlib.sha1('hello world 1'.encode('utf8')).hexdigest()
         master_node.add_lepton(lepton_hash, None, 1.5123456789123456789)
@@ -484,6 +571,11 @@ class TestDeviseClient(object):
         sha1 = client.get_hash_for_file(file_path)
         assert sha1 == 'edd22313d5aec9041b405953bfb10168b1d58b2e'
 
+    def test_get_hashes_for_files(self, client):
+        file_path = os.path.join(os.path.dirname(__file__), "hash_test.json")
+        hashes = client.get_hashes_for_files([file_path, file_path])
+        assert hashes == ['edd22313d5aec9041b405953bfb10168b1d58b2e'] * 2
+
     def test_get_all_events(self, client, owner_client, rate_setter):
         owner_client.add_audit_updater(rate_setter.address)
         rate_setter.latest_weights_updated('edd22313d5aec9041b405953bfb10168b1d58b2e')
@@ -509,3 +601,364 @@ class TestDeviseClient(object):
         assert 'FileCreated' in events
         assert 'LeptonAdded' in events
         assert 'BeneficiaryChanged' in events
+
+    def test_contracts_shared_across_clients(self, client):
+        client2 = DeviseClient(private_key=TEST_KEYS[2])
+        assert client2.w3 is client.w3
+        assert client2._rental_contract is client._rental_contract
+        assert client2._token_contract is client._token_contract
+        assert get_contract_abi('DeviseRentalImpl') is get_contract_abi('DeviseRentalImpl')
+
+    def test_get_all_clients_batched(self, client):
+        client.provision(1000)
+        client2 = DeviseClient(private_key=TEST_KEYS[2])
+        client2.provision(1000)
+        client.rpc_batch_size = 1
+        all_clients = client.get_all_clients()
+        assert len(all_clients) >= 2
+        assert all_clients == [client.get_client_summary(summary["client"]) for summary in all_clients]
+
+    def test_snapshot(self, client, master_node):
+        snapshot = client.snapshot()
+        assert snapshot.block_identifier == client.w3.eth.blockNumber
+        seats_available = snapshot.seats_available
+        total_incremental_usefulness = snapshot.total_incremental_usefulness
+
+        # New state is not visible from the snapshot
+        master_node.add_lepton(hashlib.sha1("some lepton".encode('utf8')).hexdigest(), None, 1.5)
+        assert client.total_incremental_usefulness != total_incremental_usefulness
+        assert snapshot.total_incremental_usefulness == total_incremental_usefulness
+        assert snapshot.seats_available == seats_available
+        assert client.snapshot().total_incremental_usefulness == client.total_incremental_usefulness
+
+        # Reads are memoized and snapshots are read only
+        eth_balance = snapshot.eth_balance
+        with mock.patch('web3.contract.ContractFunction.call') as call_mock:
+            assert snapshot.seats_available == seats_available
+            assert call_mock.call_count == 0
+        with mock.patch.object(client.w3.eth, 'getBalance') as get_balance_mock:
+            assert snapshot.eth_balance == eth_balance
+            assert get_balance_mock.call_count == 0
+        with raises(AssertionError):
+            snapshot.provision(1000)
+
+    def test_async_transactions(self, client):
+        async_client = DeviseClient(private_key=TEST_KEYS[5], async_transactions=True)
+        pending = async_client.provision(1000)
+        assert pending.tx_hash.startswith('0x') and len(pending.tx_hash) == 66
+        assert pending.wait() is True
+        assert pending.done()
+        assert pending.gas_used > 0
+        assert 'Transfer' in [event['event'] for event in pending.events]
+        assert client.dvz_balance_escrow == 1000
+
+    def test_gas_price_oracle(self, client):
+        client.transfer_ether(client.w3.eth.accounts[2], 1)
+        assert client.w3.eth.generateGasPrice() > 0
+        # Estimates are served from memory between refreshes
+        with mock.patch('devise.gas.batch_request') as batch_request_mock:
+            assert client.w3.eth.generateGasPrice() > 0
+            assert batch_request_mock.call_count == 0
+
+    def test_gas_price_oracle_sample_window(self, client):
+        oracle = GasPriceOracle(client.w3, sample_size=3, refresh_interval=0)
+        try:
+            client.transfer_ether(client.w3.eth.accounts[2], 1)
+            oracle.refresh()
+            assert oracle._block_prices[-1][0] == client.w3.eth.blockNumber
+            # Blocks without transactions don't add samples, but old samples leave the window
+            for _ in range(3):
+                client.w3.manager.request_blocking('evm_mine', [])
+            oracle.refresh()
+            assert len(oracle._block_prices) == 0
+            assert oracle.gas_price == client.w3.eth.gasPrice
+        finally:
+            oracle.stop()
+
+    def test_gas_price_oracle_concurrent_refresh(self):
+        w3 = mock.Mock()
+        w3.eth.blockNumber = 0
+        w3.eth.gasPrice = 1
+        oracle = GasPriceOracle(w3, sample_size=50, refresh_interval=3600)
+        oracle._last_refresh = time.time()
+        stop = threading.Event()
+        errors = []
+
+        def refresh():
+            try:
+                while not stop.is_set():
+                    w3.eth.blockNumber += 10
+                    oracle.refresh()
+            except Exception as e:
+                errors.append(e)
+
+        # Estimates are read while the samples are being appended and dropped by another thread
+        blocks = lambda _, requests: [{'transactions': [{'gasPrice': hex(1000 + idx)}]} for idx in range(len(requests))]
+        with mock.patch('devise.gas.batch_request', side_effect=blocks):
+            thread = threading.Thread(target=refresh)
+            thread.start()
+            try:
+                for _ in range(10000):
+                    assert oracle.gas_price > 0
+            finally:
+                stop.set()
+                thread.join()
+        assert errors == []
+
+    def test_get_block_timestamp(self, client):
+        block_number = client.w3.eth.blockNumber
+        assert client.get_block_timestamp(block_number) == client.w3.eth.getBlock(block_number)['timestamp']
+        assert client.get_block_timestamp(0) == client.w3.eth.getBlock(0)['timestamp']
+        # Final blocks are served from the cache
+        with mock.patch('devise.blocks.batch_request') as batch_request_mock:
+            assert client.get_block_timestamp(0) == client.w3.eth.getBlock(0)['timestamp']
+            assert batch_request_mock.call_count == 0
+
+    def test_event_store(self, client, owner_client, rate_setter):
+        store = EventStore(os.path.join(tempfile.mkdtemp(), 'events.sqlite'))
+        store_client = DeviseClient(private_key=TEST_KEYS[5], event_store=store)
+        owner_client.add_audit_updater(rate_setter.address)
+        rate_setter.latest_weights_updated('edd22313d5aec9041b405953bfb10168b1d58b2e')
+
+        # Events from blocks which are not final yet are returned but not stored
+        events = store_client.get_events('AuditableEventCreated')
+        assert events == client.get_events('AuditableEventCreated')
+        chain_id = get_chain_id(client.w3)
+        assert store.query(chain_id, 'AuditableEventCreated') == []
+
+        for _ in range(FINALITY_DEPTH):
+            client.w3.manager.request_blocking('evm_mine', [])
+        assert store_client.get_events('AuditableEventCreated') == events
+        assert store.query(chain_id, 'AuditableEventCreated') == events
+        assert store.query(chain_id, 'AuditableEventCreated', args={'contentHash': events[0]['event_args'][
+            'contentHash']}) == events
+        assert store.query(chain_id, 'AuditableEventCreated', start=events[0]['block_timestamp'] + 1) == []
+
+        # Only the blocks mined since the last synchronization are fetched
+        sync_block = store.get_sync_block(chain_id, client._audit_contract.address, 'AuditableEventCreated')
+        with mock.patch.object(BlockRangeScanner, 'scan', autospec=True, return_value=iter([])) as scan_mock:
+            store_client.get_events('AuditableEventCreated')
+            assert scan_mock.call_args[0][2] == sync_block + 1
+
+    def test_event_store_partial_sync(self, client, owner_client, rate_setter):
+        store = EventStore(os.path.join(tempfile.mkdtemp(), 'events.sqlite'))
+        store_client = DeviseClient(private_key=TEST_KEYS[5], event_store=store)
+        owner_client.add_audit_updater(rate_setter.address)
+        rate_setter.latest_weights_updated('edd22313d5aec9041b405953bfb10168b1d58b2e')
+        event_block = client.w3.eth.blockNumber
+        for _ in range(FINALITY_DEPTH + 2):
+            client.w3.manager.request_blocking('evm_mine', [])
+        final_block = client.w3.eth.blockNumber - FINALITY_DEPTH
+        chain_id = get_chain_id(client.w3)
+        address = client._audit_contract.address
+
+        # An empty store only scans the blocks requested, not the whole history
+        with mock.patch.object(BlockRangeScanner, 'scan', autospec=True, wraps=BlockRangeScanner.scan) as scan_mock:
+            events = list(store_client.iter_events('AuditableEventCreated', from_block=event_block))
+            assert scan_mock.call_args_list[0][0][2] == event_block
+        assert events == list(client.iter_events('AuditableEventCreated', from_block=event_block))
+        assert store.get_synced_ranges(chain_id, address, 'AuditableEventCreated') == [(event_block, final_block)]
+
+        # The blocks before are synchronized when requested, then the stored ones aren't scanned again
+        assert store_client.get_events('AuditableEventCreated') == client.get_events('AuditableEventCreated')
+        first_block = store.get_synced_ranges(chain_id, address, 'AuditableEventCreated')[0][0]
+        assert store.get_synced_ranges(chain_id, address, 'AuditableEventCreated') == [(first_block, final_block)]
+        assert store.get_unsynced_ranges(chain_id, [(address, 'AuditableEventCreated')], first_block,
+                                         final_block + 5) == [(final_block + 1, final_block + 5)]
+
+    def test_iter_events(self, client, owner_client, rate_setter):
+        owner_client.add_audit_updater(rate_setter.address)
+        rate_setter.latest_weights_updated('edd22313d5aec9041b405953bfb10168b1d58b2e')
+        block_number = client.w3.eth.blockNumber
+
+        events = client.iter_events('AuditableEventCreated')
+        assert not isinstance(events, list)
+        assert list(events) == client.get_events('AuditableEventCreated')
+        assert [event['block_number'] for event in client.iter_events('AuditableEventCreated',
+                                                                      from_block=block_number)] == [block_number]
+        assert list(client.iter_events('AuditableEventCreated', to_block=block_number - 1)) == []
+
+    def test_get_multiple_events(self, client, owner_client, rate_setter):
+        owner_client.add_audit_updater(rate_setter.address)
+        rate_setter.latest_weights_updated('edd22313d5aec9041b405953bfb10168b1d58b2e')
+
+        with mock.patch.object(client.w3.eth, 'getLogs', wraps=client.w3.eth.getLogs) as get_logs_mock:
+            events = client.get_events(['AuditableEventCreated', 'RoleAdded'])
+            num_queries = get_logs_mock.call_count
+        expected = client.get_events('AuditableEventCreated') + client.get_events('RoleAdded')
+        assert sorted(events, key=lambda event: event['transaction']) == \
+            sorted(expected, key=lambda event: event['transaction'])
+        assert [event['block_number'] for event in events] == sorted(event['block_number'] for event in events)
+        # A single query per block range covers both events and all the contracts
+        assert num_queries == 1
+        assert set(event['event'] for event in client.get_events()) >= {'AuditableEventCreated', 'RoleAdded'}
+
+    def test_event_decoders(self, client, owner_client, rate_setter, master_node):
+        owner_client.add_audit_updater(rate_setter.address)
+        rate_setter.latest_weights_updated('edd22313d5aec9041b405953bfb10168b1d58b2e')
+        master_node.add_lepton(hashlib.sha1('hello world 1'.encode('utf8')).hexdigest(), None, 1.5123456789123456789)
+
+        # The precompiled decoders match web3's generic decoding followed by the formatters
+        for contract_name, address, event_name in (
+                ('AuditImpl', client._audit_contract.address, 'AuditableEventCreated'),
+                ('DeviseRentalImpl', client._rental_contract.address, 'LeptonAdded')):
+            event_abi = get_event_abis(contract_name)[0][event_name]
+            logs = client.w3.eth.getLogs({'fromBlock': 0, 'toBlock': 'latest', 'address': address,
+                                          'topics': [Web3.toHex(event_abi_to_log_topic(event_abi))]})
+            assert len(logs) > 0
+            key_formatters = EVENT_ARG_KEY_FORMATTERS.get(event_name, {})
+            value_formatters = EVENT_ARG_VALUE_FORMATTERS.get(event_name, {})
+            decoder = EventDecoder(event_abi, key_formatters, value_formatters)
+            for log in logs:
+                expected = {}
+                for key, value in get_event_data(event_abi, log)['args'].items():
+                    if key in value_formatters:
+                        value = value_formatters[key](value)
+                    elif type(value) == bytes:
+                        value = value.hex()
+                    expected[key_formatters.get(key, key)] = value
+                assert decoder.decode_args(log) == expected
+
+        records = list(client.iter_events('AuditableEventCreated', as_records=True))
+        assert all(isinstance(record, EventRecord) for record in records)
+        assert [record.to_dict() for record in records] == client.get_events('AuditableEventCreated')
+
+    def test_subscribe(self, client, owner_client, rate_setter):
+        owner_client.add_audit_updater(rate_setter.address)
+        received = []
+        cursor_path = os.path.join(tempfile.mkdtemp(), 'cursor.json')
+        subscription = EventSubscription(client, 'AuditableEventCreated', received.append, confirmations=0,
+                                         cursor_path=cursor_path)
+        # Only new events are delivered
+        subscription.poll()
+        assert received == []
+
+        snapshot_id = evm_snapshot(client)
+        rate_setter.latest_weights_updated('edd22313d5aec9041b405953bfb10168b1d58b2e')
+        subscription.poll()
+        assert received == client.get_events('AuditableEventCreated')[-1:]
+        subscription.poll()
+        assert len(received) == 1
+
+        # A restarted subscription resumes from the persisted cursor
+        resumed_received = []
+        resumed = EventSubscription(client, 'AuditableEventCreated', resumed_received.append, confirmations=0,
+                                    cursor_path=cursor_path)
+        resumed._load_cursor()
+        resumed.poll()
+        assert resumed_received == []
+
+        # The block with the event is replaced by a chain reorganization, the event is retracted
+        evm_revert(snapshot_id, client)
+        client.w3.manager.request_blocking('evm_mine', [])
+        subscription.poll()
+        assert received == [received[0], dict(received[0], removed=True)]
+
+    def test_subscribe_callback_error(self, client, owner_client, rate_setter):
+        owner_client.add_audit_updater(rate_setter.address)
+        received = []
+
+        def callback(event):
+            received.append(event)
+            if len(received) == 2:
+                raise ValueError("callback error")
+
+        cursor_path = os.path.join(tempfile.mkdtemp(), 'cursor.json')
+        subscription = EventSubscription(client, 'AuditableEventCreated', callback, confirmations=0,
+                                         cursor_path=cursor_path)
+        subscription.poll()
+        snapshot_id = evm_snapshot(client)
+        rate_setter.latest_weights_updated('edd22313d5aec9041b405953bfb10168b1d58b2e')
+        rate_setter.latest_weights_updated('edd22313d5aec9041b405953bfb10168b1d58b2f')
+        with raises(ValueError):
+            subscription.poll()
+        # The next poll resumes with the event the callback raised on
+        subscription.poll()
+        events = client.get_events('AuditableEventCreated')[-2:]
+        assert received == [events[0], events[1], events[1]]
+
+        # A restarted subscription can still retract the events delivered before it stopped
+        retracted = []
+        resumed = EventSubscription(client, 'AuditableEventCreated', retracted.append, confirmations=0,
+                                    cursor_path=cursor_path)
+        resumed._load_cursor()
+        evm_revert(snapshot_id, client)
+        client.w3.manager.request_blocking('evm_mine', [])
+        resumed.poll()
+        assert retracted == [dict(events[1], removed=True), dict(events[0], removed=True)]
+
+    def test_get_block_timestamp_identifiers(self, client):
+        latest_block = client.w3.eth.getBlock('latest')
+        assert client.get_block_timestamp(latest_block['number']) == latest_block['timestamp']
+        assert client.get_block_timestamp('latest') == latest_block['timestamp']
+        assert client.get_block_timestamp(latest_block['hash']) == latest_block['timestamp']
+
+    def test_get_deployment_block(self, client):
+        address = client._rental_contract.address
+        deployment_block = get_deployment_block(client.w3, address)
+        assert deployment_block > 0
+        assert len(client.w3.eth.getCode(address, deployment_block)) > 0
+        assert len(client.w3.eth.getCode(address, deployment_block - 1)) == 0
+        # Deployment blocks are cached
+        with mock.patch.object(client.w3.eth, 'getCode') as get_code_mock:
+            assert get_deployment_block(client.w3, address) == deployment_block
+            assert get_code_mock.call_count == 0
+
+    def test_get_events_without_audit_contract(self, client, master_node):
+        master_node.add_lepton(hashlib.sha1("some lepton".encode('utf8')).hexdigest(), None, 1.5)
+        assert get_deployment_block(client.w3, None) is None
+        # Networks without an AUDIT address in their configuration
+        with mock.patch.object(client._audit_contract, 'address', None):
+            events = client.get_events('LeptonAdded')
+            assert len(events) > 0
+            assert client.get_events('AuditableEventCreated') == []
+
+    def test_get_events_time_range(self, client, owner_client, rate_setter):
+        owner_client.add_audit_updater(rate_setter.address)
+        time_travel(3600, client)
+        rate_setter.latest_weights_updated('edd22313d5aec9041b405953bfb10168b1d58b2e')
+        time_travel(3600, client)
+        rate_setter.latest_weights_updated('edd22313d5aec9041b405953bfb10168b1d58b2f')
+
+        events = client.get_events('AuditableEventCreated')
+        first, last = events[-2], events[-1]
+        assert client.get_events('AuditableEventCreated', start=last['block_datetime']) == [last]
+        assert client.get_events('AuditableEventCreated', start=first['block_timestamp'],
+                                 end=last['block_timestamp'] - 1) == [first]
+        assert client.get_events('AuditableEventCreated', start=last['block_timestamp'] + 1) == []
+
+        # The first block mined at or after a time
+        block_timestamps = get_block_timestamp_cache(client.w3)
+        block_number = block_timestamps.get_block_at(first['block_timestamp'])
+        assert block_number <= first['block_number']
+        assert block_timestamps.get_timestamp(block_number) == first['block_timestamp']
+        assert block_timestamps.get_timestamp(block_number - 1) < first['block_timestamp']
+
+    def test_get_events_argument_filters(self, client, owner_client, rate_setter):
+        owner_client.add_audit_updater(rate_setter.address)
+        rate_setter.latest_weights_updated('edd22313d5aec9041b405953bfb10168b1d58b2e')
+        rate_setter.latest_weights_updated('edd22313d5aec9041b405953bfb10168b1d58b2f')
+        events = client.get_events('AuditableEventCreated')
+        event_type = events[-1]['event_args']['eventType']
+
+        # Indexed arguments are filtered by the node
+        with mock.patch.object(client.w3.eth, 'getLogs', wraps=client.w3.eth.getLogs) as get_logs_mock:
+            assert client.get_events('AuditableEventCreated', argument_filters={'eventType': '0x' + event_type}) == \
+                [event for event in events if event['event_args']['eventType'] == event_type]
+            assert len(get_logs_mock.call_args[0][0]['topics']) == 2
+        assert client.get_events('AuditableEventCreated', argument_filters={'eventType': '00' * 20}) == []
+
+        # Other arguments are filtered locally
+        assert client.get_events('AuditableEventCreated', argument_filters={
+            'contentHash': ['edd22313d5aec9041b405953bfb10168b1d58b2f', '00' * 20]}) == events[-1:]
+        # Events without the argument don't match
+        assert client.get_events(['AuditableEventCreated', 'RoleAdded'],
+                                 argument_filters={'eventType': event_type}) == \
+            client.get_events('AuditableEventCreated', argument_filters={'eventType': event_type})
+
+    def test_pooled_http_session(self, client):
+        assert isinstance(client.w3.providers[0], PooledHTTPProvider)
+        assert get_session() is get_session()
+        with mock.patch.object(get_session(), 'post', wraps=get_session().post) as post_mock:
+            client.w3.eth.blockNumber
+            assert post_mock.call_count == 1
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+    Download tests
+    ~~~~~~~~~
+    These are the tests for the resumable file downloads.
+
+    :copyright: © 2018 Pit.AI
+    :license: BSD, see LICENSE for more details.
+"""
+import hashlib
+import json
+import os
+import tempfile
+from unittest import mock
+
+import requests
+from pytest import raises
+
+from devise.download import download
+
+CONTENT = os.urandom(10000)
+CONTENT_SHA1 = hashlib.sha1(CONTENT).hexdigest()
+
+
+def _response(status_code, body, headers=None, fail_after=None):
+    resp = mock.Mock()
+    resp.status_code = status_code
+    resp.headers = dict(headers or {}, **{'Content-Length': str(len(body))})
+
+    def iter_content(chunk_size):
+        for start in range(0, len(body), chunk_size):
+            if fail_after is not None and start >= fail_after:
+                raise requests.exceptions.ChunkedEncodingError("Connection broken")
+            yield body[start:start + chunk_size]
+
+    resp.iter_content.side_effect = iter_content
+    return resp
+
+
+@mock.patch('devise.download.DOWNLOAD_BACKOFF', 0)
+@mock.patch('devise.download.DOWNLOAD_CHUNK_SIZE', 1024)
+class TestDownload(object):
+    def setup_method(self, method):
+        self.file_path = os.path.join(tempfile.mkdtemp(), 'archive.tar')
+
+    @mock.patch('requests.Session.get')
+    def test_resume_interrupted_download(self, get_mock):
+        get_mock.side_effect = [
+            _response(200, CONTENT, {'ETag': '"v1"'}, fail_after=4096),
+            _response(206, CONTENT[4096:], {'ETag': '"v1"', 'Content-Range': 'bytes 4096-9999/10000'})
+        ]
+        result = download('https://example.com/archive.tar', self.file_path)
+
+        with open(self.file_path, 'rb') as f:
+            assert f.read() == CONTENT
+        assert result.sha1 == CONTENT_SHA1
+        assert result.head == CONTENT
+        assert get_mock.call_args_list[1][1]['headers']['Range'] == 'bytes=4096-'
+        assert get_mock.call_args_list[1][1]['headers']['If-Range'] == '"v1"'
+        assert os.listdir(os.path.dirname(self.file_path)) == ['archive.tar']
+
+    @mock.patch('requests.Session.get')
+    def test_restart_when_remote_file_changed(self, get_mock):
+        new_content = os.urandom(10000)
+        get_mock.side_effect = [
+            _response(200, CONTENT, {'ETag': '"v1"'}, fail_after=4096),
+            # If-Range didn't match, the whole new file is sent
+            _response(200, new_content, {'ETag': '"v2"'})
+        ]
+        result = download('https://example.com/archive.tar', self.file_path)
+
+        with open(self.file_path, 'rb') as f:
+            assert f.read() == new_content
+        assert result.sha1 == hashlib.sha1(new_content).hexdigest()
+
+    @mock.patch('requests.Session.get')
+    def test_partial_file_kept_when_giving_up(self, get_mock):
+        get_mock.side_effect = lambda *args, **kwargs: _response(200, CONTENT, {'ETag': '"v1"'}, fail_after=4096)
+        with raises(requests.exceptions.ChunkedEncodingError):
+            download('https://example.com/archive.tar', self.file_path, attempts=2)
+        assert not os.path.exists(self.file_path)
+        assert os.path.exists(self.file_path + '.part')
+
+    @mock.patch('requests.Session.get')
+    def test_partial_file_removed_when_not_resumable(self, get_mock):
+        get_mock.side_effect = lambda *args, **kwargs: _response(200, CONTENT, {'ETag': '"v1"'}, fail_after=4096)
+        with raises(requests.exceptions.ChunkedEncodingError):
+            download('https://example.com/archive.tar', self.file_path, attempts=2, resumable=False)
+        assert os.listdir(os.path.dirname(self.file_path)) == []
+
+    @mock.patch('requests.Session.get')
+    def test_resume_previous_download(self, get_mock):
+        with open(self.file_path + '.part', 'wb') as f:
+            f.write(CONTENT[:4096])
+        with open(self.file_path + '.part.json', 'w') as f:
+            json.dump({'validator': '"v1"'}, f)
+        get_mock.return_value = _response(206, CONTENT[4096:],
+                                          {'ETag': '"v1"', 'Content-Range': 'bytes 4096-9999/10000'})
+        result = download('https://example.com/archive.tar', self.file_path)
+
+        # The digest covers the partial file left by the previous call
+        assert result.sha1 == CONTENT_SHA1
+
+    @mock.patch('requests.Session.get')
+    def test_segmented_download(self, get_mock):
+        def get(url, headers, **kwargs):
+            start, end = [int(value) for value in headers['Range'][len('bytes='):].split('-')]
+            content_range = 'bytes %s-%s/%s' % (start, end, len(CONTENT))
+            return _response(206, CONTENT[start:end + 1], {'ETag': '"v1"', 'Content-Range': content_range})
+
+        get_mock.side_effect = get
+        result = download('https://example.com/archive.tar', self.file_path, segments=4)
+
+        with open(self.file_path, 'rb') as f:
+            assert f.read() == CONTENT
+        assert result.sha1 == CONTENT_SHA1
+        # One probe and one request per segment
+        assert get_mock.call_count == 5
+        assert os.listdir(os.path.dirname(self.file_path)) == ['archive.tar']
+
+    @mock.patch('requests.Session.get')
+    def test_segmented_download_fallback(self, get_mock):
+        get_mock.side_effect = lambda *args, **kwargs: _response(200, CONTENT)
+        download('https://example.com/archive.tar', self.file_path, segments=4)
+
+        with open(self.file_path, 'rb') as f:
+            assert f.read() == CONTENT
+        assert get_mock.call_count == 2
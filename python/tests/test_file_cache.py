@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+    File cache tests
+    ~~~~~~~~~
+    These are the tests for the content-addressed file cache.
+
+    :copyright: © 2018 Pit.AI
+    :license: BSD, see LICENSE for more details.
+"""
+import hashlib
+import os
+import tempfile
+
+from pytest import raises
+
+from devise.file_cache import FileCache
+
+
+def _add_file(cache, content, mtime=None):
+    content_hash = hashlib.sha1(content).hexdigest()
+    file_path = cache.temp_path()
+    with open(file_path, 'wb') as f:
+        f.write(content)
+    cache.insert(content_hash, file_path)
+    if mtime is not None:
+        os.utime(os.path.join(cache.path, content_hash), (mtime, mtime))
+    return content_hash
+
+
+class TestFileCache(object):
+    def setup_method(self, method):
+        self.cache = FileCache(tempfile.mkdtemp(), max_size=250)
+        self.out_dir = tempfile.mkdtemp()
+
+    def test_copy_to(self):
+        content_hash = _add_file(self.cache, b'a' * 100)
+        file_name = os.path.join(self.out_dir, 'weights.zip')
+        assert self.cache.copy_to(content_hash, file_name)
+        with open(file_name, 'rb') as f:
+            assert f.read() == b'a' * 100
+        # The temp file was moved into the cache
+        assert os.listdir(self.cache.path) == [content_hash]
+        assert os.listdir(self.out_dir) == ['weights.zip']
+
+    def test_miss(self):
+        file_name = os.path.join(self.out_dir, 'weights.zip')
+        assert not self.cache.contains('0' * 40)
+        assert not self.cache.copy_to('0' * 40, file_name)
+        assert os.listdir(self.out_dir) == []
+
+    def test_insert_from_another_directory(self):
+        content = b'b' * 100
+        content_hash = hashlib.sha1(content).hexdigest()
+        file_path = os.path.join(self.out_dir, 'download')
+        with open(file_path, 'wb') as f:
+            f.write(content)
+        self.cache.insert(content_hash, file_path)
+        assert self.cache.contains(content_hash)
+        assert not os.path.exists(file_path)
+
+    def test_evict_least_recently_used(self):
+        first = _add_file(self.cache, b'a' * 100, mtime=1000)
+        second = _add_file(self.cache, b'b' * 100, mtime=2000)
+        # Using the first file makes the second one the least recently used
+        assert self.cache.copy_to(first, os.path.join(self.out_dir, 'first'))
+        third = _add_file(self.cache, b'c' * 100)
+
+        assert self.cache.contains(first)
+        assert not self.cache.contains(second)
+        assert self.cache.contains(third)
+
+    def test_copy_is_independent(self):
+        content_hash = _add_file(self.cache, b'a' * 100)
+        file_name = os.path.join(self.out_dir, 'weights.zip')
+        assert self.cache.copy_to(content_hash, file_name)
+        with open(file_name, 'ab') as f:
+            f.write(b'modified')
+        with open(os.path.join(self.cache.path, content_hash), 'rb') as f:
+            assert f.read() == b'a' * 100
+
+    def test_link(self):
+        content_hash = _add_file(self.cache, b'a' * 100)
+        file_name = os.path.join(self.out_dir, 'weights.zip')
+        assert self.cache.copy_to(content_hash, file_name, link=True)
+        with open(file_name, 'rb') as f:
+            assert f.read() == b'a' * 100
+
+    def test_invalid_hash(self):
+        file_name = os.path.join(self.out_dir, 'weights.zip')
+        for content_hash in ('../' * 13 + 'x', 'g' * 40, 'a' * 39, None):
+            with raises(ValueError):
+                self.cache.copy_to(content_hash, file_name)
+            with raises(ValueError):
+                self.cache.contains(content_hash)
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""
+    Hashing tests
+    ~~~~~~~~~
+    These are the tests for the file hashing functions.
+
+    :copyright: © 2018 Pit.AI
+    :license: BSD, see LICENSE for more details.
+"""
+import hashlib
+import os
+import tempfile
+
+from devise.hashing import hash_file, hash_files
+
+
+class TestHashing(object):
+    def setup_method(self, method):
+        self.dir = tempfile.mkdtemp()
+        self.files = {}
+        # Empty, smaller than, equal to and larger than the buffer
+        for size in (0, 100, 4096, 10000):
+            content = os.urandom(size)
+            file_name = os.path.join(self.dir, 'file_%s' % size)
+            with open(file_name, 'wb') as f:
+                f.write(content)
+            self.files[file_name] = content
+
+    def test_hash_file(self):
+        for file_name, content in self.files.items():
+            assert hash_file(file_name, buffer_size=4096) == hashlib.sha1(content).hexdigest()
+            assert hash_file(file_name, 'sha256') == hashlib.sha256(content).hexdigest()
+
+    def test_hash_files(self):
+        file_names = sorted(self.files)
+        expected = [hashlib.sha1(self.files[file_name]).hexdigest() for file_name in file_names]
+        assert hash_files(file_names) == expected
+        assert hash_files(file_names, max_workers=1) == expected
+        assert hash_files([]) == []
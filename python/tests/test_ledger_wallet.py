@@ -1,4 +1,5 @@
 import os
+from unittest import mock
 
 import pytest
 from ledgerblue.commException import CommException
@@ -18,3 +19,43 @@ class TestLedgerWallet(object):
 
         index = ledger.get_account_index('0xc5b7e45ba600324868a0c86a567b902dc35f0958ca46fb86dcaf352f12e6d913')
         assert index == 0
+
+    @pytest.mark.skipif(os.environ.get("JENKINS_BUILD", False),
+                        reason="Jenkins cannot access a ledger hardware wallet!")
+    def test_address_index_cache(self, tmpdir):
+        ledger = None
+        try:
+            ledger = LedgerWallet(index_path=str(tmpdir.join('ledger_index.json')))
+        except CommException:
+            pytest.skip('Ledger nano dongle not found!')
+
+        addresses = ledger.get_addresses(range(0, 5))
+        assert len(addresses) == 5
+        assert ledger.get_account_index(addresses[3]) == 3
+
+        # A new wallet instance finds the index without scanning
+        ledger = LedgerWallet(index_path=str(tmpdir.join('ledger_index.json')))
+        ledger.get_address = mock.Mock(wraps=ledger.get_address)
+        assert ledger.get_account_index(addresses[4]) == 4
+        assert ledger.get_address.call_count == 2
+
+    @mock.patch('devise.ledger.getDongle')
+    def test_account_index_scan(self, _get_dongle_mock, tmpdir):
+        ledger = LedgerWallet(index_path=str(tmpdir.join('ledger_index.json')))
+        ledger.get_address = mock.Mock(side_effect=lambda account_index: '0x%040x' % (account_index + 1))
+        ledger._save_indices = mock.Mock(wraps=ledger._save_indices)
+
+        ledger.get_addresses(range(10, 20))
+        # Indices below the ones already known are scanned too, the known ones aren't queried again
+        ledger.get_address.reset_mock()
+        ledger._save_indices.reset_mock()
+        assert ledger.get_account_index('0x%040x' % 4) == 3
+        assert sorted(call[0][0] for call in ledger.get_address.call_args_list) == [1, 2, 3]
+        assert ledger._save_indices.call_count == 1
+
+        # A stale index is forgotten, but not the device's first address
+        ledger._verified.clear()
+        ledger._indices['0x%040x' % 30] = 5
+        ledger.get_address.reset_mock()
+        assert ledger.get_account_index('0x%040x' % 30) == 29
+        assert ledger._load_indices()[ledger._get_device_id()] == 0
@@ -49,6 +49,17 @@ class TestMasterNode(object):
         assert new_leptons[-1] == {"hash": lepton2_hash, "previous_hash": lepton1_hash,
                                    "incremental_usefulness": 0.512345}
 
+    def test_add_leptons(self, master_node, client):
+        """Tests that we can submit several leptons back to back"""
+        num_leptons = len(client.get_all_leptons())
+        lepton_hashes = [hashlib.sha1(('pipelined lepton %s' % idx).encode('utf8')).hexdigest() for idx in range(3)]
+        leptons = [(lepton_hash, lepton_hashes[idx - 1] if idx else None, 0.5123456789123456789)
+                   for idx, lepton_hash in enumerate(lepton_hashes)]
+        assert master_node.add_leptons(leptons) == [True, True, True]
+        new_leptons = client.get_all_leptons()
+        assert len(new_leptons) == num_leptons + 3
+        assert [lepton["hash"] for lepton in new_leptons[-3:]] == lepton_hashes
+
     def test_add_master_node(self, owner_client, client):
         master_node = MasterNode(private_key=TEST_KEYS[2])
         new_lepton = 'hello world 1'
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+    RemoteConfig tests
+    ~~~~~~~~~
+    These are the tests for the lazily resolved, disk cached CDN configuration.
+
+    :copyright: © 2018 Pit.AI
+    :license: BSD, see LICENSE for more details.
+"""
+import json
+import os
+import tempfile
+import time
+from unittest import mock
+
+import requests
+
+from devise import base, config
+from devise.base import BaseEthereumClient
+from devise.remote_config import RemoteConfig, LazyConfigMapping
+from .utils import TEST_KEYS
+
+CDN_CONFIG = {
+    "CONTRACT_ADDRESSES": {"1": {"DEVISE_RENTAL": "0x26E47337f0d2CfC39d671158Bd6B04521D6aAD05"}},
+    "NETWORK_TO_NODE": {"MAINNET": "https://mainnet.infura.io"},
+    "API_ROOT_URL": {"MAINNET": "https://api.devisechain.io"}
+}
+
+
+def _response(status_code, json_body=None, etag=None):
+    resp = mock.Mock()
+    resp.status_code = status_code
+    resp.headers = {"ETag": etag} if etag else {}
+    resp.json.return_value = json_body
+    resp.raise_for_status.return_value = None
+    return resp
+
+
+class TestRemoteConfig(object):
+    def setup_method(self, method):
+        self.cache_path = os.path.join(tempfile.mkdtemp(), 'config.json')
+
+    @mock.patch('requests.Session.get')
+    def test_lazy_resolution(self, get_mock):
+        """Nothing is fetched until a value is needed"""
+        get_mock.return_value = _response(200, CDN_CONFIG, etag='"abc"')
+        remote_config = RemoteConfig(cache_path=self.cache_path)
+        addresses = LazyConfigMapping(remote_config, "CONTRACT_ADDRESSES")
+        assert get_mock.call_count == 0
+
+        assert addresses.get("1")["DEVISE_RENTAL"] == "0x26E47337f0d2CfC39d671158Bd6B04521D6aAD05"
+        assert addresses["1"]["DEVISE_RENTAL"] == "0x26E47337f0d2CfC39d671158Bd6B04521D6aAD05"
+        assert get_mock.call_count == 1
+
+    @mock.patch('requests.Session.get')
+    def test_disk_cache_within_ttl(self, get_mock):
+        get_mock.return_value = _response(200, CDN_CONFIG, etag='"abc"')
+        RemoteConfig(cache_path=self.cache_path).resolve()
+        assert RemoteConfig(cache_path=self.cache_path).resolve() == CDN_CONFIG
+        assert get_mock.call_count == 1
+
+    @mock.patch('requests.Session.get')
+    def test_etag_revalidation(self, get_mock):
+        with open(self.cache_path, 'w') as f:
+            json.dump({"etag": '"abc"', "fetched_at": time.time() - 7200, "config": CDN_CONFIG}, f)
+
+        get_mock.return_value = _response(304)
+        assert RemoteConfig(cache_path=self.cache_path, ttl=3600).resolve() == CDN_CONFIG
+        assert get_mock.call_args[1]["headers"] == {"If-None-Match": '"abc"'}
+        with open(self.cache_path, 'r') as f:
+            assert time.time() - json.load(f)["fetched_at"] < 60
+
+    @mock.patch('requests.Session.get', side_effect=requests.ConnectionError)
+    def test_static_fallback(self, _):
+        resolved = RemoteConfig(cache_path=self.cache_path).resolve()
+        assert resolved["CONTRACT_ADDRESSES"] == config.CONTRACT_ADDRESSES
+        assert resolved["NETWORK_TO_NODE"] == config.NETWORK_TO_NODE
+
+    def test_static_addresses_match_published_addresses(self):
+        """The static fallback must not send transactions to stale contracts"""
+        published_path = os.path.join(os.path.dirname(__file__), '..', '..', 'config', 'contract_address.json')
+        with open(published_path, 'r') as f:
+            published = json.load(f)
+        for network_id, addresses in published.items():
+            for name, address in addresses.items():
+                assert config.CONTRACT_ADDRESSES[network_id][name] == address
+
+    def test_legacy_aliases(self):
+        """NODE_TO_NETWORK and API_ROOT are still importable, and resolved when read"""
+        with mock.patch.object(base.REMOTE_CONFIG, 'resolve', return_value=CDN_CONFIG) as resolve_mock:
+            from devise.base import NODE_TO_NETWORK
+            assert resolve_mock.call_count == 0
+            assert NODE_TO_NETWORK["https://mainnet.infura.io"] == "MAINNET"
+            with mock.patch.dict(os.environ, {"ETHEREUM_NETWORK": "mainnet"}):
+                assert base.API_ROOT == "https://api.devisechain.io"
+
+    def test_custom_node_does_not_resolve_config(self):
+        with mock.patch.object(base.REMOTE_CONFIG, 'resolve') as resolve_mock:
+            BaseEthereumClient(private_key=TEST_KEYS[0], node_url='http://localhost:8545')
+        assert resolve_mock.call_count == 0
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+    BlockRangeScanner tests
+    ~~~~~~~~~
+    These are the tests for the adaptive block range log scanner.
+
+    :copyright: © 2018 Pit.AI
+    :license: BSD, see LICENSE for more details.
+"""
+from unittest import mock
+
+import pytest
+
+from devise.scanner import BlockRangeScanner
+
+
+def _fake_w3(max_blocks_per_query, logs_per_block=1):
+    """A web3 mock whose getLogs rejects ranges wider than max_blocks_per_query"""
+    w3 = mock.Mock()
+    w3.eth.blockNumber = 1000
+    queries = []
+
+    def get_logs(params):
+        from_block, to_block = params['fromBlock'], params['toBlock']
+        queries.append((from_block, to_block))
+        if to_block - from_block + 1 > max_blocks_per_query:
+            raise ValueError({'code': -32005, 'message': 'query returned more than 10000 results'})
+        return [{'blockNumber': n} for n in range(from_block, to_block + 1) for _ in range(logs_per_block)]
+
+    w3.eth.getLogs.side_effect = get_logs
+    return w3, queries
+
+
+class TestBlockRangeScanner(object):
+    def test_scan_shrinks_and_grows(self):
+        w3, queries = _fake_w3(max_blocks_per_query=64)
+        scanner = BlockRangeScanner(w3, initial_window=256, sparse_threshold=100)
+        windows = list(scanner.scan({'address': '0x0'}, 0, 'latest'))
+
+        # Every block is covered exactly once, in order
+        blocks = [log['blockNumber'] for _, _, logs in windows for log in logs]
+        assert blocks == list(range(0, 1001))
+        # The window shrank under the node's limit, and didn't grow back to a size the node rejected
+        assert max(end - start + 1 for start, end, _ in windows) == 64
+        failed_sizes = [end - start + 1 for start, end in queries if end - start + 1 > 64]
+        assert failed_sizes == [256, 128]
+        assert len(queries) == len(windows) + 2
+
+    def test_scan_grows_below_failed_window(self):
+        w3, queries = _fake_w3(max_blocks_per_query=100)
+        scanner = BlockRangeScanner(w3, initial_window=160, sparse_threshold=100)
+        windows = list(scanner.scan({'address': '0x0'}, 0, 'latest'))
+
+        # 160 is rejected, 80 isn't, and 160 is never tried again
+        assert [log['blockNumber'] for _, _, logs in windows for log in logs] == list(range(0, 1001))
+        assert [end - start + 1 for start, end in queries if end - start + 1 > 100] == [160]
+
+    def test_scan_parallel(self):
+        w3, _ = _fake_w3(max_blocks_per_query=50)
+        scanner = BlockRangeScanner(w3, initial_window=200, max_workers=4)
+        blocks = [log['blockNumber'] for _, _, logs in scanner.scan({'address': '0x0'}, 10, 900) for log in logs]
+        assert blocks == list(range(10, 901))
+
+    def test_scan_other_errors_raise(self):
+        w3 = mock.Mock()
+        w3.eth.getLogs.side_effect = ValueError({'code': -32602, 'message': 'invalid argument'})
+        with pytest.raises(ValueError):
+            list(BlockRangeScanner(w3).scan({'address': '0x0'}, 0, 100))